@@ -53,6 +53,32 @@ def _ensure_schema():
         ).all()
         return bool(rows)
 
+    def has_index_mysql(table: str, index: str) -> bool:
+        rows = _exec(
+            """
+            SELECT 1
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME = :table
+              AND INDEX_NAME = :index
+            LIMIT 1
+            """,
+            {"table": table, "index": index},
+        ).all()
+        return bool(rows)
+
+    def ensure_index(table: str, index: str, columns: str):
+        """create_all 不会给已存在的表补索引，这里手动补齐"""
+        if dialect == "sqlite":
+            _exec(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})")
+            return
+
+        if dialect in {"mysql", "mariadb"}:
+            if has_index_mysql(table, index):
+                return
+            _exec(f"CREATE INDEX {index} ON {table} ({columns})")
+            return
+
     def ensure_comments_parent_comment_id():
         table = "comments"
         column = "parent_comment_id"
@@ -164,6 +190,23 @@ def _ensure_schema():
 
         ensure_column("must_change_password", "INTEGER", "TINYINT(1)")
 
+    def ensure_users_token_version():
+        table = "users"
+
+        if dialect == "sqlite":
+            if not has_column_sqlite(table, "token_version"):
+                _exec(f"ALTER TABLE {table} ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0")
+            if not has_column_sqlite(table, "token_revoked_at"):
+                _exec(f"ALTER TABLE {table} ADD COLUMN token_revoked_at DATETIME")
+        elif dialect in {"mysql", "mariadb"}:
+            if not has_column_mysql(table, "token_version"):
+                _exec(f"ALTER TABLE {table} ADD COLUMN token_version INT NOT NULL DEFAULT 0")
+            if not has_column_mysql(table, "token_revoked_at"):
+                _exec(f"ALTER TABLE {table} ADD COLUMN token_revoked_at DATETIME NULL")
+        else:
+            return
+        ensure_index(table, "ix_users_token_revoked_at", "token_revoked_at")
+
     def ensure_teacher_posts_detailed_info_and_status():
         """添加 teacher_posts 表的 detailed_info 和 project_status 字段"""
         table = "teacher_posts"
@@ -257,6 +300,138 @@ def _ensure_schema():
         ensure_column("applied_roles_json", "TEXT", "TEXT")
         ensure_column("suggested_roles_json", "TEXT", "TEXT")
 
+    def ensure_teacher_posts_confirmed_count():
+        """添加 teacher_posts 表的 confirmed_count 冗余计数字段，新增时按合作请求回填"""
+        table = "teacher_posts"
+        column = "confirmed_count"
+
+        if dialect == "sqlite":
+            if has_column_sqlite(table, column):
+                return
+            _exec(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        elif dialect in {"mysql", "mariadb"}:
+            if has_column_mysql(table, column):
+                return
+            _exec(f"ALTER TABLE {table} ADD COLUMN {column} INT NOT NULL DEFAULT 0")
+        else:
+            return
+
+        _exec(
+            f"""
+            UPDATE {table} SET {column} = (
+                SELECT COUNT(*) FROM cooperation_requests
+                WHERE cooperation_requests.post_id = {table}.id
+                  AND cooperation_requests.final_status = 'confirmed'
+            )
+            """
+        )
+
+    def ensure_student_profiles_skill_score():
+        """添加 student_profiles 表的能力评分字段与排序索引，新增时按画像内容回填"""
+        from .services import rebuild_skill_scores
+
+        table = "student_profiles"
+        columns = [
+            ("skill_score", "INTEGER NOT NULL DEFAULT 20", "INT NOT NULL DEFAULT 20"),
+            ("skill_score_level", "VARCHAR(1) NOT NULL DEFAULT 'D'", "VARCHAR(1) NOT NULL DEFAULT 'D'"),
+        ]
+        added = False
+        for col, sqlite_type, mysql_type in columns:
+            if dialect == "sqlite":
+                if has_column_sqlite(table, col):
+                    continue
+                _exec(f"ALTER TABLE {table} ADD COLUMN {col} {sqlite_type}")
+            elif dialect in {"mysql", "mariadb"}:
+                if has_column_mysql(table, col):
+                    continue
+                _exec(f"ALTER TABLE {table} ADD COLUMN {col} {mysql_type}")
+            else:
+                return
+            added = True
+
+        ensure_index(table, "ix_student_profiles_skill_score", "skill_score, user_id")
+        if added:
+            rebuild_skill_scores()
+
+    def ensure_notifications_coalescing():
+        """添加 notifications / notifications_archive 表的合并键与合并计数字段，以及按合并键查找的索引"""
+        columns = [
+            ("group_key", "VARCHAR(128)", "VARCHAR(128) NULL"),
+            ("event_count", "INTEGER NOT NULL DEFAULT 1", "INT NOT NULL DEFAULT 1"),
+        ]
+        for table in ("notifications", "notifications_archive"):
+            for col, sqlite_type, mysql_type in columns:
+                if dialect == "sqlite":
+                    if has_column_sqlite(table, col):
+                        continue
+                    _exec(f"ALTER TABLE {table} ADD COLUMN {col} {sqlite_type}")
+                elif dialect in {"mysql", "mariadb"}:
+                    if has_column_mysql(table, col):
+                        continue
+                    _exec(f"ALTER TABLE {table} ADD COLUMN {col} {mysql_type}")
+                else:
+                    return
+        ensure_index("notifications", "ix_notifications_user_group", "user_id, group_key")
+
+    def ensure_conversation_summary():
+        """添加 conversations 表的会话摘要字段与收件箱索引，新增时按 messages 回填"""
+        from .services import rebuild_conversation_summaries
+
+        table = "conversations"
+        columns = [
+            ("last_message_id", "INTEGER", "INT NULL"),
+            ("last_message_at", "DATETIME", "DATETIME NULL"),
+            ("teacher_unread", "INTEGER NOT NULL DEFAULT 0", "INT NOT NULL DEFAULT 0"),
+            ("student_unread", "INTEGER NOT NULL DEFAULT 0", "INT NOT NULL DEFAULT 0"),
+        ]
+        added = False
+        for col, sqlite_type, mysql_type in columns:
+            if dialect == "sqlite":
+                if has_column_sqlite(table, col):
+                    continue
+                _exec(f"ALTER TABLE {table} ADD COLUMN {col} {sqlite_type}")
+            elif dialect in {"mysql", "mariadb"}:
+                if has_column_mysql(table, col):
+                    continue
+                _exec(f"ALTER TABLE {table} ADD COLUMN {col} {mysql_type}")
+            else:
+                return
+            added = True
+
+        ensure_index(table, "ix_conversations_teacher_last", "teacher_user_id, last_message_at, id")
+        ensure_index(table, "ix_conversations_student_last", "student_user_id, last_message_at, id")
+        if added:
+            rebuild_conversation_summaries()
+
+    def ensure_entity_tags_backfilled():
+        """entity_tags 为新表时，按现有内容回填标签索引"""
+        from .services import rebuild_entity_tags
+
+        if _exec("SELECT 1 FROM entity_tags LIMIT 1").first():
+            return
+        for table in ("teacher_posts", "resources", "forum_topics", "teamup_posts", "student_profiles", "teacher_profiles"):
+            if _exec(f"SELECT 1 FROM {table} LIMIT 1").first():
+                rebuild_entity_tags()
+                return
+
+    def ensure_search_index():
+        """search_documents 为旧库新建的表时补建全文索引，并按现有内容回填检索文档"""
+        from .search import create_fulltext_index, rebuild_fulltext_index, rebuild_search_documents
+
+        fts_exists = dialect == "sqlite" and _exec(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_documents_fts'"
+        ).first()
+        if not fts_exists:
+            with engine.begin() as conn:
+                if create_fulltext_index(conn):
+                    rebuild_fulltext_index(conn)
+        if _exec("SELECT 1 FROM search_documents LIMIT 1").first():
+            return
+        for table in ("teacher_posts", "resources", "forum_topics", "teamup_posts", "users"):
+            if _exec(f"SELECT 1 FROM {table} LIMIT 1").first():
+                rebuild_search_documents()
+                return
+
     try:
         ensure_comments_parent_comment_id()
     except Exception:
@@ -287,6 +462,11 @@ def _ensure_schema():
     except Exception:
         pass
 
+    try:
+        ensure_users_token_version()
+    except Exception:
+        pass
+
     try:
         ensure_teacher_posts_detailed_info_and_status()
     except Exception:
@@ -306,3 +486,48 @@ def _ensure_schema():
         ensure_cooperation_requests_role_tags()
     except Exception:
         pass
+
+    try:
+        ensure_teacher_posts_confirmed_count()
+    except Exception:
+        pass
+
+    try:
+        ensure_index("teacher_posts", "ix_teacher_posts_review_created", "review_status, created_at")
+    except Exception:
+        pass
+
+    try:
+        ensure_index("messages", "ix_messages_conversation_id_id", "conversation_id, id")
+    except Exception:
+        pass
+
+    try:
+        ensure_index("notifications", "ix_notifications_user_id_id", "user_id, id")
+    except Exception:
+        pass
+
+    try:
+        ensure_notifications_coalescing()
+    except Exception:
+        pass
+
+    try:
+        ensure_conversation_summary()
+    except Exception:
+        db.session.rollback()
+
+    try:
+        ensure_student_profiles_skill_score()
+    except Exception:
+        db.session.rollback()
+
+    try:
+        ensure_entity_tags_backfilled()
+    except Exception:
+        db.session.rollback()
+
+    try:
+        ensure_search_index()
+    except Exception:
+        db.session.rollback()
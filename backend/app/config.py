@@ -23,6 +23,38 @@ def load_config(app):
 
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "dev-jwt-secret")
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRES", "7200"))
+    # EventSource 无法设置请求头，SSE 接口允许通过 ?token= 传递令牌，但只接受通知流专用的短期令牌
+    app.config["JWT_QUERY_STRING_NAME"] = "token"
+    # 通知流专用令牌的有效期（秒），只在建立连接时校验，连接断开后前端重新换取
+    app.config["STREAM_TOKEN_EXPIRES"] = int(os.getenv("STREAM_TOKEN_EXPIRES", "60"))
+    # 用户身份快照（角色、启用状态、姓名）在进程内的缓存时间（秒），用户被修改时本进程立即失效
+    app.config["IDENTITY_CACHE_TTL"] = float(os.getenv("IDENTITY_CACHE_TTL", "30"))
+    # 令牌作废记录的增量同步间隔（秒），即其他进程作废令牌后本进程最迟多久生效；
+    # 管理员接口不受此窗口影响，每次请求都会先同步
+    app.config["REVOCATION_REFRESH_INTERVAL"] = float(os.getenv("REVOCATION_REFRESH_INTERVAL", "10"))
+
+    # 密码哈希算法与参数（werkzeug method 字符串，如 pbkdf2:sha256:600000、scrypt:32768:8:1），修改后用户登录时自动重新哈希
+    app.config["PASSWORD_HASH_METHOD"] = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    # 批量创建用户时并行哈希的进程数（0 表示 CPU 核数）及启用并行的最少密码数
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.getenv("PASSWORD_HASH_WORKERS", "0"))
+    app.config["PASSWORD_HASH_PARALLEL_MIN"] = int(os.getenv("PASSWORD_HASH_PARALLEL_MIN", "16"))
+
+    # 后台线程刷新推荐缓存的轮询间隔（秒）
+    app.config["RECOMMENDATION_REFRESH_INTERVAL"] = float(os.getenv("RECOMMENDATION_REFRESH_INTERVAL", "5"))
+    # 后台线程处理通知发件箱的轮询间隔（秒）
+    app.config["OUTBOX_POLL_INTERVAL"] = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+    # 已读通知在 notifications 中的保留天数，超过后归档到 notifications_archive；0 表示不归档
+    app.config["NOTIFICATION_RETENTION_DAYS"] = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+    # 每批归档的通知条数（每批单独提交）与后台线程的归档间隔（秒）
+    app.config["NOTIFICATION_ARCHIVE_BATCH_SIZE"] = int(os.getenv("NOTIFICATION_ARCHIVE_BATCH_SIZE", "1000"))
+    app.config["NOTIFICATION_ARCHIVE_INTERVAL"] = float(os.getenv("NOTIFICATION_ARCHIVE_INTERVAL", "3600"))
+
+    # SSE 连接的最长保持时间（秒），到期后由客户端自动重连，避免长期占用工作线程
+    app.config["NOTIFICATION_STREAM_MAX_SECONDS"] = int(os.getenv("NOTIFICATION_STREAM_MAX_SECONDS", "300"))
+    # 没有收到本进程的发布时，回查数据库的间隔（秒），用于发现其他进程写入的数据，同时作为心跳间隔
+    app.config["REALTIME_POLL_INTERVAL"] = float(os.getenv("REALTIME_POLL_INTERVAL", "15"))
+    # 私信长轮询单次请求的最长等待时间（秒），客户端可通过 timeout 参数缩短
+    app.config["MESSAGE_LONG_POLL_SECONDS"] = float(os.getenv("MESSAGE_LONG_POLL_SECONDS", "25"))
 
     app.config["CORS_ORIGINS"] = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
 
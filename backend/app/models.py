@@ -29,6 +29,12 @@ class CooperationStatus(str, enum.Enum):
     confirmed = "confirmed"
 
 
+class OutboxStatus(str, enum.Enum):
+    pending = "pending"
+    done = "done"
+    failed = "failed"
+
+
 class User(db.Model):
     __tablename__ = "users"
 
@@ -44,6 +50,9 @@ class User(db.Model):
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     must_change_password = db.Column(db.Boolean, default=False, nullable=False)
+    # 令牌版本：登录时写入 JWT，递增即作废此前签发的所有令牌
+    token_version = db.Column(db.Integer, default=0, nullable=False)
+    token_revoked_at = db.Column(db.DateTime, nullable=True, index=True)
 
 
 class StudentProfile(db.Model):
@@ -64,8 +73,13 @@ class StudentProfile(db.Model):
     resume_file_id = db.Column(db.Integer, db.ForeignKey("files.id"), nullable=True)
     visibility = db.Column(db.String(16), default=Visibility.public.value, nullable=False)
     auto_reply = db.Column(db.String(255), nullable=True)
+    # 能力评分（0-100）与等级 A/B/C/D，保存画像时由 services.student_skill_score 计算
+    skill_score = db.Column(db.Integer, nullable=False, default=20)
+    skill_score_level = db.Column(db.String(1), nullable=False, default="D")
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (db.Index("ix_student_profiles_skill_score", "skill_score", "user_id"),)
+
 
 class TeacherProfile(db.Model):
     __tablename__ = "teacher_profiles"
@@ -112,9 +126,14 @@ class TeacherPost(db.Model):
     visibility = db.Column(db.String(16), default=Visibility.public.value, nullable=False)
     review_status = db.Column(db.String(16), default=ReviewStatus.pending.value, nullable=False, index=True)
     project_status = db.Column(db.String(32), default="recruiting", nullable=False, index=True)  # 新增：项目状态
+    confirmed_count = db.Column(db.Integer, default=0, nullable=False)  # 已确认学生数（冗余计数，随合作请求状态维护）
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        db.Index("ix_teacher_posts_review_created", "review_status", "created_at"),
+    )
+
 
 class Comment(db.Model):
     __tablename__ = "comments"
@@ -254,9 +273,16 @@ class Conversation(db.Model):
     teacher_user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     student_user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # 会话摘要：随 send_message / 读消息维护，收件箱列表无需逐个会话查询消息表
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_message_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)
+    teacher_unread = db.Column(db.Integer, nullable=False, default=0)
+    student_unread = db.Column(db.Integer, nullable=False, default=0)
 
     __table_args__ = (
         db.UniqueConstraint("teacher_user_id", "student_user_id", name="uq_conversation_pair"),
+        db.Index("ix_conversations_teacher_last", "teacher_user_id", "last_message_at", "id"),
+        db.Index("ix_conversations_student_last", "student_user_id", "last_message_at", "id"),
     )
 
 
@@ -271,6 +297,8 @@ class Message(db.Model):
     is_read = db.Column(db.Boolean, default=False, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (db.Index("ix_messages_conversation_id_id", "conversation_id", "id"),)
+
 
 class Notification(db.Model):
     __tablename__ = "notifications"
@@ -280,5 +308,110 @@ class Notification(db.Model):
     notif_type = db.Column(db.String(32), nullable=False, index=True)
     title = db.Column(db.String(128), nullable=False)
     payload_json = db.Column(db.Text, nullable=False, default="{}")
+    group_key = db.Column(db.String(128), nullable=True)  # 可合并通知的合并键，见 services.COALESCE_KEYS
+    event_count = db.Column(db.Integer, nullable=False, default=1)  # 合并进这条通知的事件数
     is_read = db.Column(db.Boolean, default=False, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_notifications_user_id_id", "user_id", "id"),
+        db.Index("ix_notifications_user_group", "user_id", "group_key"),
+    )
+
+
+class NotificationArchive(db.Model):
+    """已归档的通知：超过保留期的已读通知由 retention.archive_notifications 从 notifications 原样搬入"""
+
+    __tablename__ = "notifications_archive"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 沿用原通知 id
+    user_id = db.Column(db.Integer, nullable=False)
+    notif_type = db.Column(db.String(32), nullable=False)
+    title = db.Column(db.String(128), nullable=False)
+    payload_json = db.Column(db.Text, nullable=False, default="{}")
+    group_key = db.Column(db.String(128), nullable=True)
+    event_count = db.Column(db.Integer, nullable=False, default=1)
+    is_read = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.Index("ix_notifications_archive_user_id_id", "user_id", "id"),)
+
+
+class UserCounter(db.Model):
+    """用户未读计数：随通知/私信的写入与已读在同一事务中增减，首次变更或读取时按源表建立"""
+
+    __tablename__ = "user_counters"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0)
+    unread_messages = db.Column(db.Integer, nullable=False, default=0)
+
+
+class EntityTag(db.Model):
+    """标签倒排索引：各类内容 JSON 标签字段的规范化展开，用于按标签筛选/聚合"""
+
+    __tablename__ = "entity_tags"
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(32), nullable=False)  # teacher_post / resource / forum_topic / teamup_post / student_profile / teacher_profile
+    entity_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # tag / tech / role / interest / skill / research
+    tag = db.Column(db.String(128), nullable=False)  # 原始写法（用于展示）
+    tag_normalized = db.Column(db.String(128), nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_entity_tags_lookup", "entity_type", "kind", "tag_normalized", "entity_id"),
+        db.Index("ix_entity_tags_entity", "entity_type", "entity_id"),
+    )
+
+
+class SearchDocument(db.Model):
+    """全文检索文档：各类内容的标题/正文快照，由 search.py 维护（SQLite 用 FTS5，MySQL 用 FULLTEXT ngram）"""
+
+    __tablename__ = "search_documents"
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(32), nullable=False)  # teacher_post / resource / forum_topic / teamup_post / student
+    entity_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(255), nullable=False, default="")
+    body = db.Column(db.Text, nullable=False, default="")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint("entity_type", "entity_id", name="uq_search_document_entity"),
+    )
+
+
+class RecommendationCache(db.Model):
+    """匹配推荐缓存：每个用户一行，档案/项目写入时 dirty +1，由后台线程重新计算"""
+
+    __tablename__ = "recommendation_cache"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False, default="none")  # teacher_posts / students / none
+    items_json = db.Column(db.Text, nullable=False, default="[]")
+    version = db.Column(db.Integer, nullable=False, default=0)  # 推荐结果（id 顺序）每变化一次 +1
+    notified_version = db.Column(db.Integer, nullable=False, default=0)  # 已推送 match_refresh 通知的版本
+    dirty = db.Column(db.Integer, nullable=False, default=0, index=True)  # 上次计算后的待处理写入次数
+    computed_at = db.Column(db.DateTime, nullable=True)
+
+
+class NotificationOutbox(db.Model):
+    """通知发件箱：请求内只登记事件（与业务数据同一事务），由 outbox.process_outbox 展开为 Notification"""
+
+    __tablename__ = "notification_outbox"
+
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(128), nullable=False, unique=True)
+    event_type = db.Column(db.String(32), nullable=False)
+    payload_json = db.Column(db.Text, nullable=False, default="{}")
+    status = db.Column(db.String(16), nullable=False, default=OutboxStatus.pending.value)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_by = db.Column(db.String(32), nullable=True, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index("ix_notification_outbox_due", "status", "next_attempt_at"),)
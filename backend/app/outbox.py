@@ -0,0 +1,191 @@
+"""
+通知发件箱
+
+请求处理函数只在自己的事务里登记一条紧凑的事件（enqueue / enqueue_notification），
+由后台线程（workers.py）或 scripts/process_outbox.py 调用 process_outbox 批量展开为 Notification。
+- 幂等：idempotency_key 唯一，同一事件重复登记只保留一条；事件状态与展开出的通知在同一事务中提交
+- 重试：展开失败按指数退避重试，超过 MAX_ATTEMPTS 次标记为 failed
+- 多进程：先用 claimed_by + 租约认领一批事件再处理，租约过期的事件会被重新认领
+未启动后台线程时（测试、脚本），在请求结束时同步处理发件箱。
+"""
+
+import uuid
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from flask import after_this_request, current_app, g, has_request_context
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import CooperationRequest, NotificationOutbox, OutboxStatus, Reaction, Role, TeacherPost, User
+from .services import push_notifications_bulk
+from .utils import json_dumps, json_loads, now_utc
+
+
+MAX_ATTEMPTS = 5
+LEASE_SECONDS = 60
+
+
+def enqueue(event_type: str, payload: Dict, idempotency_key: str) -> Optional[NotificationOutbox]:
+    """在当前事务中登记事件，随调用方的提交一起生效；已登记过的 idempotency_key 直接忽略"""
+    ev = NotificationOutbox(
+        idempotency_key=idempotency_key[:128],
+        event_type=event_type,
+        payload_json=json_dumps(payload),
+        status=OutboxStatus.pending.value,
+        attempts=0,
+        next_attempt_at=now_utc(),
+        created_at=now_utc(),
+    )
+    try:
+        # 不先查后写：在保存点中插入，idempotency_key 冲突（含并发的重复提交）时只回滚这一条，不影响调用方的事务
+        with db.session.begin_nested():
+            db.session.add(ev)
+    except IntegrityError:
+        return None
+    _drain_after_request()
+    return ev
+
+
+def enqueue_notification(user_ids, notif_type: str, title: str, payload: Dict, idempotency_key: str):
+    """登记发给一个或多个用户的同一条通知"""
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    user_ids = sorted({int(u) for u in user_ids if u})
+    if not user_ids:
+        return None
+    return enqueue(
+        "notify",
+        {"user_ids": user_ids, "notif_type": notif_type, "title": title, "payload": payload},
+        idempotency_key,
+    )
+
+
+def _expand_notify(data: Dict) -> List[Tuple[int, str, str, Dict]]:
+    return [(uid, data["notif_type"], data["title"], data.get("payload") or {}) for uid in data.get("user_ids") or []]
+
+
+def _expand_project_status(data: Dict) -> List[Tuple[int, str, str, Dict]]:
+    """项目状态变更：通知申请过（含待处理和已确认）或收藏过该项目的学生"""
+    status_text = {
+        "recruiting": "招募中",
+        "in_progress": "进行中",
+        "completed": "已完成",
+        "closed": "已关闭"
+    }
+    post = db.session.get(TeacherPost, int(data["post_id"]))
+    if not post:
+        return []
+    old_status = data.get("old_status")
+    new_status = data.get("new_status")
+
+    applicants = select(CooperationRequest.student_user_id).where(
+        CooperationRequest.post_id == post.id, CooperationRequest.student_user_id.isnot(None)
+    )
+    favorites = (
+        select(Reaction.user_id)
+        .join(User, User.id == Reaction.user_id)
+        .where(
+            Reaction.target_type == "teacher_post",
+            Reaction.target_id == post.id,
+            Reaction.reaction_type == "favorite",
+            User.role == Role.student.value,
+        )
+    )
+    student_ids = set(db.session.execute(applicants).scalars()) | set(db.session.execute(favorites).scalars())
+
+    title = f"项目状态更新：{post.title}"
+    summary = f"项目状态从「{status_text.get(old_status, old_status or '未设置')}」变更为「{status_text.get(new_status, new_status)}」"
+    return [
+        (student_id, "project_update", title, {"summary": summary, "post_id": post.id})
+        for student_id in sorted(student_ids)
+    ]
+
+
+EXPANDERS = {
+    "notify": _expand_notify,
+    "project_status": _expand_project_status,
+}
+
+
+def process_outbox(batch_size: int = 100) -> int:
+    """认领并展开一批到期事件，通知与事件状态一次提交；返回处理的事件数"""
+    now = now_utc()
+    due_ids = list(
+        db.session.execute(
+            select(NotificationOutbox.id)
+            .where(NotificationOutbox.status == OutboxStatus.pending.value, NotificationOutbox.next_attempt_at <= now)
+            .order_by(NotificationOutbox.id.asc())
+            .limit(batch_size)
+        ).scalars()
+    )
+    if not due_ids:
+        return 0
+
+    token = uuid.uuid4().hex
+    NotificationOutbox.query.filter(
+        NotificationOutbox.id.in_(due_ids),
+        NotificationOutbox.status == OutboxStatus.pending.value,
+        NotificationOutbox.next_attempt_at <= now,
+    ).update(
+        {"claimed_by": token, "next_attempt_at": now + timedelta(seconds=LEASE_SECONDS)},
+        synchronize_session=False,
+    )
+    db.session.commit()
+
+    events = NotificationOutbox.query.filter_by(claimed_by=token).order_by(NotificationOutbox.id.asc()).all()
+    entries: List[Tuple[int, str, str, Dict]] = []
+    for ev in events:
+        try:
+            entries.extend(EXPANDERS[ev.event_type](json_loads(ev.payload_json, {})))
+        except Exception as e:
+            _mark_failed_attempt(ev, e)
+            continue
+        ev.status = OutboxStatus.done.value
+        ev.processed_at = now_utc()
+
+    try:
+        push_notifications_bulk(entries)
+    except Exception as e:
+        db.session.rollback()
+        for ev in NotificationOutbox.query.filter_by(claimed_by=token).all():
+            _mark_failed_attempt(ev, e)
+        db.session.commit()
+        current_app.logger.exception("展开通知事件失败")
+    return len(events)
+
+
+def _mark_failed_attempt(ev: NotificationOutbox, error: Exception):
+    ev.attempts = (ev.attempts or 0) + 1
+    ev.last_error = str(error)[:1000]
+    if ev.attempts >= MAX_ATTEMPTS:
+        ev.status = OutboxStatus.failed.value
+    else:
+        ev.next_attempt_at = now_utc() + timedelta(seconds=5 * 2 ** ev.attempts)
+
+
+def drain_outbox(batch_size: int = 100) -> int:
+    total = 0
+    while True:
+        n = process_outbox(batch_size)
+        if not n:
+            return total
+        total += n
+
+
+def _drain_after_request():
+    if current_app.config.get("BACKGROUND_WORKERS_RUNNING") or not has_request_context():
+        return
+    if g.get("outbox_drain_registered"):
+        return
+    g.outbox_drain_registered = True
+
+    @after_this_request
+    def _drain(response):
+        try:
+            drain_outbox()
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception("处理通知发件箱失败")
+        return response
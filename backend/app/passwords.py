@@ -0,0 +1,107 @@
+"""
+密码哈希
+
+算法与参数由 PASSWORD_HASH_METHOD 配置，取值为 werkzeug 的 method 字符串，例如：
+- pbkdf2:sha256:600000（迭代次数）
+- scrypt:32768:8:1（n:r:p）
+修改配置后旧哈希仍可验证，用户下次登录成功时按新参数重新哈希（needs_rehash）。
+批量创建用户时用 hash_passwords 在进程池中并行计算，避免长时间占用单个工作进程。
+进程池在首次使用时创建并在进程内复用，以 spawn 方式启动子进程（服务进程中有后台线程，不能 fork），
+退出时关闭。
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+
+def _configured_method() -> str:
+    if has_app_context():
+        return current_app.config.get("PASSWORD_HASH_METHOD") or DEFAULT_METHOD
+    return DEFAULT_METHOD
+
+
+def hash_password(password: str, method: Optional[str] = None) -> str:
+    return generate_password_hash(password, method=method or _configured_method())
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    return check_password_hash(password_hash, password)
+
+
+@lru_cache(maxsize=8)
+def _hash_prefix(method: str) -> str:
+    """method 补全默认参数后写入哈希的前缀，例如 pbkdf2:sha256 -> pbkdf2:sha256:600000"""
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """哈希的算法或参数与当前配置不一致"""
+    return (password_hash or "").split("$", 1)[0] != _hash_prefix(_configured_method())
+
+
+_pool_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    """关闭进程池（进程池损坏时也用于丢弃它，下次使用时重建）"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        pool, _pool, _pool_workers = _pool, None, 0
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _hash_one(args: Tuple[str, str]) -> str:
+    password, method = args
+    return generate_password_hash(password, method=method)
+
+
+def hash_passwords(passwords: List[str], method: Optional[str] = None) -> List[str]:
+    """
+    按顺序返回每个密码的哈希（各自独立加盐）。
+    数量达到 PASSWORD_HASH_PARALLEL_MIN 时在 PASSWORD_HASH_WORKERS 个进程中并行计算，进程池不可用时退回串行。
+    """
+    method = method or _configured_method()
+    if not passwords:
+        return []
+    workers = min_parallel = 0
+    if has_app_context():
+        workers = int(current_app.config.get("PASSWORD_HASH_WORKERS") or 0)
+        min_parallel = int(current_app.config.get("PASSWORD_HASH_PARALLEL_MIN") or 0)
+    workers = workers or os.cpu_count() or 1
+    args = [(p, method) for p in passwords]
+    if workers > 1 and len(passwords) >= max(min_parallel, 2):
+        try:
+            pool = _get_pool(workers)
+            return list(pool.map(_hash_one, args, chunksize=max(1, len(args) // (workers * 4))))
+        except (OSError, RuntimeError):
+            # BrokenProcessPool 是 RuntimeError 的子类，丢弃损坏的进程池
+            shutdown_pool()
+            if has_app_context():
+                current_app.logger.warning("密码哈希进程池不可用，改为串行计算", exc_info=True)
+    return [_hash_one(a) for a in args]
@@ -1,26 +1,247 @@
+"""
+身份与权限
+
+- issue_access_token(user)：签发带 role 与令牌版本 tv 声明的访问令牌
+- issue_stream_token(user)：签发只能用于通知流（SSE）的短期令牌，带 scope 声明的令牌只能访问 TOKEN_SCOPES 中对应的接口
+- 带声明的令牌无状态鉴权：守卫直接信任 JWT 中的角色，只检查令牌版本是否已被作废。
+  作废记录（user_id -> 最低有效版本）保存在进程内，按 REVOCATION_REFRESH_INTERVAL 秒增量同步一次，
+  而不是每个请求查询 users 表；禁用用户、修改角色或密码时递增 token_version 即作废旧令牌。
+  因此其他进程作废的令牌在本进程最多还有 REVOCATION_REFRESH_INTERVAL 秒可用；
+  管理员守卫（require_roles 含 admin）不接受这个窗口，每次都先同步作废记录再放行。
+- 不带声明的旧令牌：读取用户身份快照 get_identity(user_id)，进程内缓存 IDENTITY_CACHE_TTL 秒
+- current_user()：本次请求的 User 对象，每个请求最多查询一次（缓存在 flask.g）
+User 经 ORM 更新或删除后本进程的快照与作废记录立即更新；其他进程在各自的同步周期内生效。
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
 from functools import wraps
-from typing import Callable, Iterable
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import create_access_token, get_current_user, get_jwt, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import event, inspect
+
+from .extensions import db, jwt
+from .models import Role, User
+from .utils import now_utc
+
+
+class Identity(NamedTuple):
+    id: int
+    role: str
+    is_active: bool
+    display_name: Optional[str]
+    token_version: int
+
+
+_cache_lock = threading.Lock()
+_identity_cache: Dict[int, Tuple[float, Identity]] = {}
+
+# user_id -> 最低有效令牌版本，只记录令牌有效期内发生过作废的用户
+_revoked_before: Dict[int, int] = {}
+_revocations_synced_at = None
+_revocations_checked = 0.0
+
+
+def get_identity(user_id: int) -> Optional[Identity]:
+    user_id = int(user_id)
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _identity_cache.get(user_id)
+    if hit and hit[0] > now:
+        return hit[1]
+    row = (
+        db.session.query(User.id, User.role, User.is_active, User.display_name, User.token_version)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if not row:
+        invalidate_identity(user_id)
+        return None
+    identity = Identity(row.id, row.role, bool(row.is_active), row.display_name, int(row.token_version or 0))
+    with _cache_lock:
+        _identity_cache[user_id] = (now + current_app.config["IDENTITY_CACHE_TTL"], identity)
+    return identity
+
+
+def invalidate_identity(user_id: Optional[int] = None):
+    """清除某个用户（不传则全部）的身份快照"""
+    with _cache_lock:
+        if user_id is None:
+            _identity_cache.clear()
+        else:
+            _identity_cache.pop(int(user_id), None)
+
+
+def issue_access_token(user: User) -> str:
+    return create_access_token(
+        identity=str(user.id),
+        additional_claims={"role": user.role, "tv": int(user.token_version or 0)},
+    )
+
+
+# 限定用途的令牌：scope 声明 -> 允许访问的接口（endpoint）
+TOKEN_SCOPES = {"stream": {"notifications.stream_notifications"}}
+
+
+def issue_stream_token(user: User) -> str:
+    """EventSource 只能把令牌放在 URL 中，为它签发短期、只能用于通知流的令牌，普通访问令牌不出现在 URL 里"""
+    return create_access_token(
+        identity=str(user.id),
+        additional_claims={"role": user.role, "tv": int(user.token_version or 0), "scope": "stream"},
+        expires_delta=timedelta(seconds=current_app.config["STREAM_TOKEN_EXPIRES"]),
+    )
+
+
+def revoke_tokens(user: User):
+    """作废该用户此前签发的所有令牌，随调用方的提交生效"""
+    user.token_version = int(user.token_version or 0) + 1
+    user.token_revoked_at = now_utc()
+
+
+def _sync_revocations(force: bool = False):
+    """按 token_revoked_at 增量拉取令牌有效期内的作废记录；force 时忽略同步间隔"""
+    global _revocations_synced_at, _revocations_checked
+    now = time.monotonic()
+    if not force and now - _revocations_checked < current_app.config["REVOCATION_REFRESH_INTERVAL"]:
+        return
+    started = now_utc()
+    since = _revocations_synced_at
+    if since is None:
+        expires = current_app.config["JWT_ACCESS_TOKEN_EXPIRES"]
+        if not expires:
+            since = datetime(1970, 1, 1)
+        else:
+            since = started - (expires if isinstance(expires, timedelta) else timedelta(seconds=int(expires)))
+    rows = (
+        db.session.query(User.id, User.token_version)
+        # 留出一秒余量，避免漏掉同步期间提交的记录
+        .filter(User.token_revoked_at >= since - timedelta(seconds=1))
+        .all()
+    )
+    with _cache_lock:
+        for user_id, version in rows:
+            _revoked_before[user_id] = max(_revoked_before.get(user_id, 0), int(version or 0))
+        _revocations_synced_at = started
+        _revocations_checked = now
+
+
+def _reset_revocations():
+    global _revocations_synced_at, _revocations_checked
+    with _cache_lock:
+        _revoked_before.clear()
+        _revocations_synced_at = None
+        _revocations_checked = 0.0
 
-from flask import jsonify
-from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 
-from .models import User
+@event.listens_for(User, "before_update")
+def _revoke_on_status_change(mapper, connection, target):
+    """禁用用户或修改角色时作废旧令牌（其中的角色声明已过期）"""
+    state = inspect(target)
+    if state.attrs.token_version.history.has_changes():
+        return
+    if state.attrs.is_active.history.has_changes() or state.attrs.role.history.has_changes():
+        revoke_tokens(target)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    invalidate_identity(target.id)
+    with _cache_lock:
+        if inspect(target).was_deleted:
+            _revoked_before[target.id] = 1 << 30
+        elif target.token_version:
+            _revoked_before[target.id] = max(_revoked_before.get(target.id, 0), int(target.token_version))
+
+
+@event.listens_for(User.__table__, "after_drop")
+def _invalidate_on_drop(target, connection, **kw):
+    invalidate_identity()
+    _reset_revocations()
+
+
+def _is_revoked(jwt_data, force_sync: bool = False) -> bool:
+    if "tv" not in jwt_data:
+        return False
+    _sync_revocations(force_sync)
+    user_id = int(jwt_data[current_app.config["JWT_IDENTITY_CLAIM"]])
+    with _cache_lock:
+        return int(jwt_data["tv"]) < _revoked_before.get(user_id, 0)
+
+
+@jwt.token_in_blocklist_loader
+def _token_revoked(jwt_header, jwt_data) -> bool:
+    return _is_revoked(jwt_data)
+
+
+@jwt.token_verification_loader
+def _check_token_scope(jwt_header, jwt_data) -> bool:
+    scope = jwt_data.get("scope")
+    return scope is None or request.endpoint in TOKEN_SCOPES.get(scope, ())
+
+
+@jwt.token_verification_failed_loader
+def _token_scope_rejected(jwt_header, jwt_data):
+    return jsonify({"message": "未登录"}), 401
+
+
+@jwt.revoked_token_loader
+def _token_revoked_response(jwt_header, jwt_data):
+    return jsonify({"message": "登录已失效，请重新登录"}), 401
+
+
+@jwt.user_lookup_loader
+def _load_identity(jwt_header, jwt_data):
+    user_id = int(jwt_data[current_app.config["JWT_IDENTITY_CLAIM"]])
+    if "role" in jwt_data and "tv" in jwt_data:
+        # 未被作废的令牌即代表启用中的用户，角色以签发时为准（修改角色会作废令牌）
+        return Identity(user_id, jwt_data["role"], True, None, int(jwt_data["tv"]))
+    return get_identity(user_id)
+
+
+@jwt.user_lookup_error_loader
+def _identity_not_found(jwt_header, jwt_data):
+    return jsonify({"message": "未登录"}), 401
+
+
+def current_identity() -> Optional[Identity]:
+    """已通过 JWT 校验的请求中当前用户的身份（来自令牌声明或身份快照）"""
+    return get_current_user()
+
+
+def current_user() -> Optional[User]:
+    """已通过 JWT 校验的请求中当前用户的 User 对象，同一请求内只查询一次"""
+    identity = get_jwt_identity()
+    user_id = int(identity) if identity else None
+    # 已激活的应用上下文会被多个请求复用，g 可能留有其他请求的用户，按 id 核对
+    if "current_user" not in g or g.get("current_user_id") != user_id:
+        g.current_user = db.session.get(User, user_id) if user_id else None
+        g.current_user_id = user_id
+    return g.current_user
+
+
+# 这些角色的守卫每次请求都强制同步作废记录，被禁用或降权的管理员在所有进程中立即失效
+STRICT_REVOCATION_ROLES = {Role.admin.value}
 
 
 def require_roles(roles: Iterable[str]):
     role_set = set(roles)
+    strict = bool(role_set & STRICT_REVOCATION_ROLES)
 
     def decorator(fn: Callable):
         @wraps(fn)
         def wrapper(*args, **kwargs):
             verify_jwt_in_request()
-            user_id = get_jwt_identity()
-            user = User.query.get(int(user_id))
-            if not user or not user.is_active or user.role not in role_set:
+            identity = current_identity()
+            if not identity or not identity.is_active or identity.role not in role_set:
                 return jsonify({"message": "无权限"}), 403
+            if strict and _is_revoked(get_jwt(), force_sync=True):
+                return _token_revoked_response(None, get_jwt())
             return fn(*args, **kwargs)
 
         return wrapper
 
     return decorator
-
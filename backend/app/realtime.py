@@ -0,0 +1,48 @@
+"""
+进程内发布/订阅
+
+写入提交后调用 hub.publish(channel) 唤醒本进程中正在等待该频道的 SSE / 长轮询连接。
+hub 只负责“唤醒”，数据始终以数据库为准：订阅方按自己的游标（最后一条 id）重新查询，
+因此多进程部署时其他进程写入的数据最迟在 REALTIME_POLL_INTERVAL 秒内被发现。
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Set
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{int(user_id)}"
+
+
+def conversation_channel(conversation_id: int) -> str:
+    return f"conversation:{int(conversation_id)}"
+
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[threading.Event]] = defaultdict(set)
+
+    def subscribe(self, channel: str) -> threading.Event:
+        event = threading.Event()
+        with self._lock:
+            self._subscribers[channel].add(event)
+        return event
+
+    def unsubscribe(self, channel: str, event: threading.Event):
+        with self._lock:
+            subs = self._subscribers.get(channel)
+            if subs is not None:
+                subs.discard(event)
+                if not subs:
+                    del self._subscribers[channel]
+
+    def publish(self, channel: str):
+        with self._lock:
+            subs = list(self._subscribers.get(channel, ()))
+        for event in subs:
+            event.set()
+
+
+hub = Hub()
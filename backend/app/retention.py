@@ -0,0 +1,62 @@
+"""
+通知归档
+
+notifications 只保留未读通知和最近 NOTIFICATION_RETENTION_DAYS 天内的已读通知，
+更早的已读通知由 archive_notifications 按 id 顺序分批搬到 notifications_archive：
+每批 INSERT ... SELECT 与 DELETE 在同一事务中提交，单批最多 NOTIFICATION_ARCHIVE_BATCH_SIZE 条，避免长事务与大范围锁。
+由后台线程（workers.py）定期执行，或通过 scripts/archive_notifications.py 手动执行。
+每个工作进程都会运行归档：MySQL 上用 FOR UPDATE SKIP LOCKED 认领一批，跳过其他进程正在归档的行；
+插入时再排除已在归档表中的 id，多个进程处理到同一批也不会因主键冲突失败。
+"""
+
+from datetime import timedelta
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import exists, insert, literal, select
+
+from .extensions import db
+from .models import Notification, NotificationArchive
+from .utils import now_utc
+
+
+_COLUMNS = ("id", "user_id", "notif_type", "title", "payload_json", "group_key", "event_count", "is_read", "created_at")
+
+
+def archive_notifications(
+    retention_days: Optional[int] = None, batch_size: Optional[int] = None, max_batches: Optional[int] = None
+) -> int:
+    """归档超过保留期的已读通知，返回归档条数"""
+    if retention_days is None:
+        retention_days = current_app.config["NOTIFICATION_RETENTION_DAYS"]
+    if retention_days <= 0:
+        return 0
+    batch_size = max(int(batch_size or current_app.config["NOTIFICATION_ARCHIVE_BATCH_SIZE"]), 1)
+    now = now_utc()
+    cutoff = now - timedelta(days=retention_days)
+
+    total = batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        ids = [
+            nid
+            for (nid,) in db.session.query(Notification.id)
+            .filter(Notification.id > last_id, Notification.is_read == True, Notification.created_at < cutoff)
+            .order_by(Notification.id.asc())
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        ]
+        if not ids:
+            break
+        archived = exists().where(NotificationArchive.id == Notification.id)
+        source = select(*(getattr(Notification, c) for c in _COLUMNS), literal(now)).where(
+            Notification.id.in_(ids), ~archived
+        )
+        db.session.execute(insert(NotificationArchive).from_select([*_COLUMNS, "archived_at"], source))
+        Notification.query.filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        total += len(ids)
+        batches += 1
+        last_id = ids[-1]
+    return total
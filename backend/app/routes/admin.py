@@ -1,8 +1,8 @@
 from datetime import datetime, timedelta
 
-from sqlalchemy import or_
+from sqlalchemy import func, insert, or_, select
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
 from ..extensions import db
@@ -10,6 +10,7 @@ from ..models import (
     CooperationProject,
     CooperationRequest,
     CooperationStatus,
+    EntityTag,
     Message,
     Resource,
     ReviewStatus,
@@ -18,7 +19,9 @@ from ..models import (
     TeacherPost,
     User,
 )
-from ..rbac import require_roles
+from ..rbac import require_roles, revoke_tokens
+from ..search import index_document, insert_documents, remove_document
+from ..services import bump_confirmed_count, clear_entity_tags, entity_terms, mark_match_dirty, sync_entity_tags
 from ..utils import json_loads, now_utc
 
 
@@ -39,6 +42,7 @@ def set_user_password(user_id: int):
         return jsonify({"message": "用户不存在"}), 404
     u.password_hash = hash_password(password)
     u.must_change_password = password == "123456"
+    revoke_tokens(u)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -49,6 +53,7 @@ def release_cooperation(req_id: int):
     req = CooperationRequest.query.get(req_id)
     if not req:
         return jsonify({"message": "不存在"}), 404
+    bump_confirmed_count(req.post_id, req.final_status, CooperationStatus.rejected.value)
     req.teacher_status = CooperationStatus.rejected.value
     req.student_status = CooperationStatus.rejected.value
     req.final_status = CooperationStatus.rejected.value
@@ -66,6 +71,7 @@ def reset_cooperation(req_id: int):
     proj = CooperationProject.query.filter_by(request_id=req.id).first()
     if proj:
         db.session.delete(proj)
+    bump_confirmed_count(req.post_id, req.final_status, None)
     db.session.delete(req)
     db.session.commit()
     return jsonify({"ok": True})
@@ -83,93 +89,78 @@ def stats():
     )
 
 
+def _date_bucket(column, fmt: str):
+    """把时间列格式化为分组用的字符串（fmt 使用 strftime 记法，如 %Y-%m-%d）"""
+    if db.engine.dialect.name in {"mysql", "mariadb"}:
+        return func.date_format(column, fmt)
+    return func.strftime(fmt, column)
+
+
+def _count_by_bucket(model, fmt: str, since: datetime, *conds):
+    bucket = _date_bucket(model.created_at, fmt)
+    rows = (
+        db.session.query(bucket, func.count(model.id))
+        .filter(model.created_at >= since, *conds)
+        .group_by(bucket)
+        .all()
+    )
+    return {k: int(n) for k, n in rows}
+
+
 @bp.get("/analytics")
 @require_roles(["admin"])
 def analytics():
+    """平台统计：各项计数均在数据库中按日/月分组聚合，耗时与历史数据总量无关"""
     now = now_utc()
 
     # 日维度：最近 14 天发布量 / 沟通量
     days_span = 14
     start_day = (now - timedelta(days=days_span - 1)).date()
+    start_day_dt = datetime.combine(start_day, datetime.min.time())
+    days = [(start_day + timedelta(days=i)).isoformat() for i in range(days_span)]
 
-    posts_recent = TeacherPost.query.filter(TeacherPost.created_at >= datetime.combine(start_day, datetime.min.time())).all()
-    messages_recent = Message.query.filter(Message.created_at >= datetime.combine(start_day, datetime.min.time())).all()
-
-    def count_by_date(rows, attr="created_at"):
-        m = {}
-        for r in rows:
-            d = getattr(r, attr).date().isoformat()
-            m[d] = m.get(d, 0) + 1
-        result = []
-        for i in range(days_span):
-            d = (start_day + timedelta(days=i)).isoformat()
-            result.append({"date": d, "count": m.get(d, 0)})
-        return result
-
-    posts_daily = count_by_date(posts_recent)
-    messages_daily = count_by_date(messages_recent)
+    posts_by_day = _count_by_bucket(TeacherPost, "%Y-%m-%d", start_day_dt)
+    messages_by_day = _count_by_bucket(Message, "%Y-%m-%d", start_day_dt)
+    posts_daily = [{"date": d, "count": posts_by_day.get(d, 0)} for d in days]
+    messages_daily = [{"date": d, "count": messages_by_day.get(d, 0)} for d in days]
 
     # 月维度：最近 6 个月发布量 / 沟通量
-    def month_key(dt: datetime) -> str:
-        return dt.strftime("%Y-%m")
-
     months_span = 6
-    # 取最近 6 个月的第一天
-    first_of_this_month = datetime(now.year, now.month, 1)
-    start_month_dt = first_of_this_month - timedelta(days=30 * (months_span - 1))
-
-    posts_recent_month = TeacherPost.query.filter(TeacherPost.created_at >= start_month_dt).all()
-    messages_recent_month = Message.query.filter(Message.created_at >= start_month_dt).all()
-
-    def count_by_month(rows):
-        m = {}
-        for r in rows:
-            k = month_key(r.created_at)
-            m[k] = m.get(k, 0) + 1
-        result = []
-        cur = first_of_this_month
-        for i in range(months_span):
-            k = cur.strftime("%Y-%m")
-            result.append({"month": k, "count": m.get(k, 0)})
-            # 上一月
-            if cur.month == 1:
-                cur = datetime(cur.year - 1, 12, 1)
-            else:
-                cur = datetime(cur.year, cur.month - 1, 1)
-        result.reverse()
-        return result
-
-    posts_monthly = count_by_month(posts_recent_month)
-    messages_monthly = count_by_month(messages_recent_month)
-
-    # 热门方向：统计教师项目的 tags / tech_stack 出现频次
-    tag_counter = {}
-    all_posts = TeacherPost.query.all()
-    for p in all_posts:
-        tags = json_loads(p.tags_json, []) or []
-        techs = json_loads(p.tech_stack_json, []) or []
-        for t in list(tags) + list(techs):
-            if not t:
-                continue
-            name = str(t)
-            tag_counter[name] = tag_counter.get(name, 0) + 1
-    hot_topics = [
-        {"name": name, "count": count}
-        for name, count in sorted(tag_counter.items(), key=lambda x: x[1], reverse=True)[:10]
-    ]
+    months = []
+    cur = datetime(now.year, now.month, 1)
+    for _ in range(months_span):
+        months.append(cur)
+        # 上一月
+        cur = datetime(cur.year - 1, 12, 1) if cur.month == 1 else datetime(cur.year, cur.month - 1, 1)
+    months.reverse()
+    start_month_dt = months[0]
+    month_keys = [m.strftime("%Y-%m") for m in months]
+
+    posts_by_month = _count_by_bucket(TeacherPost, "%Y-%m", start_month_dt)
+    messages_by_month = _count_by_bucket(Message, "%Y-%m", start_month_dt)
+    posts_monthly = [{"month": k, "count": posts_by_month.get(k, 0)} for k in month_keys]
+    messages_monthly = [{"month": k, "count": messages_by_month.get(k, 0)} for k in month_keys]
+
+    # 热门方向：按标签索引统计教师项目 tags / tech_stack 出现频次
+    hot_rows = (
+        db.session.query(func.min(EntityTag.tag), func.count(EntityTag.id).label("cnt"))
+        .filter(EntityTag.entity_type == "teacher_post", EntityTag.kind.in_(["tag", "tech"]))
+        .group_by(EntityTag.tag_normalized)
+        .order_by(func.count(EntityTag.id).desc(), EntityTag.tag_normalized.asc())
+        .limit(10)
+        .all()
+    )
+    hot_topics = [{"name": name, "count": int(count)} for name, count in hot_rows]
 
     # 竞赛参与趋势：近 6 个月内，post_type=competition 且 final_status=confirmed 的合作数
-    coop_q = CooperationRequest.query.filter_by(final_status=CooperationStatus.confirmed.value).all()
-    comp_counter = {}
-    for r in coop_q:
-        post = TeacherPost.query.get(r.post_id) if r.post_id else None
-        if not post or post.post_type != "competition":
-            continue
-        k = month_key(r.created_at)
-        comp_counter[k] = comp_counter.get(k, 0) + 1
-    competition_trend = [
-        {"month": m["month"], "count": comp_counter.get(m["month"], 0)} for m in posts_monthly
-    ]
+    comp_counter = _count_by_bucket(
+        CooperationRequest,
+        "%Y-%m",
+        start_month_dt,
+        CooperationRequest.final_status == CooperationStatus.confirmed.value,
+        CooperationRequest.post_id.in_(select(TeacherPost.id).where(TeacherPost.post_type == "competition")),
+    )
+    competition_trend = [{"month": k, "count": comp_counter.get(k, 0)} for k in month_keys]
 
     return jsonify(
         {
@@ -365,23 +356,36 @@ def get_user_detail(user_id: int):
 @bp.post("/users/batch-create")
 @require_roles(["admin"])
 def batch_create_users():
-    from ..utils import hash_password, now_utc
+    from ..passwords import hash_passwords
+    from ..utils import now_utc
 
     data = request.get_json(force=True)
     entries = data.get("users") or []
-    created = []
+    pending = []
+    seen = set()
     for e in entries:
         username = (e.get("username") or "").strip()
         password = e.get("password") or "123456"
         role = e.get("role") or "student"
         display_name = (e.get("display_name") or username).strip()
-        if not username or role not in {"student", "teacher", "admin"}:
-            continue
-        if User.query.filter_by(username=username).first():
+        if not username or role not in {"student", "teacher", "admin"} or username in seen:
             continue
+        seen.add(username)
+        pending.append((username, password, role, display_name))
+    existing = set()
+    if pending:
+        existing = {
+            name
+            for (name,) in db.session.query(User.username).filter(User.username.in_([p[0] for p in pending])).all()
+        }
+    pending = [p for p in pending if p[0] not in existing]
+
+    created = []
+    hashes = hash_passwords([p[1] for p in pending])
+    for (username, password, role, display_name), password_hash in zip(pending, hashes):
         u = User(
             username=username,
-            password_hash=hash_password(password),
+            password_hash=password_hash,
             role=role,
             display_name=display_name,
             is_active=True,
@@ -389,6 +393,9 @@ def batch_create_users():
             must_change_password=password == "123456",
         )
         db.session.add(u)
+        if role == "student":
+            db.session.flush()
+            index_document("student", u)
         created.append({"username": username, "role": role})
     db.session.commit()
     return jsonify({"created": created})
@@ -529,6 +536,10 @@ def admin_create_project():
         updated_at=now_utc(),
     )
     db.session.add(post)
+    db.session.flush()
+    sync_entity_tags("teacher_post", post)
+    index_document("teacher_post", post)
+    mark_match_dirty("teacher_post", post, set())
     db.session.commit()
     return jsonify({"id": post.id})
 
@@ -546,6 +557,7 @@ def admin_update_project(post_id: int):
         return jsonify({"message": "标题/内容不能为空"}), 400
     from ..utils import ensure_list_str, json_dumps, now_utc
 
+    old_terms = entity_terms("teacher_post", post.id)
     post.title = title
     post.content = content
     if "post_type" in data and (data.get("post_type") or "").strip():
@@ -563,6 +575,9 @@ def admin_update_project(post_id: int):
     if "contact" in data:
         post.contact = (data.get("contact") or None)
     post.updated_at = now_utc()
+    sync_entity_tags("teacher_post", post)
+    index_document("teacher_post", post)
+    mark_match_dirty("teacher_post", post, old_terms)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -573,148 +588,172 @@ def admin_delete_project(post_id: int):
     post = TeacherPost.query.get(post_id)
     if not post:
         return jsonify({"message": "不存在"}), 404
+    old_terms = entity_terms("teacher_post", post.id)
+    clear_entity_tags("teacher_post", post.id)
+    remove_document("teacher_post", post.id)
+    mark_match_dirty("teacher_post", post, old_terms)
     db.session.delete(post)
     db.session.commit()
     return jsonify({"ok": True})
 
 
-@bp.get("/export/users")
-@require_roles(["admin"])
-def export_users():
-    """导出用户数据到Excel"""
-    from io import BytesIO
-    from flask import send_file
-    
+EXPORT_BATCH_SIZE = 1000
+
+
+def _export_response(filename: str, sheet_title: str, headers, column_widths, rows):
+    """
+    流式导出：format=csv 时按批写出 CSV（带 BOM，Excel 可直接打开）；
+    默认用 openpyxl write_only 模式逐行写入临时文件后发送。两种方式内存占用都与行数无关。
+    rows 为逐行产生数据的迭代器，需在请求上下文中消费。
+    """
+    import csv
+    import tempfile
+    from io import StringIO
+    from urllib.parse import quote
+
+    from flask import Response, send_file, stream_with_context
+
+    fmt = (request.args.get("format") or "xlsx").strip().lower()
+    if fmt == "csv":
+        def generate():
+            buf = StringIO()
+            writer = csv.writer(buf)
+            buf.write("\ufeff")
+            writer.writerow(headers)
+            for n, row in enumerate(rows, start=1):
+                writer.writerow(row)
+                if n % EXPORT_BATCH_SIZE == 0:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename + '.csv')}"},
+        )
+
     try:
         from openpyxl import Workbook
     except ImportError:
         return jsonify({"message": "服务器未安装openpyxl库"}), 500
-    
-    role = (request.args.get("role") or "").strip()
-    
-    q = User.query
-    if role in {"student", "teacher", "admin"}:
-        q = q.filter_by(role=role)
-    
-    users = q.order_by(User.created_at.desc()).all()
-    
-    # 创建工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "用户列表"
-    
-    # 写入表头
-    headers = ["角色", "学号/工号", "姓名", "邮箱", "手机号", "注册时间", "状态"]
-    ws.append(headers)
-    
-    # 写入数据
-    role_map = {"student": "学生", "teacher": "教师", "admin": "管理员"}
-    for u in users:
-        ws.append([
-            role_map.get(u.role, u.role),
-            u.username,
-            u.display_name or "",
-            u.email or "",
-            u.phone or "",
-            u.created_at.strftime("%Y-%m-%d %H:%M") if u.created_at else "",
-            "启用" if u.is_active else "禁用"
-        ])
-    
-    # 调整列宽
-    column_widths = [10, 15, 15, 25, 15, 20, 10]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title)
     for i, width in enumerate(column_widths, 1):
         ws.column_dimensions[chr(64 + i)].width = width
-    
-    # 保存到内存
-    output = BytesIO()
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+
+    output = tempfile.TemporaryFile()
     wb.save(output)
     output.seek(0)
-    
     return send_file(
         output,
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         as_attachment=True,
-        download_name="用户列表.xlsx"
+        download_name=f"{filename}.xlsx"
     )
 
 
-@bp.get("/export/projects")
+@bp.get("/export/users")
 @require_roles(["admin"])
-def export_projects():
-    """导出项目数据到Excel"""
-    from io import BytesIO
-    from flask import send_file
+def export_users():
+    """导出用户数据（默认 Excel，format=csv 导出 CSV）"""
+    role = (request.args.get("role") or "").strip()
     
-    try:
-        from openpyxl import Workbook
-    except ImportError:
-        return jsonify({"message": "服务器未安装openpyxl库"}), 500
+    q = select(
+        User.role, User.username, User.display_name, User.email, User.phone, User.created_at, User.is_active
+    ).order_by(User.created_at.desc())
+    if role in {"student", "teacher", "admin"}:
+        q = q.where(User.role == role)
+    
+    role_map = {"student": "学生", "teacher": "教师", "admin": "管理员"}
+    
+    def rows():
+        for r in db.session.execute(q.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+            yield [
+                role_map.get(r.role, r.role),
+                r.username,
+                r.display_name or "",
+                r.email or "",
+                r.phone or "",
+                r.created_at.strftime("%Y-%m-%d %H:%M") if r.created_at else "",
+                "启用" if r.is_active else "禁用"
+            ]
     
+    return _export_response(
+        "用户列表",
+        "用户列表",
+        ["角色", "学号/工号", "姓名", "邮箱", "手机号", "注册时间", "状态"],
+        [10, 15, 15, 25, 15, 20, 10],
+        rows(),
+    )
+
+
+@bp.get("/export/projects")
+@require_roles(["admin"])
+def export_projects():
+    """导出项目数据（默认 Excel，format=csv 导出 CSV），教师姓名随项目一次查询取回"""
     post_type = (request.args.get("post_type") or "").strip()
     project_status = (request.args.get("project_status") or "").strip()
     
-    q = TeacherPost.query
+    q = (
+        select(
+            TeacherPost.title,
+            TeacherPost.post_type,
+            User.display_name.label("teacher_name"),
+            TeacherPost.recruit_count,
+            TeacherPost.confirmed_count,
+            TeacherPost.project_status,
+            TeacherPost.created_at,
+        )
+        .outerjoin(User, User.id == TeacherPost.teacher_user_id)
+        .order_by(TeacherPost.created_at.desc())
+    )
     if post_type in {"project", "innovation", "competition"}:
-        q = q.filter_by(post_type=post_type)
+        q = q.where(TeacherPost.post_type == post_type)
     if project_status:
-        q = q.filter_by(project_status=project_status)
-    
-    posts = q.order_by(TeacherPost.created_at.desc()).all()
-    
-    # 创建工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "项目列表"
-    
-    # 写入表头
-    headers = ["项目名称", "类型", "教师", "招募人数", "已确认人数", "状态", "创建时间"]
-    ws.append(headers)
+        q = q.where(TeacherPost.project_status == project_status)
     
-    # 写入数据
     type_map = {"project": "科研项目", "innovation": "大创项目", "competition": "学科竞赛"}
     status_map = {"recruiting": "招募中", "in_progress": "进行中", "completed": "已完成", "closed": "已关闭"}
     
-    for p in posts:
-        teacher = User.query.get(p.teacher_user_id)
-        confirmed_count = CooperationRequest.query.filter_by(
-            post_id=p.id,
-            final_status=CooperationStatus.confirmed.value
-        ).count()
-        
-        ws.append([
-            p.title,
-            type_map.get(p.post_type, p.post_type),
-            teacher.display_name if teacher else "",
-            p.recruit_count or "",
-            confirmed_count,
-            status_map.get(p.project_status, p.project_status or "招募中"),
-            p.created_at.strftime("%Y-%m-%d %H:%M") if p.created_at else ""
-        ])
-    
-    # 调整列宽
-    column_widths = [30, 12, 15, 12, 12, 12, 20]
-    for i, width in enumerate(column_widths, 1):
-        ws.column_dimensions[chr(64 + i)].width = width
-    
-    # 保存到内存
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
+    def rows():
+        for r in db.session.execute(q.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+            yield [
+                r.title,
+                type_map.get(r.post_type, r.post_type),
+                r.teacher_name or "",
+                r.recruit_count or "",
+                r.confirmed_count or 0,
+                status_map.get(r.project_status, r.project_status or "招募中"),
+                r.created_at.strftime("%Y-%m-%d %H:%M") if r.created_at else ""
+            ]
     
-    return send_file(
-        output,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        as_attachment=True,
-        download_name="项目列表.xlsx"
+    return _export_response(
+        "项目列表",
+        "项目列表",
+        ["项目名称", "类型", "教师", "招募人数", "已确认人数", "状态", "创建时间"],
+        [30, 12, 15, 12, 12, 12, 20],
+        rows(),
     )
 
 
+IMPORT_CHUNK_SIZE = 1000
+
+
 @bp.post("/import/users")
 @require_roles(["admin"])
 def import_users():
-    """从Excel导入用户数据"""
-    from ..utils import hash_password, now_utc
-    
+    """
+    从Excel导入用户数据
+    以只读模式逐行读取工作表，每 IMPORT_CHUNK_SIZE 行为一批：一次 IN 查询排除已存在的用户名，
+    并行哈希密码，批量插入用户及学生检索文档后提交，内存占用与文件行数无关。
+    某批插入失败时回滚并逐行重试，错误只记在出错的行上。
+    """
     try:
         from openpyxl import load_workbook
     except ImportError:
@@ -728,79 +767,144 @@ def import_users():
         return jsonify({"message": "请上传Excel文件(.xlsx或.xls)"}), 400
     
     try:
-        wb = load_workbook(file)
+        wb = load_workbook(file, read_only=True)
         ws = wb.active
     except Exception as e:
         return jsonify({"message": f"文件解析失败: {str(e)}"}), 400
     
-    # 解析数据
-    rows = list(ws.iter_rows(min_row=2, values_only=True))  # 跳过表头
-    
     results = {
-        "total": len(rows),
+        "total": 0,
         "success": 0,
         "failed": 0,
         "errors": []
     }
     
+    def fail(row_no, message):
+        results["errors"].append({"row": row_no, "message": message})
+        results["failed"] += 1
+    
     role_map = {"学生": "student", "教师": "teacher", "管理员": "admin"}
+    max_username = User.__table__.c.username.type.length
+    max_display_name = User.__table__.c.display_name.type.length
+    # 本次文件中已出现过的用户名，用于发现文件内的重复行
+    seen_names = set()
+    chunk = []
     
-    for idx, row in enumerate(rows, start=2):
-        if not row or not any(row):
-            continue
-        
-        try:
-            role_text = str(row[0] or "").strip()
-            username = str(row[1] or "").strip()
-            display_name = str(row[2] or "").strip() if len(row) > 2 else ""
-            password = str(row[3] or "123456").strip() if len(row) > 3 else "123456"
+    try:
+        for idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):  # 跳过表头
+            results["total"] += 1
+            if not row or not any(row):
+                continue
+            
+            try:
+                role_text = str(row[0] or "").strip()
+                username = str(row[1] or "").strip()
+                display_name = str(row[2] or "").strip() if len(row) > 2 else ""
+                password = str(row[3] or "123456").strip() if len(row) > 3 else "123456"
+            except Exception as e:
+                fail(idx, str(e))
+                continue
             
             # 验证必填字段
             if not role_text:
-                results["errors"].append({"row": idx, "message": "角色不能为空"})
-                results["failed"] += 1
+                fail(idx, "角色不能为空")
                 continue
-            
             if not username:
-                results["errors"].append({"row": idx, "message": "学号/工号不能为空"})
-                results["failed"] += 1
+                fail(idx, "学号/工号不能为空")
                 continue
             
             # 转换角色
             role = role_map.get(role_text, role_text.lower())
             if role not in {"student", "teacher", "admin"}:
-                results["errors"].append({"row": idx, "message": f"无效的角色: {role_text}"})
-                results["failed"] += 1
+                fail(idx, f"无效的角色: {role_text}")
                 continue
             
-            # 检查用户名是否已存在
-            if User.query.filter_by(username=username).first():
-                results["errors"].append({"row": idx, "message": f"用户名已存在: {username}"})
-                results["failed"] += 1
+            if len(username) > max_username:
+                fail(idx, f"学号/工号过长（最多{max_username}个字符）")
+                continue
+            if len(display_name) > max_display_name:
+                fail(idx, f"姓名过长（最多{max_display_name}个字符）")
                 continue
             
-            # 创建用户
-            u = User(
-                username=username,
-                password_hash=hash_password(password),
-                role=role,
-                display_name=display_name or username,
-                is_active=True,
-                created_at=now_utc(),
-                must_change_password=password == "123456",
-            )
-            db.session.add(u)
-            results["success"] += 1
+            if username in seen_names:
+                fail(idx, f"用户名已存在: {username}")
+                continue
+            seen_names.add(username)
             
-        except Exception as e:
-            results["errors"].append({"row": idx, "message": str(e)})
-            results["failed"] += 1
-    
-    db.session.commit()
+            chunk.append((idx, username, role, display_name or username, password))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                _import_user_chunk(chunk, results, fail)
+                chunk = []
+        
+        if chunk:
+            _import_user_chunk(chunk, results, fail)
+    finally:
+        wb.close()
     
     return jsonify(results)
 
 
+def _import_user_chunk(chunk, results, fail):
+    """导入一批已校验的行：排除已存在的用户名，并行哈希，批量插入并提交；批量插入失败时逐行重试，只报告出错的行"""
+    from ..passwords import hash_passwords
+    
+    names = [c[1] for c in chunk]
+    existing = {name for (name,) in db.session.query(User.username).filter(User.username.in_(names)).all()}
+    rows = []
+    for c in chunk:
+        if c[1] in existing:
+            fail(c[0], f"用户名已存在: {c[1]}")
+        else:
+            rows.append(c)
+    if not rows:
+        return
+    
+    hashes = hash_passwords([c[4] for c in rows])
+    try:
+        _insert_user_rows(rows, hashes)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if len(rows) == 1:
+            fail(rows[0][0], f"导入失败: {getattr(e, 'orig', None) or e}")
+            return
+        current_app.logger.warning("批量导入用户失败，改为逐行导入: %s", e)
+        for c, password_hash in zip(rows, hashes):
+            try:
+                _insert_user_rows([c], [password_hash])
+                db.session.commit()
+            except Exception as row_error:
+                db.session.rollback()
+                fail(c[0], f"导入失败: {getattr(row_error, 'orig', None) or row_error}")
+            else:
+                results["success"] += 1
+        return
+    results["success"] += len(rows)
+
+
+def _insert_user_rows(rows, hashes):
+    now = now_utc()
+    db.session.execute(
+        insert(User),
+        [
+            {
+                "username": username,
+                "password_hash": password_hash,
+                "role": role,
+                "display_name": display_name,
+                "is_active": True,
+                "created_at": now,
+                "must_change_password": password == "123456",
+            }
+            for (idx, username, role, display_name, password), password_hash in zip(rows, hashes)
+        ],
+    )
+    students = [c[1] for c in rows if c[2] == "student"]
+    if students:
+        created = db.session.query(User.id, User.display_name).filter(User.username.in_(students)).all()
+        insert_documents("student", [(user_id, display_name, "") for user_id, display_name in created])
+
+
 @bp.get("/import/users/template")
 @require_roles(["admin"])
 def get_import_template():
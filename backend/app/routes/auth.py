@@ -1,8 +1,11 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required
+from flask_jwt_extended import jwt_required
 
 from ..extensions import db
 from ..models import Role, StudentProfile, TeacherProfile, User
+from ..passwords import needs_rehash
+from ..rbac import current_user, issue_access_token, revoke_tokens
+from ..search import index_document
 from ..utils import hash_password, now_utc, verify_password
 
 
@@ -40,6 +43,7 @@ def register():
 
     if role == Role.student.value:
         db.session.add(StudentProfile(user_id=user.id, updated_at=now_utc()))
+        index_document("student", user)
     if role == Role.teacher.value:
         db.session.add(TeacherProfile(user_id=user.id, updated_at=now_utc()))
 
@@ -61,8 +65,12 @@ def login():
         return jsonify({"message": "角色不匹配"}), 401
     if not user.is_active:
         return jsonify({"message": "账号未启用/待审核"}), 403
+    if needs_rehash(user.password_hash):
+        # 哈希参数已调整：借登录时拿到的明文按新参数重新哈希
+        user.password_hash = hash_password(password)
+        db.session.commit()
 
-    token = create_access_token(identity=str(user.id))
+    token = issue_access_token(user)
     return jsonify(
         {
             "access_token": token,
@@ -80,7 +88,7 @@ def login():
 @bp.get("/me")
 @jwt_required()
 def me():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     return jsonify(
@@ -101,7 +109,7 @@ def me():
 def change_password():
     from ..utils import hash_password, verify_password
 
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return {"message": "未登录"}, 401
 
@@ -118,5 +126,7 @@ def change_password():
 
     user.password_hash = hash_password(new_password)
     user.must_change_password = False
+    # 其他设备上的旧令牌随之失效，当前会话换用新令牌
+    revoke_tokens(user)
     db.session.commit()
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, "access_token": issue_access_token(user)})
@@ -1,11 +1,13 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import jwt_required
 from datetime import timedelta
 
 from ..extensions import db
 from ..models import CooperationProject, CooperationRequest, CooperationStatus, Milestone, ProgressUpdate, Role, TeacherPost, User
 from ..utils import now_utc, json_dumps, json_loads
-from ..services import push_notification, check_and_start_project
+from ..outbox import enqueue_notification
+from ..services import bump_confirmed_count, check_and_start_project, push_notification
+from ..rbac import current_user
 from .role_tags import validate_role_tags
 
 
@@ -13,6 +15,7 @@ bp = Blueprint("cooperation", __name__)
 
 
 def _finalize_if_ready(req: CooperationRequest):
+    before_final = req.final_status
     if req.teacher_status == CooperationStatus.accepted.value and req.student_status == CooperationStatus.accepted.value:
         req.final_status = CooperationStatus.confirmed.value
         existing = CooperationProject.query.filter_by(request_id=req.id).first()
@@ -25,12 +28,13 @@ def _finalize_if_ready(req: CooperationRequest):
             db.session.add(CooperationProject(request_id=req.id, title=title, created_at=now_utc()))
     if req.teacher_status == CooperationStatus.rejected.value or req.student_status == CooperationStatus.rejected.value:
         req.final_status = CooperationStatus.rejected.value
+    bump_confirmed_count(req.post_id, before_final, req.final_status)
 
 
 @bp.post("/cooperation/request")
 @jwt_required()
 def create_request():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -56,11 +60,7 @@ def create_request():
         
         # 3. 检查是否已满员
         if post.recruit_count:
-            confirmed_count = CooperationRequest.query.filter_by(
-                post_id=int(post_id),
-                final_status=CooperationStatus.confirmed.value
-            ).count()
-            if confirmed_count >= post.recruit_count:
+            if (post.confirmed_count or 0) >= post.recruit_count:
                 return jsonify({"message": "该项目已达到招募人数上限"}), 400
 
     if not teacher_user_id or not student_user_id:
@@ -128,11 +128,12 @@ def create_request():
             title = f"{teacher.display_name} 发出合作邀请"
             summary = f"项目：{post.title}" if post else "有新的合作邀请"
             target_user_id = student.id
-        push_notification(
-            user_id=target_user_id,
-            notif_type="cooperation_request",
-            title=title,
-            payload={"summary": summary},
+        enqueue_notification(
+            target_user_id,
+            "cooperation_request",
+            title,
+            {"summary": summary},
+            idempotency_key=f"cooperation_request:{req.id}:{req.created_at.isoformat()}",
         )
 
     db.session.commit()
@@ -143,7 +144,7 @@ def create_request():
 @bp.get("/cooperation/requests")
 @jwt_required()
 def list_requests():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
 
@@ -189,7 +190,7 @@ def list_requests():
 @bp.post("/cooperation/requests/<int:req_id>/respond")
 @jwt_required()
 def respond(req_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -204,12 +205,7 @@ def respond(req_id: int):
     if user.id == req.teacher_user_id and action == "accept" and req.post_id:
         post = TeacherPost.query.get(req.post_id)
         if post and post.recruit_count:
-            # 统计已确认的学生数量
-            confirmed_count = CooperationRequest.query.filter_by(
-                post_id=req.post_id,
-                final_status=CooperationStatus.confirmed.value
-            ).count()
-            if confirmed_count >= post.recruit_count:
+            if (post.confirmed_count or 0) >= post.recruit_count:
                 return jsonify({"message": "该项目已达到招募人数上限"}), 400
     
     if user.id == req.teacher_user_id:
@@ -224,7 +220,6 @@ def respond(req_id: int):
     before_final = req.final_status
     req.updated_at = now_utc()
     _finalize_if_ready(req)
-    db.session.commit()
 
     teacher = User.query.get(req.teacher_user_id)
     student = User.query.get(req.student_user_id)
@@ -247,35 +242,32 @@ def respond(req_id: int):
         )
         if post:
             summary = f"项目：{post.title}（{summary}）"
-        push_notification(
-            user_id=target_user.id,
-            notif_type="cooperation_respond",
-            title=title,
-            payload={"summary": summary},
+        # 每次状态变更是一个事件（以本次的 updated_at 区分），之后回到曾经出现过的状态组合也会通知
+        enqueue_notification(
+            target_user.id,
+            "cooperation_respond",
+            title,
+            {"summary": summary},
+            idempotency_key=f"cooperation_respond:{req.id}:{req.updated_at.isoformat()}:{req.teacher_status}:{req.student_status}",
         )
 
-    if before_final != CooperationStatus.confirmed.value and req.final_status == CooperationStatus.confirmed.value:
-        if teacher:
-            push_notification(
-                user_id=teacher.id,
-                notif_type="cooperation_confirmed",
-                title="合作已确认",
-                payload={"summary": f"项目：{post.title}" if post else "合作已确认"},
-            )
-        if student:
-            push_notification(
-                user_id=student.id,
-                notif_type="cooperation_confirmed",
-                title="合作已确认",
-                payload={"summary": f"项目：{post.title}" if post else "合作已确认"},
-            )
-        
-        # 检查并自动启动项目（如果达到招募人数）
-        if req.post_id:
-            try:
-                check_and_start_project(req.post_id)
-            except Exception as e:
-                print(f"自动启动项目失败: {e}")
+    confirmed_now = before_final != CooperationStatus.confirmed.value and req.final_status == CooperationStatus.confirmed.value
+    if confirmed_now:
+        enqueue_notification(
+            [u.id for u in (teacher, student) if u],
+            "cooperation_confirmed",
+            "合作已确认",
+            {"summary": f"项目：{post.title}" if post else "合作已确认"},
+            idempotency_key=f"cooperation_confirmed:{req.id}:{req.updated_at.isoformat()}",
+        )
+    db.session.commit()
+
+    # 检查并自动启动项目（如果达到招募人数）
+    if confirmed_now and req.post_id:
+        try:
+            check_and_start_project(req.post_id)
+        except Exception as e:
+            print(f"自动启动项目失败: {e}")
 
     return jsonify({"final_status": req.final_status})
 
@@ -283,7 +275,7 @@ def respond(req_id: int):
 @bp.get("/cooperation/projects")
 @jwt_required()
 def list_projects():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -419,7 +411,7 @@ def update_student_info(req_id: int):
     教师可以编辑学生的角色
     学生可以编辑自己的角色和状态
     """
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -507,7 +499,7 @@ def get_my_request_for_project(post_id: int):
     """
     获取当前学生在指定项目中的合作请求信息
     """
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -543,7 +535,7 @@ def delete_cooperation_request(req_id: int):
     教师可以删除自己项目的合作请求
     学生可以删除自己的合作请求
     """
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -571,26 +563,29 @@ def delete_cooperation_request(req_id: int):
     teacher = User.query.get(req.teacher_user_id)
     post = TeacherPost.query.get(req.post_id) if req.post_id else None
     
-    # 删除合作请求
-    db.session.delete(req)
-    db.session.commit()
-    
     # 发送通知给对方
     if user.role == Role.teacher.value and student:
-        push_notification(
-            user_id=student.id,
-            notif_type="cooperation_cancelled",
-            title="合作已取消",
-            payload={"summary": f"教师 {teacher.display_name if teacher else '未知'} 取消了您在项目「{post.title if post else '未知项目'}」中的合作关系"},
+        enqueue_notification(
+            student.id,
+            "cooperation_cancelled",
+            "合作已取消",
+            {"summary": f"教师 {teacher.display_name if teacher else '未知'} 取消了您在项目「{post.title if post else '未知项目'}」中的合作关系"},
+            idempotency_key=f"cooperation_cancelled:{req.id}:{req.created_at.isoformat()}",
         )
     elif user.role == Role.student.value and teacher:
-        push_notification(
-            user_id=teacher.id,
-            notif_type="cooperation_cancelled",
-            title="学生退出项目",
-            payload={"summary": f"学生 {student.display_name if student else '未知'} 退出了项目「{post.title if post else '未知项目'}」"},
+        enqueue_notification(
+            teacher.id,
+            "cooperation_cancelled",
+            "学生退出项目",
+            {"summary": f"学生 {student.display_name if student else '未知'} 退出了项目「{post.title if post else '未知项目'}」"},
+            idempotency_key=f"cooperation_cancelled:{req.id}:{req.created_at.isoformat()}",
         )
     
+    # 删除合作请求
+    bump_confirmed_count(req.post_id, req.final_status, None)
+    db.session.delete(req)
+    db.session.commit()
+    
     return jsonify({
         "success": True,
         "message": "合作关系已取消"
@@ -605,7 +600,7 @@ def get_grouped_requests():
     只有教师可以访问
     返回按项目分组的申请，包含每个项目的待处理申请数量
     """
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
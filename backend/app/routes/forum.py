@@ -3,7 +3,10 @@ from flask_jwt_extended import get_jwt_identity, jwt_required
 
 from ..extensions import db
 from ..models import Comment, ForumReply, ForumTopic, Reaction, Role, User
-from ..services import push_notification
+from ..outbox import enqueue_notification
+from ..rbac import current_user
+from ..search import index_document, matching_ids, remove_document
+from ..services import clear_entity_tags, sync_entity_tags, tagged_ids
 from ..utils import ensure_list_str, json_dumps, json_loads, now_utc
 
 
@@ -25,9 +28,9 @@ def list_topics():
     if category:
         q = q.filter_by(category=category)
     if keyword:
-        q = q.filter(ForumTopic.title.contains(keyword) | ForumTopic.content.contains(keyword))
+        q = q.filter(ForumTopic.id.in_(matching_ids("forum_topic", keyword)))
     if tag:
-        q = q.filter(ForumTopic.tags_json.contains(tag))
+        q = q.filter(ForumTopic.id.in_(tagged_ids("forum_topic", "tag", tag)))
 
     if like_only or favorite_only:
         if not request.headers.get("Authorization"):
@@ -82,7 +85,7 @@ def list_topics():
 @bp.post("/forum/topics")
 @jwt_required()
 def create_topic():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -101,6 +104,9 @@ def create_topic():
         created_at=now_utc(),
     )
     db.session.add(t)
+    db.session.flush()
+    sync_entity_tags("forum_topic", t)
+    index_document("forum_topic", t)
     db.session.commit()
     return jsonify({"id": t.id})
 
@@ -125,7 +131,7 @@ def list_replies(topic_id: int):
 @bp.post("/forum/topics/<int:topic_id>/replies")
 @jwt_required()
 def add_reply(topic_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -137,23 +143,25 @@ def add_reply(topic_id: int):
         return jsonify({"message": "话题不存在"}), 404
     r = ForumReply(topic_id=topic_id, author_user_id=user.id, content=content, created_at=now_utc())
     db.session.add(r)
-    db.session.commit()
+    db.session.flush()
 
     if topic.author_user_id != user.id:
         summary = f"{user.display_name} 回复了你的话题：{content[:60]}"
-        push_notification(
-            user_id=topic.author_user_id,
-            notif_type="forum_reply",
-            title="话题有新的回复",
-            payload={"topic_id": topic.id, "summary": summary},
+        enqueue_notification(
+            topic.author_user_id,
+            "forum_reply",
+            "话题有新的回复",
+            {"topic_id": topic.id, "summary": summary},
+            idempotency_key=f"forum_reply:{r.id}:{r.created_at.isoformat()}",
         )
+    db.session.commit()
     return jsonify({"id": r.id})
 
 
 @bp.put("/forum/topics/<int:topic_id>")
 @jwt_required()
 def update_topic(topic_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     t = ForumTopic.query.get(topic_id)
@@ -172,6 +180,8 @@ def update_topic(topic_id: int):
         t.category = (data.get("category") or t.category).strip()
     if "tags" in data:
         t.tags_json = json_dumps(ensure_list_str(data.get("tags")))
+    sync_entity_tags("forum_topic", t)
+    index_document("forum_topic", t)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -179,7 +189,7 @@ def update_topic(topic_id: int):
 @bp.delete("/forum/topics/<int:topic_id>")
 @jwt_required()
 def delete_topic(topic_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     t = ForumTopic.query.get(topic_id)
@@ -191,6 +201,8 @@ def delete_topic(topic_id: int):
     ForumReply.query.filter_by(topic_id=t.id).delete(synchronize_session=False)
     Reaction.query.filter_by(target_type="forum_topic", target_id=t.id).delete(synchronize_session=False)
     Comment.query.filter_by(target_type="forum_topic", target_id=t.id).delete(synchronize_session=False)
+    clear_entity_tags("forum_topic", t.id)
+    remove_document("forum_topic", t.id)
     db.session.delete(t)
     db.session.commit()
     return jsonify({"ok": True})
@@ -1,13 +1,18 @@
-from datetime import timedelta
+import time
+from datetime import datetime, timedelta
+from typing import List
 
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
-from sqlalchemy import or_
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required
+from sqlalchemy import and_, case, or_
 
 from ..extensions import db
 from ..models import Conversation, File, Message, Role, StudentProfile, TeacherProfile, User
+from ..outbox import enqueue_notification
+from ..rbac import current_user
+from ..realtime import conversation_channel, hub
+from ..services import bump_user_counters, unread_count_subquery
 from ..utils import now_utc
-from ..services import push_notification
 
 
 bp = Blueprint("messages", __name__)
@@ -16,7 +21,7 @@ bp = Blueprint("messages", __name__)
 @bp.get("/messages/auto-reply")
 @jwt_required()
 def get_auto_reply():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     if user.role == Role.student.value:
@@ -31,7 +36,7 @@ def get_auto_reply():
 @bp.put("/messages/auto-reply")
 @jwt_required()
 def set_auto_reply():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -61,55 +66,131 @@ def _ensure_pair(teacher_user_id: int, student_user_id: int) -> Conversation:
     c = Conversation.query.filter_by(teacher_user_id=teacher_user_id, student_user_id=student_user_id).first()
     if c:
         return c
-    c = Conversation(teacher_user_id=teacher_user_id, student_user_id=student_user_id, created_at=now_utc())
+    now = now_utc()
+    c = Conversation(
+        teacher_user_id=teacher_user_id,
+        student_user_id=student_user_id,
+        created_at=now,
+        last_message_at=now,
+        teacher_unread=0,
+        student_unread=0,
+    )
     db.session.add(c)
     db.session.commit()
     return c
 
 
+def _record_message(c: Conversation, m: Message):
+    """新消息写入后更新会话摘要：最后一条消息与接收方未读数（m 需已 flush），并累加接收方的未读私信总数"""
+    if m.sender_user_id == c.student_user_id:
+        unread_col, recipient_id = Conversation.teacher_unread, c.teacher_user_id
+    else:
+        unread_col, recipient_id = Conversation.student_unread, c.student_user_id
+    Conversation.query.filter_by(id=c.id).update(
+        {
+            Conversation.last_message_id: m.id,
+            Conversation.last_message_at: m.created_at,
+            unread_col: unread_col + 1,
+        },
+        synchronize_session=False,
+    )
+    bump_user_counters(recipient_id, messages=1)
+
+
+def _mark_read(c: Conversation, reader_id: int) -> int:
+    """一条 UPDATE 把会话中发给读者的未读消息全部标为已读，再按消息表重算读者一方的未读数"""
+    marked = Message.query.filter(
+        Message.conversation_id == c.id,
+        Message.sender_user_id != reader_id,
+        Message.is_read == False,
+    ).update({Message.is_read: True}, synchronize_session=False)
+    if reader_id == c.teacher_user_id:
+        values = {Conversation.teacher_unread: unread_count_subquery(Conversation.teacher_user_id)}
+    else:
+        values = {Conversation.student_unread: unread_count_subquery(Conversation.student_user_id)}
+    Conversation.query.filter_by(id=c.id).update(values, synchronize_session=False)
+    if marked:
+        bump_user_counters(reader_id, messages=-marked)
+    return marked
+
+
 @bp.get("/conversations")
 @jwt_required()
 def list_conversations():
-    user = User.query.get(int(get_jwt_identity()))
+    """
+    收件箱：按最后一条消息时间倒序，一次查询带出对方信息、未读数和最后一条消息。
+    可选 limit 开启分页，下一页用上一页返回的 next_cursor（before_at + before_id）继续。
+    """
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     if user.role == Role.teacher.value:
-        convs = Conversation.query.filter_by(teacher_user_id=user.id).order_by(Conversation.created_at.desc()).all()
+        cond = Conversation.teacher_user_id == user.id
     elif user.role == Role.student.value:
-        convs = Conversation.query.filter_by(student_user_id=user.id).order_by(Conversation.created_at.desc()).all()
+        cond = Conversation.student_user_id == user.id
     elif user.role == Role.admin.value:
-        convs = (
-            Conversation.query.filter(or_(Conversation.teacher_user_id == user.id, Conversation.student_user_id == user.id))
-            .order_by(Conversation.created_at.desc())
-            .all()
-        )
+        cond = or_(Conversation.teacher_user_id == user.id, Conversation.student_user_id == user.id)
     else:
-        convs = []
+        return jsonify({"items": [], "next_cursor": None})
+
+    is_teacher_side = Conversation.teacher_user_id == user.id
+    other_id = case((is_teacher_side, Conversation.student_user_id), else_=Conversation.teacher_user_id)
+    unread = case((is_teacher_side, Conversation.teacher_unread), else_=Conversation.student_unread)
+    q = (
+        db.session.query(Conversation, User, Message, unread.label("unread"))
+        .outerjoin(User, User.id == other_id)
+        .outerjoin(Message, Message.id == Conversation.last_message_id)
+        .filter(cond)
+    )
+
+    before_at = request.args.get("before_at")
+    before_id = request.args.get("before_id")
+    if before_at:
+        try:
+            before_at = datetime.fromisoformat(before_at)
+        except ValueError:
+            return jsonify({"message": "before_at 参数错误"}), 400
+        if before_id and str(before_id).isdigit():
+            q = q.filter(
+                or_(
+                    Conversation.last_message_at < before_at,
+                    and_(Conversation.last_message_at == before_at, Conversation.id < int(before_id)),
+                )
+            )
+        else:
+            q = q.filter(Conversation.last_message_at < before_at)
+
+    limit = request.args.get("limit")
+    limit = min(int(limit), 100) if limit and str(limit).isdigit() and int(limit) > 0 else None
+    q = q.order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
+    rows = q.limit(limit + 1).all() if limit else q.all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last_conv = rows[-1][0]
+        next_cursor = {"before_at": last_conv.last_message_at.isoformat(), "before_id": last_conv.id}
+
     items = []
-    for c in convs:
-        other_id = c.student_user_id if c.teacher_user_id == user.id else c.teacher_user_id
-        other = User.query.get(other_id)
-        unread = Message.query.filter_by(conversation_id=c.id, is_read=False).filter(Message.sender_user_id != user.id).count()
-        last = Message.query.filter_by(conversation_id=c.id).order_by(Message.created_at.desc()).first()
+    for c, other, last, unread_count in rows:
+        last_at = c.last_message_at or c.created_at
         items.append(
             {
                 "id": c.id,
                 "teacher_user_id": c.teacher_user_id,
                 "student_user_id": c.student_user_id,
                 "other": {"id": other.id, "display_name": other.display_name, "role": other.role} if other else None,
-                "unread": unread,
+                "unread": int(unread_count or 0),
                 "last_message": last.content if last and last.content else ("[文件]" if last and last.file_id else None),
-                "last_at": last.created_at.isoformat() if last else c.created_at.isoformat(),
+                "last_at": last_at.isoformat(),
             }
         )
-    items.sort(key=lambda x: x.get("last_at") or "", reverse=True)
-    return jsonify({"items": items})
+    return jsonify({"items": items, "next_cursor": next_cursor})
 
 
 @bp.post("/conversations/start")
 @jwt_required()
 def start_conversation():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     if user.role != Role.admin.value:
@@ -136,20 +217,49 @@ def start_conversation():
 @bp.get("/conversations/<int:conversation_id>/messages")
 @jwt_required()
 def list_messages(conversation_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    """
+    会话消息（按 id 升序返回一页）：默认最新的 limit 条；before_id 向前翻更早的消息，after_id 取更新的消息。
+    has_more 表示翻页方向上是否还有消息。打开会话即把发给自己的未读消息标为已读。
+    """
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     c = Conversation.query.get(conversation_id)
     if not c or user.id not in {c.teacher_user_id, c.student_user_id}:
         return jsonify({"message": "无权限"}), 403
-    msgs = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.created_at.asc()).limit(500).all()
-    for m in msgs:
-        if m.sender_user_id != user.id:
-            m.is_read = True
-    db.session.commit()
+    before_id = request.args.get("before_id")
+    after_id = request.args.get("after_id")
+    if (before_id and not before_id.isdigit()) or (after_id and not after_id.isdigit()):
+        return jsonify({"message": "游标参数错误"}), 400
+    limit = str(request.args.get("limit", ""))
+    limit = int(limit) if limit.isdigit() else 50
+    if limit <= 0 or limit > 200:
+        limit = 50
+
+    if _mark_read(c, user.id):
+        db.session.commit()
+
+    q = Message.query.filter(Message.conversation_id == conversation_id)
+    if after_id:
+        msgs = q.filter(Message.id > int(after_id)).order_by(Message.id.asc()).limit(limit + 1).all()
+        has_more = len(msgs) > limit
+        msgs = msgs[:limit]
+    else:
+        if before_id:
+            q = q.filter(Message.id < int(before_id))
+        msgs = q.order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more = len(msgs) > limit
+        msgs = list(reversed(msgs[:limit]))
+    return jsonify({"items": _message_items(msgs), "has_more": has_more})
+
+
+def _message_items(msgs: List[Message]):
+    """序列化一批消息，附件信息用一次 IN 查询取回"""
+    file_ids = {m.file_id for m in msgs if m.file_id}
+    files = {f.id: f for f in File.query.filter(File.id.in_(file_ids)).all()} if file_ids else {}
     items = []
     for m in msgs:
-        f = File.query.get(m.file_id) if m.file_id else None
+        f = files.get(m.file_id) if m.file_id else None
         items.append(
             {
                 "id": m.id,
@@ -167,13 +277,72 @@ def list_messages(conversation_id: int):
                 "created_at": m.created_at.isoformat(),
             }
         )
-    return jsonify({"items": items})
+    return items
+
+
+@bp.get("/conversations/<int:conversation_id>/messages/poll")
+@jwt_required()
+def poll_messages(conversation_id: int):
+    """
+    私信长轮询：返回 id 大于 after_id 的新消息，没有新消息时挂起等待，最长 timeout 秒后返回空列表。
+    本进程内 send_message 提交后通过 hub 立即唤醒；其他进程写入的消息按 REALTIME_POLL_INTERVAL 回查发现。
+    收到对方新消息时把会话标记为已读，客户端用返回的 last_id 作为下一次的 after_id。
+    """
+    user = current_user()
+    if not user or not user.is_active:
+        return jsonify({"message": "未登录"}), 401
+    c = Conversation.query.get(conversation_id)
+    if not c or user.id not in {c.teacher_user_id, c.student_user_id}:
+        return jsonify({"message": "无权限"}), 403
+    after_id = request.args.get("after_id", "0")
+    if not str(after_id).isdigit():
+        return jsonify({"message": "after_id 参数错误"}), 400
+    after_id = int(after_id)
+    max_wait = current_app.config["MESSAGE_LONG_POLL_SECONDS"]
+    try:
+        timeout = min(max(float(request.args.get("timeout", max_wait)), 0.0), max_wait)
+    except ValueError:
+        timeout = max_wait
+    poll_interval = current_app.config["REALTIME_POLL_INTERVAL"]
+    user_id = user.id
+
+    def new_messages():
+        return (
+            Message.query.filter(Message.conversation_id == conversation_id, Message.id > after_id)
+            .order_by(Message.id.asc())
+            .limit(100)
+            .all()
+        )
+
+    channel = conversation_channel(conversation_id)
+    wakeup = hub.subscribe(channel)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            wakeup.clear()
+            msgs = new_messages()
+            if msgs:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # 等待期间不占用数据库连接
+            db.session.close()
+            wakeup.wait(min(poll_interval, remaining))
+    finally:
+        hub.unsubscribe(channel, wakeup)
+
+    if any(m.sender_user_id != user_id and not m.is_read for m in msgs):
+        _mark_read(c, user_id)
+        db.session.commit()
+        msgs = new_messages()
+    return jsonify({"items": _message_items(msgs), "last_id": msgs[-1].id if msgs else after_id})
 
 
 @bp.post("/messages/send")
 @jwt_required()
 def send_message():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -198,7 +367,8 @@ def send_message():
         created_at=now,
     )
     db.session.add(m)
-    db.session.commit()
+    db.session.flush()
+    _record_message(c, m)
 
     other_id = int(student_user_id) if user.id == int(teacher_user_id) else int(teacher_user_id)
 
@@ -209,12 +379,14 @@ def send_message():
         f = File.query.get(int(file_id))
         name = f.original_name if f and f.original_name else "文件"
         summary = f"{summary}：[{name}]"
-    push_notification(
-        user_id=other_id,
-        notif_type="message_new",
-        title="收到新的私信",
-        payload={"conversation_id": c.id, "from_user_id": user.id, "summary": summary},
+    enqueue_notification(
+        other_id,
+        "message_new",
+        "收到新的私信",
+        {"conversation_id": c.id, "from_user_id": user.id, "summary": summary},
+        idempotency_key=f"message_new:{m.id}:{m.created_at.isoformat()}",
     )
+    db.session.commit()
     auto_reply_text = None
     if other_id == int(student_user_id):
         p = StudentProfile.query.get(other_id)
@@ -233,15 +405,17 @@ def send_message():
             auto_reply_content = auto_reply_text
             if not auto_reply_content.startswith("【自动回复】"):
                 auto_reply_content = f"【自动回复】{auto_reply_content}"
-            db.session.add(
-                Message(
-                    conversation_id=c.id,
-                    sender_user_id=other_id,
-                    content=auto_reply_content,
-                    file_id=None,
-                    is_read=False,
-                    created_at=now_utc(),
-                )
+            reply = Message(
+                conversation_id=c.id,
+                sender_user_id=other_id,
+                content=auto_reply_content,
+                file_id=None,
+                is_read=False,
+                created_at=now_utc(),
             )
+            db.session.add(reply)
+            db.session.flush()
+            _record_message(c, reply)
             db.session.commit()
+    hub.publish(conversation_channel(c.id))
     return jsonify({"id": m.id})
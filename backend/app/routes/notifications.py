@@ -1,67 +1,80 @@
 import json
+import time
 
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_jwt_extended import get_jwt, get_jwt_request_location, jwt_required
+from sqlalchemy import func
 
 from ..extensions import db
-from ..models import Notification, User
+from ..models import Notification
+from ..rbac import current_user, issue_stream_token
+from ..realtime import hub, user_channel
+from ..services import bump_user_counters, get_user_counters
 
 
 bp = Blueprint("notifications", __name__)
 
 
+def _notification_dict(n: Notification):
+    return {
+        "id": n.id,
+        "notif_type": n.notif_type,
+        "title": n.title,
+        "payload": json.loads(n.payload_json or "{}"),
+        "payload_json": n.payload_json or "{}",
+        "group_key": n.group_key,
+        "count": n.event_count or 1,
+        "is_read": n.is_read,
+        "created_at": n.created_at.isoformat(),
+    }
+
+
 @bp.get("/notifications")
 @jwt_required()
 def list_notifications():
-    user = User.query.get(int(get_jwt_identity()))
+    """
+    通知列表（按 id 倒序返回一页）：默认最新的 limit 条；before_id 取更早的通知，after_id 取更新的通知。
+    翻页沿 (user_id, id) 索引定位，不做 OFFSET 与总数统计；has_more 表示翻页方向上是否还有通知。
+    """
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
-    page = max(int(request.args.get("page", 1)), 1)
-    page_size = int(request.args.get("page_size", 30))
-    if page_size <= 0 or page_size > 100:
-        page_size = 30
-
-    q = Notification.query.filter_by(user_id=user.id)
-    total = q.count()
-    ns = (
-        q.order_by(Notification.created_at.desc())
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-        .all()
-    )
-    return jsonify(
-        {
-            "items": [
-                {
-                    "id": n.id,
-                    "notif_type": n.notif_type,
-                    "title": n.title,
-                    "payload": json.loads(n.payload_json or "{}"),
-                    "payload_json": n.payload_json or "{}",
-                    "is_read": n.is_read,
-                    "created_at": n.created_at.isoformat(),
-                }
-                for n in ns
-            ],
-            "total": total,
-            "page": page,
-            "page_size": page_size,
-            "has_more": total > page * page_size,
-        }
-    )
+    before_id = request.args.get("before_id")
+    after_id = request.args.get("after_id")
+    if (before_id and not before_id.isdigit()) or (after_id and not after_id.isdigit()):
+        return jsonify({"message": "游标参数错误"}), 400
+    limit = str(request.args.get("limit", request.args.get("page_size", "")))
+    limit = int(limit) if limit.isdigit() else 30
+    if limit <= 0 or limit > 100:
+        limit = 30
+
+    q = Notification.query.filter(Notification.user_id == user.id)
+    if after_id:
+        ns = q.filter(Notification.id > int(after_id)).order_by(Notification.id.asc()).limit(limit + 1).all()
+        has_more = len(ns) > limit
+        ns = list(reversed(ns[:limit]))
+    else:
+        if before_id:
+            q = q.filter(Notification.id < int(before_id))
+        ns = q.order_by(Notification.id.desc()).limit(limit + 1).all()
+        has_more = len(ns) > limit
+        ns = ns[:limit]
+    return jsonify({"items": [_notification_dict(n) for n in ns], "has_more": has_more, "limit": limit})
 
 
 @bp.post("/notifications/<int:notif_id>/read")
 @jwt_required()
 def mark_read(notif_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     n = Notification.query.get(notif_id)
     if not n or n.user_id != user.id:
         return jsonify({"message": "不存在"}), 404
-    n.is_read = True
-    db.session.commit()
+    if not n.is_read:
+        n.is_read = True
+        bump_user_counters(user.id, notifications=-1)
+        db.session.commit()
     return jsonify({"ok": True})
 
 
@@ -69,11 +82,12 @@ def mark_read(notif_id: int):
 @jwt_required()
 def mark_all_read():
     """标记所有通知为已读"""
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
-    Notification.query.filter_by(user_id=user.id, is_read=False).update({"is_read": True})
+    marked = Notification.query.filter_by(user_id=user.id, is_read=False).update({"is_read": True})
+    bump_user_counters(user.id, notifications=-marked)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -81,10 +95,95 @@ def mark_all_read():
 @bp.get("/notifications/unread-count")
 @jwt_required()
 def get_unread_count():
-    """获取未读通知数量"""
-    user = User.query.get(int(get_jwt_identity()))
+    """获取未读通知数量（count）与未读私信数量（messages），读取 user_counters 的一行"""
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
-    count = Notification.query.filter_by(user_id=user.id, is_read=False).count()
-    return jsonify({"count": count})
+    counters = get_user_counters(user.id)
+    return jsonify({"count": counters.unread_notifications, "messages": counters.unread_messages})
+
+
+def _sse(event: str, data, event_id=None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@bp.post("/notifications/stream-token")
+@jwt_required()
+def create_stream_token():
+    """换取通知流专用的短期令牌，前端放在 EventSource 的 URL 中（?token=）"""
+    user = current_user()
+    if not user or not user.is_active:
+        return jsonify({"message": "未登录"}), 401
+    return jsonify({"token": issue_stream_token(user), "expires_in": current_app.config["STREAM_TOKEN_EXPIRES"]})
+
+
+@bp.get("/notifications/stream")
+@jwt_required(locations=["headers", "query_string"])
+def stream_notifications():
+    """
+    通知 SSE 推送：先发送一次未读数，之后每有新通知推送 notification 事件并附带最新未读数。
+    新通知由本进程的 hub 即时唤醒；其他进程写入的通知按 REALTIME_POLL_INTERVAL 回查数据库发现。
+    断线重连时浏览器会带上 Last-Event-ID（或由前端传 last_id），从该 id 之后继续推送。
+    URL 中只接受 /notifications/stream-token 签发的专用令牌，普通访问令牌只能放在请求头中。
+    """
+    if get_jwt_request_location() == "query_string" and get_jwt().get("scope") != "stream":
+        return jsonify({"message": "请使用通知流专用令牌"}), 401
+    user = current_user()
+    if not user or not user.is_active:
+        return jsonify({"message": "未登录"}), 401
+    user_id = user.id
+
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    if last_id and str(last_id).isdigit():
+        last_id = int(last_id)
+    else:
+        last_id = db.session.query(func.max(Notification.id)).filter(Notification.user_id == user_id).scalar() or 0
+
+    max_seconds = current_app.config["NOTIFICATION_STREAM_MAX_SECONDS"]
+    poll_interval = current_app.config["REALTIME_POLL_INTERVAL"]
+    channel = user_channel(user_id)
+
+    def unread_count():
+        return get_user_counters(user_id).unread_notifications
+
+    def generate():
+        nonlocal last_id
+        wakeup = hub.subscribe(channel)
+        try:
+            deadline = time.monotonic() + max_seconds
+            yield "retry: 3000\n\n"
+            yield _sse("unread", {"count": unread_count()})
+            db.session.close()
+            while True:
+                wakeup.clear()
+                rows = (
+                    Notification.query.filter(Notification.user_id == user_id, Notification.id > last_id)
+                    .order_by(Notification.id.asc())
+                    .limit(100)
+                    .all()
+                )
+                for n in rows:
+                    last_id = n.id
+                    yield _sse("notification", _notification_dict(n), event_id=n.id)
+                if rows:
+                    yield _sse("unread", {"count": unread_count()}, event_id=last_id)
+                # 空闲时不占用数据库连接
+                db.session.close()
+                if len(rows) == 100:
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if not wakeup.wait(min(poll_interval, remaining)):
+                    yield ": ping\n\n"
+        finally:
+            hub.unsubscribe(channel, wakeup)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
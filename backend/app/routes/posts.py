@@ -1,9 +1,8 @@
-import json
 from datetime import datetime
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from sqlalchemy import func
+from sqlalchemy import func, literal, or_, select
 
 from ..extensions import db
 from ..models import (
@@ -24,52 +23,26 @@ from ..models import (
     Visibility,
 )
 from ..utils import ensure_list_str, json_dumps, json_loads, now_utc
-from ..services import push_notification
+from ..outbox import enqueue, enqueue_notification
+from ..search import index_document, matching_ids
+from ..services import (
+    BASE_SKILL_SCORE,
+    MATCH_SIDES,
+    entity_terms,
+    jaccard_scores_subquery,
+    mark_match_dirty,
+    post_match_terms,
+    refresh_skill_score,
+    sync_entity_tags,
+    tagged_ids,
+    teacher_match_terms,
+)
+from ..rbac import current_identity, current_user
 
 
 bp = Blueprint("posts", __name__)
 
 
-def _notify_project_status_change(post, old_status, new_status):
-    """项目状态变更时通知相关学生"""
-    status_text = {
-        "recruiting": "招募中",
-        "in_progress": "进行中",
-        "completed": "已完成",
-        "closed": "已关闭"
-    }
-    
-    # 获取所有申请过该项目的学生（包括待处理和已确认的）
-    requests = CooperationRequest.query.filter_by(post_id=post.id).all()
-    student_ids = set(r.student_user_id for r in requests if r.student_user_id)
-    
-    # 获取收藏过该项目的学生
-    favorites = Reaction.query.filter_by(
-        target_type="teacher_post",
-        target_id=post.id,
-        reaction_type="favorite"
-    ).all()
-    for fav in favorites:
-        user = User.query.get(fav.user_id)
-        if user and user.role == Role.student.value:
-            student_ids.add(fav.user_id)
-    
-    if not student_ids:
-        return
-    
-    # 发送通知
-    title = f"项目状态更新：{post.title}"
-    summary = f"项目状态从「{status_text.get(old_status, old_status or '未设置')}」变更为「{status_text.get(new_status, new_status)}」"
-    
-    for student_id in student_ids:
-        push_notification(
-            user_id=student_id,
-            notif_type="project_update",
-            title=title,
-            payload={"summary": summary, "post_id": post.id}
-        )
-
-
 def _viewer_role():
     if not request.headers.get("Authorization"):
         return None
@@ -77,8 +50,8 @@ def _viewer_role():
         from flask_jwt_extended import verify_jwt_in_request
 
         verify_jwt_in_request(optional=True)
-        user = User.query.get(int(get_jwt_identity()))
-        return user.role if user else None
+        identity = current_identity()
+        return identity.role if identity else None
     except Exception:
         return None
 
@@ -93,6 +66,101 @@ def _can_view_visibility(visibility, viewer_role):
     return False
 
 
+def _visible_to(column, viewer_role):
+    """与 _can_view_visibility 等价的 SQL 条件"""
+    allowed = [Visibility.public.value]
+    if viewer_role in {Role.teacher.value, Role.admin.value}:
+        allowed.append(Visibility.teacher_only.value)
+    if viewer_role in {Role.student.value, Role.admin.value}:
+        allowed.append(Visibility.student_only.value)
+    return column.in_(allowed)
+
+
+def _load_teacher_cards(teacher_ids):
+    """
+    批量组装教师卡片信息（用于项目列表）
+    查询次数固定，与页面上的教师数量无关
+    """
+    ids = sorted({int(x) for x in teacher_ids if x})
+    if not ids:
+        return {}
+
+    teachers = User.query.filter(User.id.in_(ids)).all()
+    profiles = {p.user_id: p for p in TeacherProfile.query.filter(TeacherProfile.user_id.in_(ids)).all()}
+
+    decided_rows = (
+        db.session.query(CooperationRequest.teacher_user_id, CooperationRequest.final_status, func.count(CooperationRequest.id))
+        .filter(
+            CooperationRequest.teacher_user_id.in_(ids),
+            CooperationRequest.final_status.in_([CooperationStatus.confirmed.value, CooperationStatus.rejected.value]),
+        )
+        .group_by(CooperationRequest.teacher_user_id, CooperationRequest.final_status)
+        .all()
+    )
+    decided = {}
+    for tid, status, cnt in decided_rows:
+        decided[(int(tid), status)] = int(cnt)
+
+    published_rows = (
+        db.session.query(TeacherPost.teacher_user_id, func.count(TeacherPost.id))
+        .filter(TeacherPost.teacher_user_id.in_(ids))
+        .group_by(TeacherPost.teacher_user_id)
+        .all()
+    )
+    published = {int(tid): int(cnt) for tid, cnt in published_rows}
+
+    # 每位教师最近 3 条已确认合作对应的项目标题
+    ranked = (
+        db.session.query(
+            CooperationRequest.teacher_user_id.label("teacher_user_id"),
+            CooperationRequest.post_id.label("post_id"),
+            func.row_number()
+            .over(
+                partition_by=CooperationRequest.teacher_user_id,
+                order_by=(CooperationRequest.created_at.desc(), CooperationRequest.id.desc()),
+            )
+            .label("rn"),
+        )
+        .filter(
+            CooperationRequest.teacher_user_id.in_(ids),
+            CooperationRequest.final_status == CooperationStatus.confirmed.value,
+        )
+        .subquery()
+    )
+    recent_rows = (
+        db.session.query(ranked.c.teacher_user_id, TeacherPost.title)
+        .join(TeacherPost, TeacherPost.id == ranked.c.post_id)
+        .filter(ranked.c.rn <= 3)
+        .order_by(ranked.c.teacher_user_id, ranked.c.rn)
+        .all()
+    )
+    recent = {}
+    for tid, title in recent_rows:
+        if title:
+            recent.setdefault(int(tid), []).append(title)
+
+    cards = {}
+    for teacher in teachers:
+        p = profiles.get(teacher.id)
+        confirmed = decided.get((teacher.id, CooperationStatus.confirmed.value), 0)
+        rejected = decided.get((teacher.id, CooperationStatus.rejected.value), 0)
+        rate = confirmed / (confirmed + rejected) if confirmed + rejected > 0 else None
+        cards[teacher.id] = {
+            "id": teacher.id,
+            "display_name": teacher.display_name,
+            "title": (p.title if p else None),
+            "organization": (p.organization if p else None),
+            "research_tags": json_loads(p.research_tags_json, []) if p else [],
+            "stats": {
+                "published_posts": published.get(teacher.id, 0),
+                "confirmed_projects": confirmed,
+                "success_rate": rate,
+            },
+            "recent_achievements": recent.get(teacher.id, []),
+        }
+    return cards
+
+
 @bp.get("/teacher-posts")
 def list_teacher_posts():
     viewer_role = _viewer_role()
@@ -120,7 +188,14 @@ def list_teacher_posts():
     if teacher_user_id and str(teacher_user_id).isdigit():
         q = q.filter_by(teacher_user_id=int(teacher_user_id))
     if keyword:
-        q = q.filter(TeacherPost.title.contains(keyword) | TeacherPost.content.contains(keyword))
+        q = q.filter(TeacherPost.id.in_(matching_ids("teacher_post", keyword)))
+    if tag:
+        q = q.filter(TeacherPost.id.in_(tagged_ids("teacher_post", "tag", tag)))
+    if tech:
+        q = q.filter(TeacherPost.id.in_(tagged_ids("teacher_post", "tech", tech)))
+    if viewer_role != Role.admin.value:
+        q = q.filter(TeacherPost.review_status == ReviewStatus.approved.value)
+    q = q.filter(_visible_to(TeacherPost.visibility, viewer_role))
 
     viewer_id = None
     if like_only or favorite_only or joined_only:
@@ -164,7 +239,13 @@ def list_teacher_posts():
             return jsonify({"items": [], "total": 0, "page": page, "page_size": page_size})
         q = q.filter(TeacherPost.id.in_(ids))
 
-    posts = q.order_by(TeacherPost.created_at.desc()).limit(2000).all()
+    total = q.count()
+    posts = (
+        q.order_by(TeacherPost.created_at.desc(), TeacherPost.id.desc())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+        .all()
+    )
 
     def project_level_from_tags(tags_list):
         tags_text = " ".join([str(x) for x in (tags_list or []) if x])
@@ -180,86 +261,14 @@ def list_teacher_posts():
             return "核心期刊"
         return "普通"
 
-    def get_confirmed_count(post_id: int) -> int:
-        """获取项目已确认的学生数量"""
-        return CooperationRequest.query.filter_by(
-            post_id=post_id,
-            final_status=CooperationStatus.confirmed.value
-        ).count()
-
-    def success_rate_for_teacher(teacher_id: int):
-        confirmed = CooperationRequest.query.filter_by(
-            teacher_user_id=teacher_id,
-            final_status=CooperationStatus.confirmed.value,
-        ).count()
-        rejected = CooperationRequest.query.filter_by(
-            teacher_user_id=teacher_id,
-            final_status=CooperationStatus.rejected.value,
-        ).count()
-        decided = confirmed + rejected
-        if decided <= 0:
-            return None, confirmed
-        return confirmed / decided, confirmed
-
-    teacher_cache = {}
-
-    def teacher_info(teacher_id: int):
-        if teacher_id in teacher_cache:
-            return teacher_cache[teacher_id]
-        teacher = User.query.get(teacher_id)
-        if not teacher:
-            teacher_cache[teacher_id] = None
-            return None
-        p = TeacherProfile.query.get(teacher_id)
-        rate, confirmed = success_rate_for_teacher(teacher_id)
-        published_posts = TeacherPost.query.filter_by(teacher_user_id=teacher_id).count()
-        recent_reqs = (
-            CooperationRequest.query.filter_by(
-                teacher_user_id=teacher_id,
-                final_status=CooperationStatus.confirmed.value,
-            )
-            .order_by(CooperationRequest.created_at.desc())
-            .limit(3)
-            .all()
-        )
-        recent_titles = []
-        for r in recent_reqs:
-            if not r.post_id:
-                continue
-            post = TeacherPost.query.get(int(r.post_id))
-            if post and post.title:
-                recent_titles.append(post.title)
-
-        info = {
-            "id": teacher.id,
-            "display_name": teacher.display_name,
-            "title": (p.title if p else None),
-            "organization": (p.organization if p else None),
-            "research_tags": json_loads(p.research_tags_json, []) if p else [],
-            "stats": {
-                "published_posts": published_posts,
-                "confirmed_projects": confirmed,
-                "success_rate": rate,
-            },
-            "recent_achievements": recent_titles,
-        }
-        teacher_cache[teacher_id] = info
-        return info
+    teacher_cards = _load_teacher_cards({p.teacher_user_id for p in posts})
 
     items = []
     for p in posts:
-        if viewer_role != Role.admin.value and p.review_status != ReviewStatus.approved.value:
-            continue
-        if not _can_view_visibility(p.visibility, viewer_role):
-            continue
         tags = json_loads(p.tags_json, [])
         techs = json_loads(p.tech_stack_json, [])
         required_roles = json_loads(p.required_roles_json, []) if hasattr(p, 'required_roles_json') and p.required_roles_json else []
-        if tag and tag not in tags:
-            continue
-        if tech and tech not in techs:
-            continue
-        tinfo = teacher_info(p.teacher_user_id)
+        tinfo = teacher_cards.get(p.teacher_user_id)
         items.append(
             {
                 "id": p.id,
@@ -272,7 +281,7 @@ def list_teacher_posts():
                 "tags": tags,
                 "required_roles": required_roles,  # 新增：招募角色标签
                 "recruit_count": p.recruit_count,
-                "confirmed_count": get_confirmed_count(p.id),  # 新增：已确认学生数量
+                "confirmed_count": p.confirmed_count or 0,  # 新增：已确认学生数量
                 "duration": p.duration,
                 "outcome": p.outcome,
                 "contact": p.contact,
@@ -285,10 +294,7 @@ def list_teacher_posts():
             }
         )
 
-    total = len(items)
-    start = (page - 1) * page_size
-    end = start + page_size
-    return jsonify({"items": items[start:end], "total": total, "page": page, "page_size": page_size})
+    return jsonify({"items": items, "total": total, "page": page, "page_size": page_size})
 
 
 @bp.post("/teacher-posts")
@@ -296,7 +302,7 @@ def list_teacher_posts():
 def create_teacher_post():
     from .role_tags import validate_role_tags
     
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or user.role != Role.teacher.value:
         return jsonify({"message": "无权限"}), 403
 
@@ -339,6 +345,10 @@ def create_teacher_post():
         updated_at=now_utc(),
     )
     db.session.add(post)
+    db.session.flush()
+    sync_entity_tags("teacher_post", post)
+    index_document("teacher_post", post)
+    mark_match_dirty("teacher_post", post, set())
     db.session.commit()
     return jsonify({"id": post.id})
 
@@ -348,7 +358,7 @@ def create_teacher_post():
 def update_teacher_post(post_id: int):
     from .role_tags import validate_role_tags
     
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or user.role != Role.teacher.value:
         return jsonify({"message": "无权限"}), 403
 
@@ -371,6 +381,7 @@ def update_teacher_post(post_id: int):
 
     # 记录旧状态用于通知
     old_status = post.project_status
+    old_terms = entity_terms("teacher_post", post.id)
 
     # 更新项目状态
     if "project_status" in data:
@@ -407,18 +418,32 @@ def update_teacher_post(post_id: int):
         post.attachment_file_id = int(data.get("attachment_file_id")) if data.get("attachment_file_id") else None
     post.updated_at = now_utc()
     post.review_status = ReviewStatus.approved.value
-    db.session.commit()
+    sync_entity_tags("teacher_post", post)
+    index_document("teacher_post", post)
+    mark_match_dirty("teacher_post", post, old_terms)
 
-    # 项目状态变更通知
+    # 项目状态变更通知，由发件箱展开给申请/收藏过该项目的学生
     new_status = post.project_status
     if old_status != new_status and new_status:
-        _notify_project_status_change(post, old_status, new_status)
+        enqueue(
+            "project_status",
+            {"post_id": post.id, "old_status": old_status, "new_status": new_status},
+            idempotency_key=f"project_status:{post.id}:{post.updated_at.isoformat()}",
+        )
+    db.session.commit()
 
     return jsonify({"ok": True})
 
 
 @bp.get("/students")
 def list_students():
+    """
+    学生目录：可见性、方向、专业、年级、技能、关键词、最低评分（min_score）等筛选都在查询中完成，
+    按 page/page_size 分页并返回总数。sort=score 按能力评分降序；
+    sort=match 按与项目的匹配度（Jaccard，与 /match/top 相同的算法）降序、能力评分次之，
+    match_post_id 指定项目，不指定时用当前教师最近的项目（即通用推荐），匹配度随每条结果返回；
+    指定 project_id 时只列出申请过该项目的学生，按能力评分降序、申请时间升序排序。
+    """
     viewer_role = _viewer_role()
     direction = (request.args.get("direction") or "").strip()
     major = (request.args.get("major") or "").strip()
@@ -426,118 +451,81 @@ def list_students():
     skill = (request.args.get("skill") or "").strip()
     keyword = (request.args.get("keyword") or "").strip()
     project_id = request.args.get("project_id")  # 新增：项目筛选参数
+    page = str(request.args.get("page", ""))
+    page = max(int(page), 1) if page.isdigit() else 1
+    page_size = str(request.args.get("page_size", ""))
+    page_size = int(page_size) if page_size.isdigit() else 20
+    if page_size <= 0 or page_size > 100:
+        page_size = 20
 
-    # 如果指定了 project_id，筛选已申请或匹配该项目的学生
+    q = (
+        db.session.query(User, StudentProfile)
+        .outerjoin(StudentProfile, StudentProfile.user_id == User.id)
+        .filter(User.is_active == True)
+        .filter(User.role == Role.student.value)
+        # 未填写画像的学生视为公开
+        .filter(or_(StudentProfile.user_id.is_(None), _visible_to(StudentProfile.visibility, viewer_role)))
+    )
+    if direction:
+        q = q.filter(or_(StudentProfile.user_id.is_(None), StudentProfile.direction == direction))
+    if major:
+        q = q.filter(StudentProfile.major.contains(major, autoescape=True))
+    if grade:
+        q = q.filter(StudentProfile.grade == grade)
+    if skill:
+        q = q.filter(User.id.in_(tagged_ids("student_profile", "skill", skill)))
+    if keyword:
+        q = q.filter(User.id.in_(matching_ids("student", keyword)))
+
+    score = func.coalesce(StudentProfile.skill_score, BASE_SKILL_SCORE)
+    min_score = request.args.get("min_score")
+    if min_score and str(min_score).isdigit():
+        q = q.filter(score >= int(min_score))
+
+    sort = (request.args.get("sort") or "").strip()
+    match = literal(0.0)
+    order_by = [User.id.asc()]
+    if sort == "score":
+        order_by = [score.desc(), User.id.asc()]
+    elif sort == "match":
+        match_post_id = request.args.get("match_post_id")
+        if match_post_id and str(match_post_id).isdigit():
+            terms = post_match_terms([int(match_post_id)])
+        elif viewer_role == Role.teacher.value:
+            terms = teacher_match_terms(current_identity().id)
+        else:
+            terms = []
+        scores = jaccard_scores_subquery("student_profile", MATCH_SIDES["student_profile"][1], terms)
+        if scores is not None:
+            q = q.outerjoin(scores, scores.c.entity_id == User.id)
+            match = func.coalesce(scores.c.score, 0.0)
+            order_by = [match.desc(), score.desc(), User.id.asc()]
+        else:
+            order_by = [score.desc(), User.id.asc()]
+    # 如果指定了 project_id，只查询申请了该项目的学生，按能力评分降序、申请时间升序（早申请的在前）
     if project_id and str(project_id).isdigit():
-        project_id = int(project_id)
-        # 查询该项目的所有合作请求
-        cooperation_requests = CooperationRequest.query.filter_by(post_id=project_id).all()
-        student_ids = [req.student_user_id for req in cooperation_requests if req.student_user_id]
-        
-        if not student_ids:
-            # 如果该项目没有任何申请，返回空列表
-            return jsonify({"items": []})
-        
-        # 只查询申请了该项目的学生
-        rows = (
-            db.session.query(User, StudentProfile)
-            .outerjoin(StudentProfile, StudentProfile.user_id == User.id)
-            .filter(User.is_active == True)
-            .filter(User.role == Role.student.value)
-            .filter(User.id.in_(student_ids))
-            .order_by(User.id.asc())
-            .limit(2000)
-            .all()
+        applied = (
+            select(CooperationRequest.student_user_id, func.min(CooperationRequest.created_at).label("applied_at"))
+            .where(CooperationRequest.post_id == int(project_id), CooperationRequest.student_user_id.isnot(None))
+            .group_by(CooperationRequest.student_user_id)
+            .subquery()
         )
-        
-        # 构建学生ID到合作请求的映射，用于后续排序
-        student_to_request = {req.student_user_id: req for req in cooperation_requests if req.student_user_id}
-    else:
-        # 没有指定项目，查询所有学生
-        rows = (
-            db.session.query(User, StudentProfile)
-            .outerjoin(StudentProfile, StudentProfile.user_id == User.id)
-            .filter(User.is_active == True)
-            .filter(User.role == Role.student.value)
-            .order_by(User.id.asc())
-            .limit(2000)
-            .all()
-        )
-        student_to_request = {}
+        q = q.join(applied, applied.c.student_user_id == User.id)
+        order_by = [score.desc(), applied.c.applied_at.asc(), User.id.asc()]
+
+    total = q.count()
+    rows = q.add_columns(match).order_by(*order_by).offset((page - 1) * page_size).limit(page_size).all()
+
+    resume_ids = {int(p.resume_file_id) for _, p, _ in rows if p and p.resume_file_id}
+    resume_files = {f.id: f for f in File.query.filter(File.id.in_(resume_ids)).all()} if resume_ids else {}
+
     items = []
-    for user, p in rows:
+    for user, p, match_score in rows:
         visibility = p.visibility if p else Visibility.public.value
-        if not _can_view_visibility(visibility, viewer_role):
-            continue
-
-        skills = json_loads(p.skills_json, []) if p else []
-        interests = json_loads(p.interests_json, []) if p else []
-        experiences = json_loads(p.experiences_json or "[]", []) if p else []
-        project_links = json_loads(p.project_links_json, []) if p else []
         resume_file = None
-        if p and p.resume_file_id:
-            f = File.query.get(int(p.resume_file_id))
-            if f:
-                resume_file = {"id": f.id, "original_name": f.original_name, "size_bytes": f.size_bytes}
-
-        if direction and p and (p.direction or "") != direction:
-            continue
-        if major and major not in (((p.major or "") if p else "")):
-            continue
-        if grade and ((p.grade or "") if p else "") != grade:
-            continue
-        if skill:
-            names = [s.get("name") for s in skills if isinstance(s, dict) and s.get("name")]
-            if skill not in names:
-                continue
-        if keyword:
-            text = " ".join(
-                [
-                    user.display_name or "",
-                    (p.major or "") if p else "",
-                    (p.grade or "") if p else "",
-                    (p.class_name or "") if p else "",
-                    (p.direction or "") if p else "",
-                    json.dumps(skills, ensure_ascii=False),
-                    json.dumps(interests, ensure_ascii=False),
-                ]
-            )
-            if keyword not in text:
-                continue
-
-        def skill_weight(level_text: str) -> float:
-            t = (level_text or "").strip()
-            if "精通" in t or "熟练" in t:
-                return 5.0
-            if "掌握" in t or "较熟练" in t:
-                return 4.0
-            if "了解" in t or "入门" in t:
-                return 2.5
-            return 3.0
-
-        skill_points = 0.0
-        for s in skills:
-            if not isinstance(s, dict):
-                continue
-            skill_points += skill_weight(str(s.get("level") or ""))
-        skill_points = min(skill_points, 35.0)
-
-        exp_points = min(len(experiences) * 7.0, 28.0)
-
-        weekly_hours = (p.weekly_hours if p else None) or 0
-        time_points = min(max(float(weekly_hours), 0.0), 20.0) / 20.0 * 10.0
-
-        link_points = min(len(project_links) * 2.0, 6.0)
-
-        score = int(min(100.0, round(20.0 + skill_points + exp_points + time_points + link_points)))
-        if score >= 85:
-            score_level = "A"
-        elif score >= 70:
-            score_level = "B"
-        elif score >= 55:
-            score_level = "C"
-        else:
-            score_level = "D"
+        f = resume_files.get(int(p.resume_file_id)) if p and p.resume_file_id else None
+        if f:
+            resume_file = {"id": f.id, "original_name": f.original_name, "size_bytes": f.size_bytes}
 
         items.append(
             {
@@ -545,16 +533,17 @@ def list_students():
                     "id": user.id,
                     "display_name": user.display_name,
                 },
-                "skill_score": score,
-                "skill_score_level": score_level,
+                "skill_score": p.skill_score if p else BASE_SKILL_SCORE,
+                "skill_score_level": p.skill_score_level if p else "D",
+                "match_score": round(float(match_score or 0), 4),
                 "major": (p.major if p else None),
                 "grade": (p.grade if p else None),
                 "class_name": (p.class_name if p else None),
                 "direction": (p.direction if p else None),
-                "skills": skills,
-                "interests": interests,
-                "project_links": project_links,
-                "experiences": experiences,
+                "skills": json_loads(p.skills_json, []) if p else [],
+                "interests": json_loads(p.interests_json, []) if p else [],
+                "project_links": json_loads(p.project_links_json, []) if p else [],
+                "experiences": json_loads(p.experiences_json or "[]", []) if p else [],
                 "resume_file": resume_file,
                 "weekly_hours": (p.weekly_hours if p else None),
                 "prefer_local": (p.prefer_local if p else False),
@@ -563,22 +552,14 @@ def list_students():
                 "updated_at": p.updated_at.isoformat() if p and p.updated_at else None,
             }
         )
-    
-    # 如果指定了项目，按匹配分数和申请时间排序
-    if project_id and student_to_request:
-        # 按匹配分数降序，然后按申请时间升序（早申请的在前）
-        items.sort(key=lambda x: (
-            -x["skill_score"],  # 匹配分数降序
-            student_to_request.get(x["user"]["id"]).created_at if student_to_request.get(x["user"]["id"]) else datetime.max
-        ))
-    
-    return jsonify({"items": items})
+
+    return jsonify({"items": items, "total": total, "page": page, "page_size": page_size})
 
 
 @bp.get("/student-profile")
 @jwt_required()
 def get_my_student_profile():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or user.role != Role.student.value:
         return jsonify({"message": "无权限"}), 403
     p = StudentProfile.query.get(user.id)
@@ -612,7 +593,7 @@ def get_my_student_profile():
 @bp.put("/student-profile")
 @jwt_required()
 def upsert_my_student_profile():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or user.role != Role.student.value:
         return jsonify({"message": "无权限"}), 403
     data = request.get_json(force=True)
@@ -620,6 +601,7 @@ def upsert_my_student_profile():
     if not p:
         p = StudentProfile(user_id=user.id)
         db.session.add(p)
+    old_terms = entity_terms("student_profile", user.id)
 
     p.major = (data.get("major") or None)
     p.grade = (data.get("grade") or None)
@@ -636,6 +618,10 @@ def upsert_my_student_profile():
     p.accept_cross = bool(data.get("accept_cross", True))
     p.visibility = data.get("visibility") or Visibility.public.value
     p.updated_at = now_utc()
+    refresh_skill_score(p)
+    sync_entity_tags("student_profile", p)
+    index_document("student", user)
+    mark_match_dirty("student_profile", p, old_terms)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -643,7 +629,7 @@ def upsert_my_student_profile():
 @bp.get("/teacher-profile")
 @jwt_required()
 def get_my_teacher_profile():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or user.role != Role.teacher.value:
         return jsonify({"message": "无权限"}), 403
     p = TeacherProfile.query.get(user.id)
@@ -662,7 +648,7 @@ def get_my_teacher_profile():
 @bp.put("/teacher-profile")
 @jwt_required()
 def upsert_my_teacher_profile():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or user.role != Role.teacher.value:
         return jsonify({"message": "无权限"}), 403
     data = request.get_json(force=True)
@@ -675,6 +661,8 @@ def upsert_my_teacher_profile():
     p.bio = (data.get("bio") or None)
     p.research_tags_json = json_dumps(ensure_list_str(data.get("research_tags")))
     p.updated_at = now_utc()
+    sync_entity_tags("teacher_profile", p)
+    mark_match_dirty("teacher_profile", p, set())
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -682,7 +670,7 @@ def upsert_my_teacher_profile():
 @bp.post("/comments")
 @jwt_required()
 def add_comment():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -708,7 +696,7 @@ def add_comment():
         created_at=now_utc(),
     )
     db.session.add(c)
-    db.session.commit()
+    db.session.flush()
 
     target_author_id = None
     if target_type == "teacher_post":
@@ -732,21 +720,24 @@ def add_comment():
         parent = Comment.query.get(parent_id)
         if parent and parent.author_user_id != user.id:
             summary = f"{user.display_name} 回复了你：{content[:60]}"
-            push_notification(
-                user_id=parent.author_user_id,
-                notif_type="comment_reply",
-                title="评论有新的回复",
-                payload={"target_type": target_type, "target_id": int(target_id), "summary": summary},
+            enqueue_notification(
+                parent.author_user_id,
+                "comment_reply",
+                "评论有新的回复",
+                {"target_type": target_type, "target_id": int(target_id), "summary": summary},
+                idempotency_key=f"comment:{c.id}:{c.created_at.isoformat()}",
             )
     elif target_author_id and target_author_id != user.id:
         summary = f"{user.display_name} 评论了你的内容：{content[:60]}"
-        push_notification(
-            user_id=target_author_id,
-            notif_type="comment_new",
-            title="内容收到新的评论",
-            payload={"target_type": target_type, "target_id": int(target_id), "summary": summary},
+        enqueue_notification(
+            target_author_id,
+            "comment_new",
+            "内容收到新的评论",
+            {"target_type": target_type, "target_id": int(target_id), "summary": summary},
+            idempotency_key=f"comment:{c.id}:{c.created_at.isoformat()}",
         )
 
+    db.session.commit()
     return jsonify({"id": c.id})
 
 
@@ -940,7 +931,7 @@ def interactions_batch_summary():
 @bp.post("/reactions/toggle")
 @jwt_required()
 def toggle_reaction():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -976,7 +967,7 @@ def toggle_reaction():
 @bp.get("/reactions")
 @jwt_required()
 def list_reactions():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     target_type = (request.args.get("target_type") or "").strip()
@@ -1073,7 +1064,7 @@ def get_student_summary(student_id):
     获取学生画像摘要信息（用于悬浮预览）
     Requirements: 3.1, 3.2, 3.3, 3.4
     """
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -1094,28 +1085,8 @@ def get_student_summary(student_id):
     interests = json_loads(profile.interests_json, []) if profile else []
     experiences = json_loads(profile.experiences_json or "[]", []) if profile else []
     
-    # 计算技能评分
-    def skill_weight(level_text: str) -> float:
-        t = (level_text or "").strip()
-        if "精通" in t or "熟练" in t:
-            return 5.0
-        if "掌握" in t or "较熟练" in t:
-            return 4.0
-        if "了解" in t or "入门" in t:
-            return 2.5
-        return 3.0
-    
-    skill_points = 0.0
-    for s in skills:
-        if isinstance(s, dict):
-            skill_points += skill_weight(str(s.get("level") or ""))
-    skill_points = min(skill_points, 35.0)
-    
-    exp_points = min(len(experiences) * 7.0, 28.0)
     weekly_hours = (profile.weekly_hours if profile else None) or 0
-    time_points = min(max(float(weekly_hours), 0.0), 20.0) / 20.0 * 10.0
-    
-    skill_score = int(min(100.0, round(20.0 + skill_points + exp_points + time_points)))
+    skill_score = profile.skill_score if profile else BASE_SKILL_SCORE
     
     # 获取最近经历（最多2个）
     recent_experiences = []
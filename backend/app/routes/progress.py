@@ -1,12 +1,13 @@
 from datetime import datetime, timedelta
 
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import jwt_required
 
 from ..extensions import db
 from ..models import CooperationProject, CooperationRequest, Milestone, ProgressUpdate, Role, TeacherPost, User
 from ..utils import now_utc
-from ..services import push_notification
+from ..services import push_notifications_bulk
+from ..rbac import current_user
 
 
 bp = Blueprint("progress", __name__)
@@ -37,16 +38,13 @@ def _notify_milestone_change(post_id: int, milestone_title: str, action: str):
     else:
         return
     
-    for student_id in student_ids:
-        try:
-            push_notification(
-                user_id=student_id,
-                notif_type=notif_type,
-                title=title,
-                payload={"summary": summary, "post_id": post_id}
-            )
-        except Exception as e:
-            print(f"发送里程碑通知失败: {e}")
+    try:
+        push_notifications_bulk(
+            [(student_id, notif_type, title, {"summary": summary, "post_id": post_id}) for student_id in student_ids]
+        )
+    except Exception as e:
+        db.session.rollback()
+        print(f"发送里程碑通知失败: {e}")
 
 
 def _project_and_request(project_id: int):
@@ -79,7 +77,7 @@ def _get_projects_by_post_id(post_id: int):
 @jwt_required()
 def list_milestones_by_post(post_id: int):
     """按post_id获取所有相关项目的里程碑"""
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -116,7 +114,7 @@ def list_milestones_by_post(post_id: int):
 @jwt_required()
 def add_milestone_by_post(post_id: int):
     """为post下的第一个项目添加里程碑"""
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -145,7 +143,7 @@ def add_milestone_by_post(post_id: int):
 @jwt_required()
 def update_milestone_by_post(post_id: int, milestone_id: int):
     """更新里程碑"""
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -175,7 +173,7 @@ def update_milestone_by_post(post_id: int, milestone_id: int):
 @jwt_required()
 def list_updates_by_post(post_id: int):
     """按post_id获取所有相关项目的进度更新"""
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -212,7 +210,7 @@ def list_updates_by_post(post_id: int):
 @jwt_required()
 def add_update_by_post(post_id: int):
     """为post下的第一个项目添加进度更新"""
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
@@ -242,7 +240,7 @@ def add_update_by_post(post_id: int):
 @bp.get("/projects/<int:project_id>/milestones")
 @jwt_required()
 def list_milestones(project_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     p, r = _project_and_request(project_id)
@@ -274,7 +272,7 @@ def list_milestones(project_id: int):
 @bp.post("/projects/<int:project_id>/milestones")
 @jwt_required()
 def add_milestone(project_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     p, r = _project_and_request(project_id)
@@ -294,7 +292,7 @@ def add_milestone(project_id: int):
 @bp.put("/projects/<int:project_id>/milestones/<int:milestone_id>")
 @jwt_required()
 def update_milestone(project_id: int, milestone_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     p, r = _project_and_request(project_id)
@@ -317,7 +315,7 @@ def update_milestone(project_id: int, milestone_id: int):
 @bp.get("/projects/<int:project_id>/updates")
 @jwt_required()
 def list_updates(project_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     p, r = _project_and_request(project_id)
@@ -343,7 +341,7 @@ def list_updates(project_id: int):
 @bp.post("/projects/<int:project_id>/updates")
 @jwt_required()
 def add_update(project_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     p, r = _project_and_request(project_id)
@@ -5,6 +5,9 @@ from flask_jwt_extended import get_jwt_identity, jwt_required, decode_token
 
 from ..extensions import db
 from ..models import Comment, File, Reaction, Resource, ReviewStatus, Role, User
+from ..rbac import current_user
+from ..search import index_document, matching_ids, remove_document
+from ..services import clear_entity_tags, sync_entity_tags, tagged_ids
 from ..utils import ensure_list_str, json_dumps, json_loads, new_storage_name, now_utc, storage_path
 
 
@@ -14,7 +17,7 @@ bp = Blueprint("resources", __name__)
 @bp.post("/files")
 @jwt_required()
 def upload_file():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     if "file" not in request.files:
@@ -57,9 +60,7 @@ def download_file(file_id: int):
         try:
             from flask_jwt_extended import verify_jwt_in_request
             verify_jwt_in_request()
-            user_id = get_jwt_identity()
-            if user_id:
-                user = User.query.get(int(user_id))
+            user = current_user()
         except Exception:
             pass
     
@@ -90,7 +91,7 @@ def download_file(file_id: int):
 @bp.post("/resources")
 @jwt_required()
 def create_resource():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -113,6 +114,9 @@ def create_resource():
         created_at=now_utc(),
     )
     db.session.add(r)
+    db.session.flush()
+    sync_entity_tags("resource", r)
+    index_document("resource", r)
     db.session.commit()
     return jsonify({"id": r.id, "review_status": r.review_status})
 
@@ -132,9 +136,9 @@ def list_resources():
     if category:
         q = q.filter_by(category=category)
     if keyword:
-        q = q.filter(Resource.title.contains(keyword) | Resource.description.contains(keyword))
+        q = q.filter(Resource.id.in_(matching_ids("resource", keyword)))
     if tag:
-        q = q.filter(Resource.tags_json.contains(tag))
+        q = q.filter(Resource.id.in_(tagged_ids("resource", "tag", tag)))
 
     if like_only or favorite_only:
         if not request.headers.get("Authorization"):
@@ -197,7 +201,7 @@ def list_resources():
 @bp.put("/resources/<int:resource_id>")
 @jwt_required()
 def update_resource(resource_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     r = Resource.query.get(resource_id)
@@ -221,6 +225,8 @@ def update_resource(resource_id: int):
         r.tags_json = json_dumps(ensure_list_str(data.get("tags")))
     if "file_id" in data and data.get("file_id"):
         r.file_id = int(data.get("file_id"))
+    sync_entity_tags("resource", r)
+    index_document("resource", r)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -228,7 +234,7 @@ def update_resource(resource_id: int):
 @bp.delete("/resources/<int:resource_id>")
 @jwt_required()
 def delete_resource(resource_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     r = Resource.query.get(resource_id)
@@ -239,6 +245,8 @@ def delete_resource(resource_id: int):
 
     Reaction.query.filter_by(target_type="resource", target_id=r.id).delete(synchronize_session=False)
     Comment.query.filter_by(target_type="resource", target_id=r.id).delete(synchronize_session=False)
+    clear_entity_tags("resource", r.id)
+    remove_document("resource", r.id)
     db.session.delete(r)
     db.session.commit()
     return jsonify({"ok": True})
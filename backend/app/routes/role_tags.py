@@ -3,10 +3,10 @@
 提供预设角色标签和自定义角色标签管理功能
 """
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import jwt_required
 
 from ..extensions import db
-from ..models import User
+from ..rbac import current_user
 
 
 bp = Blueprint("role_tags", __name__)
@@ -61,7 +61,7 @@ def add_custom_tag():
     """
     添加自定义角色标签
     """
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     
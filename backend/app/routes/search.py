@@ -0,0 +1,73 @@
+from flask import Blueprint, jsonify, request
+from sqlalchemy import and_, func, or_, select
+
+from ..extensions import db
+from ..models import ReviewStatus, Resource, Role, SearchDocument, StudentProfile, TeacherPost, User, Visibility
+from ..search import SEARCHABLE_ENTITIES, search_query
+from .posts import _viewer_role, _visible_to
+
+
+bp = Blueprint("search", __name__)
+
+
+def _visible_documents(viewer_role):
+    """与各列表接口一致的可见性条件：项目需审核通过且可见，资源需审核通过，学生需启用且档案可见"""
+    post_q = select(TeacherPost.id).where(_visible_to(TeacherPost.visibility, viewer_role))
+    if viewer_role != Role.admin.value:
+        post_q = post_q.where(TeacherPost.review_status == ReviewStatus.approved.value)
+    resource_q = select(Resource.id).where(Resource.review_status == ReviewStatus.approved.value)
+    student_q = (
+        select(User.id)
+        .outerjoin(StudentProfile, StudentProfile.user_id == User.id)
+        .where(User.is_active == True, User.role == Role.student.value)
+        .where(
+            or_(
+                StudentProfile.user_id.is_(None),
+                _visible_to(func.coalesce(StudentProfile.visibility, Visibility.public.value), viewer_role),
+            )
+        )
+    )
+    return or_(
+        and_(SearchDocument.entity_type == "teacher_post", SearchDocument.entity_id.in_(post_q)),
+        and_(SearchDocument.entity_type == "resource", SearchDocument.entity_id.in_(resource_q)),
+        SearchDocument.entity_type.in_(["forum_topic", "teamup_post"]),
+        and_(SearchDocument.entity_type == "student", SearchDocument.entity_id.in_(student_q)),
+    )
+
+
+@bp.get("/search")
+def search():
+    """
+    统一搜索：按相关度返回项目、资源、论坛话题、组队帖和学生
+    参数：q 关键词；types 逗号分隔的类型（默认全部）；page / page_size
+    """
+    keyword = (request.args.get("q") or request.args.get("keyword") or "").strip()
+    types = [t for t in (request.args.get("types") or "").split(",") if t.strip()]
+    types = [t.strip() for t in types if t.strip() in SEARCHABLE_ENTITIES]
+    page = str(request.args.get("page", ""))
+    page = max(int(page), 1) if page.isdigit() else 1
+    page_size = str(request.args.get("page_size", ""))
+    page_size = int(page_size) if page_size.isdigit() else 20
+    if page_size <= 0 or page_size > 100:
+        page_size = 20
+    if not keyword:
+        return jsonify({"items": [], "total": 0, "page": page, "page_size": page_size})
+
+    q = search_query(keyword, types or None).where(_visible_documents(_viewer_role()))
+    total = db.session.execute(select(func.count()).select_from(q.subquery())).scalar() or 0
+    rows = db.session.execute(
+        q.order_by(q.selected_columns.score.desc(), SearchDocument.id.desc())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    ).all()
+    items = [
+        {
+            "type": r.entity_type,
+            "id": r.entity_id,
+            "title": r.title,
+            "snippet": (r.body or "")[:120],
+            "score": round(float(r.score or 0.0), 4),
+        }
+        for r in rows
+    ]
+    return jsonify({"items": items, "total": total, "page": page, "page_size": page_size})
@@ -3,7 +3,10 @@ from flask_jwt_extended import get_jwt_identity, jwt_required
 
 from ..extensions import db
 from ..models import Comment, Reaction, Role, TeamupPost, User
+from ..search import index_document, matching_ids, remove_document
+from ..services import clear_entity_tags, sync_entity_tags, tagged_ids
 from ..utils import ensure_list_str, json_dumps, json_loads, now_utc
+from ..rbac import current_user
 
 
 bp = Blueprint("teamup", __name__)
@@ -21,9 +24,9 @@ def list_teamup():
         page_size = 20
     q = TeamupPost.query
     if keyword:
-        q = q.filter(TeamupPost.title.contains(keyword) | TeamupPost.content.contains(keyword))
+        q = q.filter(TeamupPost.id.in_(matching_ids("teamup_post", keyword)))
     if tag:
-        q = q.filter(TeamupPost.tags_json.contains(tag))
+        q = q.filter(TeamupPost.id.in_(tagged_ids("teamup_post", "tag", tag)))
 
     if like_only or favorite_only:
         if not request.headers.get("Authorization"):
@@ -78,7 +81,7 @@ def list_teamup():
 @bp.post("/teamup")
 @jwt_required()
 def create_teamup():
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     data = request.get_json(force=True)
@@ -96,6 +99,9 @@ def create_teamup():
         created_at=now_utc(),
     )
     db.session.add(p)
+    db.session.flush()
+    sync_entity_tags("teamup_post", p)
+    index_document("teamup_post", p)
     db.session.commit()
     return jsonify({"id": p.id})
 
@@ -103,7 +109,7 @@ def create_teamup():
 @bp.put("/teamup/<int:post_id>")
 @jwt_required()
 def update_teamup(post_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     p = TeamupPost.query.get(post_id)
@@ -125,6 +131,8 @@ def update_teamup(post_id: int):
         p.needed_roles_json = json_dumps(ensure_list_str(data.get("needed_roles")))
     if "tags" in data:
         p.tags_json = json_dumps(ensure_list_str(data.get("tags")))
+    sync_entity_tags("teamup_post", p)
+    index_document("teamup_post", p)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -132,7 +140,7 @@ def update_teamup(post_id: int):
 @bp.delete("/teamup/<int:post_id>")
 @jwt_required()
 def delete_teamup(post_id: int):
-    user = User.query.get(int(get_jwt_identity()))
+    user = current_user()
     if not user or not user.is_active:
         return jsonify({"message": "未登录"}), 401
     p = TeamupPost.query.get(post_id)
@@ -143,6 +151,8 @@ def delete_teamup(post_id: int):
 
     Reaction.query.filter_by(target_type="teamup_post", target_id=p.id).delete(synchronize_session=False)
     Comment.query.filter_by(target_type="teamup_post", target_id=p.id).delete(synchronize_session=False)
+    clear_entity_tags("teamup_post", p.id)
+    remove_document("teamup_post", p.id)
     db.session.delete(p)
     db.session.commit()
     return jsonify({"ok": True})
@@ -0,0 +1,313 @@
+"""
+全文检索
+
+所有可按关键词搜索的内容都在 search_documents 中保存一份 (标题, 正文) 快照：
+- SQLite：外部内容 FTS5 虚表 search_documents_fts（trigram 分词，支持中文子串），由触发器随主表增量同步
+- MySQL：search_documents(title, body) 上的 FULLTEXT 索引（ngram 解析器）
+关键词过短（trigram 需要 >= 3 个字符）或索引不可用时退化为 search_documents 上的 LIKE。
+
+写入内容的接口调用 index_document / remove_document，提交由调用方负责。
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Float, Integer, and_, event, insert, literal, or_, select, text
+
+from .extensions import db
+from .models import ForumTopic, Resource, Role, SearchDocument, StudentProfile, TeacherPost, TeamupPost, User
+from .utils import json_loads, now_utc
+
+
+FTS_TABLE = "search_documents_fts"
+MYSQL_FULLTEXT_INDEX = "ft_search_documents"
+# MariaDB 连接串下方言名为 mariadb，与 MySQL 走同一套 FULLTEXT 逻辑
+MYSQL_DIALECTS = {"mysql", "mariadb"}
+
+_SQLITE_FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, body, content='search_documents', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    f"CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+    f"CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+
+# 每个引擎的全文索引是否可用，建表/删表时失效
+_fts_ready: Dict[str, bool] = {}
+
+
+def _engine_key(bind) -> str:
+    return str(getattr(bind, "engine", bind).url)
+
+
+def create_fulltext_index(conn) -> bool:
+    """在已有的 search_documents 上建立全文索引，返回是否成功（SQLite 缺少 FTS5/trigram 时失败）"""
+    dialect = conn.dialect.name
+    try:
+        if dialect == "sqlite":
+            for ddl in _SQLITE_FTS_DDL:
+                conn.exec_driver_sql(ddl)
+        elif dialect in MYSQL_DIALECTS:
+            exists = conn.execute(
+                text(
+                    "SELECT COUNT(*) FROM information_schema.STATISTICS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'search_documents' AND INDEX_NAME = :name"
+                ),
+                {"name": MYSQL_FULLTEXT_INDEX},
+            ).scalar()
+            if not exists:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE search_documents ADD FULLTEXT INDEX {MYSQL_FULLTEXT_INDEX} (title, body) WITH PARSER ngram"
+                )
+        else:
+            return False
+    except Exception:
+        _fts_ready[_engine_key(conn)] = False
+        return False
+    _fts_ready.pop(_engine_key(conn), None)
+    return True
+
+
+def rebuild_fulltext_index(conn):
+    """按 search_documents 全量重建 FTS5 内容（MySQL 的 FULLTEXT 索引无需手动重建）"""
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+@event.listens_for(SearchDocument.__table__, "after_create")
+def _after_create(target, connection, **kw):
+    create_fulltext_index(connection)
+
+
+@event.listens_for(SearchDocument.__table__, "before_drop")
+def _before_drop(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        # 触发器随 search_documents 一起删除，虚表需要单独删
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _fts_ready.pop(_engine_key(connection), None)
+
+
+def fulltext_available() -> bool:
+    key = _engine_key(db.engine)
+    if key not in _fts_ready:
+        dialect = db.engine.dialect.name
+        if dialect == "sqlite":
+            found = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+            ).first()
+        elif dialect in MYSQL_DIALECTS:
+            found = db.session.execute(
+                text(
+                    "SELECT 1 FROM information_schema.STATISTICS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'search_documents' AND INDEX_NAME = :name"
+                ),
+                {"name": MYSQL_FULLTEXT_INDEX},
+            ).first()
+        else:
+            found = None
+        _fts_ready[key] = found is not None
+    return _fts_ready[key]
+
+
+def _join(*parts) -> str:
+    return " ".join(str(p).strip() for p in parts if p is not None and str(p).strip())
+
+
+def _json_words(raw) -> str:
+    words = []
+    for v in json_loads(raw, []) or []:
+        if isinstance(v, dict):
+            v = v.get("name")
+        if v:
+            words.append(str(v))
+    return " ".join(words)
+
+
+def _teacher_post_document(post: TeacherPost) -> Tuple[str, str]:
+    return post.title or "", _join(
+        post.content,
+        post.detailed_info,
+        _json_words(post.tags_json),
+        _json_words(post.tech_stack_json),
+        _json_words(post.required_roles_json),
+    )
+
+
+def _resource_document(res: Resource) -> Tuple[str, str]:
+    return res.title or "", _join(res.description, _json_words(res.tags_json))
+
+
+def _forum_topic_document(topic: ForumTopic) -> Tuple[str, str]:
+    return topic.title or "", _join(topic.content, _json_words(topic.tags_json))
+
+
+def _teamup_post_document(post: TeamupPost) -> Tuple[str, str]:
+    return post.title or "", _join(post.content, _json_words(post.tags_json), _json_words(post.needed_roles_json))
+
+
+def _student_document(user: User) -> Tuple[str, str]:
+    p = db.session.get(StudentProfile, user.id)
+    if not p:
+        return user.display_name or "", ""
+    return user.display_name or "", _join(
+        p.major,
+        p.grade,
+        p.class_name,
+        p.direction,
+        _json_words(p.skills_json),
+        _json_words(p.interests_json),
+    )
+
+
+# entity_type -> (模型, 额外过滤条件, 文档构造函数)；学生以 users.id 为实体 id，未填写档案的学生也能按姓名搜到
+SEARCHABLE_ENTITIES = {
+    "teacher_post": (TeacherPost, None, _teacher_post_document),
+    "resource": (Resource, None, _resource_document),
+    "forum_topic": (ForumTopic, None, _forum_topic_document),
+    "teamup_post": (TeamupPost, None, _teamup_post_document),
+    "student": (User, User.role == Role.student.value, _student_document),
+}
+
+
+def index_document(entity_type: str, obj):
+    """新增或更新一条检索文档，调用方负责提交（新对象需先 flush 以获得主键）"""
+    _, _, build = SEARCHABLE_ENTITIES[entity_type]
+    title, body = build(obj)
+    doc = SearchDocument.query.filter_by(entity_type=entity_type, entity_id=obj.id).first()
+    if not doc:
+        doc = SearchDocument(entity_type=entity_type, entity_id=obj.id)
+        db.session.add(doc)
+    doc.title = title[:255]
+    doc.body = body
+    doc.updated_at = now_utc()
+
+
+def insert_documents(entity_type: str, docs: List[Tuple[int, str, str]]):
+    """为刚创建的一批实体插入检索文档（一次 executemany），docs 为 (实体 id, 标题, 正文)，调用方负责提交"""
+    if not docs:
+        return
+    now = now_utc()
+    db.session.execute(
+        insert(SearchDocument),
+        [
+            {"entity_type": entity_type, "entity_id": entity_id, "title": (title or "")[:255], "body": body or "", "updated_at": now}
+            for entity_id, title, body in docs
+        ],
+    )
+
+
+def remove_document(entity_type: str, entity_id: int):
+    SearchDocument.query.filter_by(entity_type=entity_type, entity_id=int(entity_id)).delete(
+        synchronize_session=False
+    )
+
+
+def rebuild_search_documents(batch_size: int = 500) -> int:
+    """清空并按源表重建 search_documents（全文索引随触发器/FULLTEXT 同步），返回文档数"""
+    SearchDocument.query.delete(synchronize_session=False)
+    total = 0
+    for entity_type, (model, extra, build) in SEARCHABLE_ENTITIES.items():
+        last_id = 0
+        while True:
+            q = model.query.filter(model.id > last_id)
+            if extra is not None:
+                q = q.filter(extra)
+            objs = q.order_by(model.id.asc()).limit(batch_size).all()
+            if not objs:
+                break
+            last_id = objs[-1].id
+            rows = []
+            for obj in objs:
+                title, body = build(obj)
+                rows.append(
+                    {
+                        "entity_type": entity_type,
+                        "entity_id": obj.id,
+                        "title": title[:255],
+                        "body": body,
+                        "updated_at": now_utc(),
+                    }
+                )
+            db.session.bulk_insert_mappings(SearchDocument, rows)
+            total += len(rows)
+    db.session.commit()
+    return total
+
+
+def _terms(keyword: str) -> List[str]:
+    return [t for t in (keyword or "").split() if t][:8]
+
+
+def _ranked_documents(keyword: str):
+    """
+    命中关键词的文档子查询，列为 (doc_id, score)，score 越大越相关。
+    多个空格分隔的词之间为“且”关系。
+    """
+    terms = _terms(keyword)
+    dialect = db.engine.dialect.name
+    use_fts = bool(terms) and fulltext_available()
+    if use_fts and dialect == "sqlite" and min(len(t) for t in terms) < 3:
+        use_fts = False
+    if use_fts and dialect in MYSQL_DIALECTS and min(len(t) for t in terms) < 2:
+        use_fts = False
+
+    if use_fts and dialect == "sqlite":
+        query = " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        return (
+            text(
+                f"SELECT rowid AS doc_id, -bm25({FTS_TABLE}) AS score "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query"
+            )
+            .bindparams(fts_query=query)
+            .columns(doc_id=Integer, score=Float)
+            .subquery("ranked_docs")
+        )
+    if use_fts and dialect in MYSQL_DIALECTS:
+        query = " ".join('+"' + t.replace('"', " ") + '"' for t in terms)
+        return (
+            text(
+                "SELECT id AS doc_id, MATCH (title, body) AGAINST (:fts_query IN BOOLEAN MODE) AS score "
+                "FROM search_documents WHERE MATCH (title, body) AGAINST (:fts_query IN BOOLEAN MODE)"
+            )
+            .bindparams(fts_query=query)
+            .columns(doc_id=Integer, score=Float)
+            .subquery("ranked_docs")
+        )
+
+    conds = [
+        or_(SearchDocument.title.contains(t, autoescape=True), SearchDocument.body.contains(t, autoescape=True))
+        for t in terms
+    ]
+    return (
+        select(SearchDocument.id.label("doc_id"), literal(0.0, Float).label("score"))
+        .where(and_(*conds) if conds else literal(False))
+        .subquery("ranked_docs")
+    )
+
+
+def matching_ids(entity_type: str, keyword: str):
+    """命中关键词的实体 id 子查询，用于 Model.id.in_(...)"""
+    ranked = _ranked_documents(keyword)
+    return (
+        select(SearchDocument.entity_id)
+        .join(ranked, ranked.c.doc_id == SearchDocument.id)
+        .where(SearchDocument.entity_type == entity_type)
+    )
+
+
+def search_query(keyword: str, entity_types: Optional[List[str]] = None):
+    """按相关度排序的检索结果查询，列为 (entity_type, entity_id, title, body, score)"""
+    ranked = _ranked_documents(keyword)
+    q = select(
+        SearchDocument.entity_type,
+        SearchDocument.entity_id,
+        SearchDocument.title,
+        SearchDocument.body,
+        ranked.c.score,
+    ).join(ranked, ranked.c.doc_id == SearchDocument.id)
+    if entity_types:
+        q = q.where(SearchDocument.entity_type.in_(entity_types))
+    return q
@@ -1,7 +1,33 @@
+import heapq
 import json
-from typing import Dict, List, Tuple
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
 
-from .models import CooperationRequest, CooperationStatus, Notification, ReviewStatus, Role, StudentProfile, TeacherPost, User
+from flask import current_app
+from sqlalchemy import Float, case, cast, func, insert, or_, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .models import (
+    Conversation,
+    CooperationRequest,
+    CooperationStatus,
+    EntityTag,
+    ForumTopic,
+    Message,
+    Notification,
+    RecommendationCache,
+    Resource,
+    ReviewStatus,
+    Role,
+    StudentProfile,
+    TeacherPost,
+    TeacherProfile,
+    TeamupPost,
+    User,
+    UserCounter,
+)
+from .realtime import hub, user_channel
 from .utils import json_dumps, json_loads, now_utc
 from .extensions import db
 
@@ -19,6 +45,319 @@ def has_blocking_pending_selection(user_id: int) -> bool:
     return False
 
 
+def bump_confirmed_count(post_id: Optional[int], before_status: Optional[str], after_status: Optional[str]):
+    """
+    合作请求 final_status 变化时维护 teacher_posts.confirmed_count
+    只加入当前会话，随调用方的事务一起提交；after_status 为 None 表示请求被删除
+    """
+    if not post_id:
+        return
+    confirmed = CooperationStatus.confirmed.value
+    delta = int(after_status == confirmed) - int(before_status == confirmed)
+    if not delta:
+        return
+    TeacherPost.query.filter_by(id=int(post_id)).update(
+        {TeacherPost.confirmed_count: TeacherPost.confirmed_count + delta},
+        synchronize_session=False,
+    )
+
+
+def rebuild_confirmed_counts() -> int:
+    """按 cooperation_requests 重新计算所有项目的 confirmed_count，返回修正的项目数"""
+    actual = (
+        select(func.count(CooperationRequest.id))
+        .where(
+            CooperationRequest.post_id == TeacherPost.id,
+            CooperationRequest.final_status == CooperationStatus.confirmed.value,
+        )
+        .scalar_subquery()
+    )
+    drifted = db.session.query(func.count(TeacherPost.id)).filter(TeacherPost.confirmed_count != actual).scalar() or 0
+    if drifted:
+        db.session.query(TeacherPost).update({TeacherPost.confirmed_count: actual}, synchronize_session=False)
+    db.session.commit()
+    return int(drifted)
+
+
+def unread_count_subquery(reader_column):
+    """会话中发给 reader_column 一方（teacher_user_id / student_user_id）且未读的消息数"""
+    return (
+        select(func.count(Message.id))
+        .where(
+            Message.conversation_id == Conversation.id,
+            Message.is_read == False,
+            Message.sender_user_id != reader_column,
+        )
+        .scalar_subquery()
+    )
+
+
+def rebuild_conversation_summaries() -> int:
+    """按 messages 重新计算所有会话的最后一条消息与双方未读数，返回会话数"""
+    last_id = select(func.max(Message.id)).where(Message.conversation_id == Conversation.id).scalar_subquery()
+    last_at = select(func.max(Message.created_at)).where(Message.conversation_id == Conversation.id).scalar_subquery()
+    total = db.session.query(func.count(Conversation.id)).scalar() or 0
+    db.session.query(Conversation).update(
+        {
+            Conversation.last_message_id: last_id,
+            Conversation.last_message_at: func.coalesce(last_at, Conversation.created_at),
+            Conversation.teacher_unread: unread_count_subquery(Conversation.teacher_user_id),
+            Conversation.student_unread: unread_count_subquery(Conversation.student_user_id),
+        },
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return int(total)
+
+
+def _unread_notifications_sql(user_id):
+    return (
+        select(func.count(Notification.id))
+        .where(Notification.user_id == user_id, Notification.is_read == False)
+        .scalar_subquery()
+    )
+
+
+def _unread_messages_sql(user_id):
+    """按会话摘要中的未读数汇总（user_id 可以是值或列）"""
+    as_teacher = select(func.coalesce(func.sum(Conversation.teacher_unread), 0)).where(
+        Conversation.teacher_user_id == user_id
+    )
+    as_student = select(func.coalesce(func.sum(Conversation.student_unread), 0)).where(
+        Conversation.student_user_id == user_id
+    )
+    return as_teacher.scalar_subquery() + as_student.scalar_subquery()
+
+
+def _counter_upsert(dialect: str, user_id: int, on_conflict: Optional[Dict] = None):
+    """
+    按源表计算并插入用户的计数行（单条语句，不先查后写）。
+    行已存在时执行 on_conflict 中的更新，为空则保持原值不变。
+    """
+    values = {
+        "user_id": user_id,
+        "unread_notifications": _unread_notifications_sql(user_id),
+        "unread_messages": _unread_messages_sql(user_id),
+    }
+    if dialect == "sqlite":
+        stmt = sqlite_insert(UserCounter).values(values)
+        if on_conflict:
+            return stmt.on_conflict_do_update(index_elements=["user_id"], set_=on_conflict)
+        return stmt.on_conflict_do_nothing(index_elements=["user_id"])
+    stmt = mysql_insert(UserCounter).values(values)
+    return stmt.on_duplicate_key_update(on_conflict or {"user_id": UserCounter.user_id})
+
+
+def get_user_counters(user_id: int) -> UserCounter:
+    """
+    读取用户的未读计数（一次主键查询）。
+    计数行不存在时在独立的连接中按源表建立并提交，不影响调用方会话中的事务；
+    此时返回的对象不属于当前会话，只用于读取计数。
+    """
+    user_id = int(user_id)
+    with db.session.no_autoflush:
+        row = db.session.get(UserCounter, user_id, populate_existing=True)
+    if row:
+        return row
+    with db.engine.begin() as conn:
+        conn.execute(_counter_upsert(conn.dialect.name, user_id))
+        notifications, messages = conn.execute(
+            select(UserCounter.unread_notifications, UserCounter.unread_messages).where(UserCounter.user_id == user_id)
+        ).one()
+    return UserCounter(user_id=user_id, unread_notifications=int(notifications), unread_messages=int(messages))
+
+
+def bump_user_counters(user_ids, notifications: int = 0, messages: int = 0):
+    """
+    增减一批用户的未读计数，只加入当前会话，随调用方的事务一起提交。
+    尚未建立计数行的用户在同一事务中按源表建立（源表此时已包含本次变更，不再叠加增量）；
+    若并发请求抢先建立了计数行，则改为在该行上叠加增量，不会丢失本次变更。
+    """
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    values = {}
+    for col, delta in ((UserCounter.unread_notifications, notifications), (UserCounter.unread_messages, messages)):
+        if delta:
+            values[col] = case((col + delta < 0, 0), else_=col + delta)
+    user_ids = {int(u) for u in user_ids}
+    if not values or not user_ids:
+        return
+    updated = UserCounter.query.filter(UserCounter.user_id.in_(user_ids)).update(values, synchronize_session=False)
+    if updated >= len(user_ids):
+        return
+    existing = {u for (u,) in db.session.query(UserCounter.user_id).filter(UserCounter.user_id.in_(user_ids))}
+    dialect = db.session.get_bind().dialect.name
+    on_conflict = {col.key: expr for col, expr in values.items()}
+    for user_id in sorted(user_ids - existing):
+        db.session.execute(_counter_upsert(dialect, user_id, on_conflict))
+
+
+def rebuild_user_counters() -> int:
+    """按通知表与会话摘要重新计算已建立的用户未读计数，返回修正的用户数"""
+    notifications = _unread_notifications_sql(UserCounter.user_id)
+    messages = _unread_messages_sql(UserCounter.user_id)
+    drifted = (
+        db.session.query(func.count(UserCounter.user_id))
+        .filter(or_(UserCounter.unread_notifications != notifications, UserCounter.unread_messages != messages))
+        .scalar()
+        or 0
+    )
+    if drifted:
+        db.session.query(UserCounter).update(
+            {UserCounter.unread_notifications: notifications, UserCounter.unread_messages: messages},
+            synchronize_session=False,
+        )
+    db.session.commit()
+    return int(drifted)
+
+
+# entity_type -> (模型, 主键字段, {kind: JSON 标签字段})
+TAGGED_ENTITIES = {
+    "teacher_post": (TeacherPost, "id", {"tag": "tags_json", "tech": "tech_stack_json", "role": "required_roles_json"}),
+    "resource": (Resource, "id", {"tag": "tags_json"}),
+    "forum_topic": (ForumTopic, "id", {"tag": "tags_json"}),
+    "teamup_post": (TeamupPost, "id", {"tag": "tags_json", "role": "needed_roles_json"}),
+    "student_profile": (StudentProfile, "user_id", {"interest": "interests_json", "skill": "skills_json"}),
+    "teacher_profile": (TeacherProfile, "user_id", {"research": "research_tags_json"}),
+}
+
+
+def normalize_tag(value) -> str:
+    return str(value).strip().lower()[:128]
+
+
+def _tag_rows(entity_type: str, obj) -> List[Dict]:
+    _, pk, fields = TAGGED_ENTITIES[entity_type]
+    entity_id = getattr(obj, pk)
+    rows = []
+    seen = set()
+    for kind, field in fields.items():
+        for value in json_loads(getattr(obj, field, None), []) or []:
+            # skills_json 中的元素是 {"name": ..., "level": ...}
+            if isinstance(value, dict):
+                value = value.get("name")
+            if value is None:
+                continue
+            text = str(value).strip()[:128]
+            norm = normalize_tag(text)
+            if not norm or (kind, norm) in seen:
+                continue
+            seen.add((kind, norm))
+            rows.append(
+                {"entity_type": entity_type, "entity_id": entity_id, "kind": kind, "tag": text, "tag_normalized": norm}
+            )
+    return rows
+
+
+def sync_entity_tags(entity_type: str, obj):
+    """按对象当前的 JSON 标签字段重建其索引行，调用方负责提交（新对象需先 flush 以获得主键）"""
+    _, pk, _ = TAGGED_ENTITIES[entity_type]
+    clear_entity_tags(entity_type, getattr(obj, pk))
+    for row in _tag_rows(entity_type, obj):
+        db.session.add(EntityTag(**row))
+
+
+def clear_entity_tags(entity_type: str, entity_id: int):
+    EntityTag.query.filter_by(entity_type=entity_type, entity_id=int(entity_id)).delete(synchronize_session=False)
+
+
+def tagged_ids(entity_type: str, kind: str, tag: str):
+    """带有某个标签的实体 id 子查询，用于 Model.id.in_(...)"""
+    return select(EntityTag.entity_id).where(
+        EntityTag.entity_type == entity_type,
+        EntityTag.kind == kind,
+        EntityTag.tag_normalized == normalize_tag(tag),
+    )
+
+
+def rebuild_entity_tags(batch_size: int = 500) -> int:
+    """清空并按源表重建 entity_tags，返回写入的行数"""
+    EntityTag.query.delete(synchronize_session=False)
+    total = 0
+    for entity_type, (model, pk, _) in TAGGED_ENTITIES.items():
+        pk_col = getattr(model, pk)
+        last_id = 0
+        while True:
+            objs = model.query.filter(pk_col > last_id).order_by(pk_col.asc()).limit(batch_size).all()
+            if not objs:
+                break
+            last_id = getattr(objs[-1], pk)
+            rows = []
+            for obj in objs:
+                rows.extend(_tag_rows(entity_type, obj))
+            if rows:
+                db.session.bulk_insert_mappings(EntityTag, rows)
+                total += len(rows)
+    db.session.commit()
+    return total
+
+
+# 没有任何技能、经历、投入时间和项目链接时的基础分
+BASE_SKILL_SCORE = 20
+
+
+def _skill_weight(level_text: str) -> float:
+    t = (level_text or "").strip()
+    if "精通" in t or "熟练" in t:
+        return 5.0
+    if "掌握" in t or "较熟练" in t:
+        return 4.0
+    if "了解" in t or "入门" in t:
+        return 2.5
+    return 3.0
+
+
+def student_skill_score(p: Optional[StudentProfile]) -> Tuple[int, str]:
+    """学生能力评分（0-100）与等级：基础分 + 技能等级（≤35）+ 经历（≤28）+ 每周投入时间（≤10）+ 项目链接（≤6）"""
+    if not p:
+        return BASE_SKILL_SCORE, "D"
+    skills = json_loads(p.skills_json, []) or []
+    experiences = json_loads(p.experiences_json or "[]", []) or []
+    project_links = json_loads(p.project_links_json, []) or []
+
+    skill_points = min(sum(_skill_weight(str(s.get("level") or "")) for s in skills if isinstance(s, dict)), 35.0)
+    exp_points = min(len(experiences) * 7.0, 28.0)
+    weekly_hours = p.weekly_hours or 0
+    time_points = min(max(float(weekly_hours), 0.0), 20.0) / 20.0 * 10.0
+    link_points = min(len(project_links) * 2.0, 6.0)
+
+    score = int(min(100.0, round(BASE_SKILL_SCORE + skill_points + exp_points + time_points + link_points)))
+    if score >= 85:
+        return score, "A"
+    if score >= 70:
+        return score, "B"
+    if score >= 55:
+        return score, "C"
+    return score, "D"
+
+
+def refresh_skill_score(p: StudentProfile):
+    p.skill_score, p.skill_score_level = student_skill_score(p)
+
+
+def rebuild_skill_scores(batch_size: int = 500) -> int:
+    """按画像内容重新计算所有学生的能力评分，返回修正的画像数"""
+    changed = 0
+    last_id = 0
+    while True:
+        profiles = (
+            StudentProfile.query.filter(StudentProfile.user_id > last_id)
+            .order_by(StudentProfile.user_id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not profiles:
+            break
+        last_id = profiles[-1].user_id
+        for p in profiles:
+            score, level = student_skill_score(p)
+            if (p.skill_score, p.skill_score_level) != (score, level):
+                p.skill_score, p.skill_score_level = score, level
+                changed += 1
+        db.session.commit()
+    return changed
+
+
 def similarity_score(a: List[str], b: List[str]) -> float:
     sa = {x.strip().lower() for x in a if str(x).strip()}
     sb = {x.strip().lower() for x in b if str(x).strip()}
@@ -31,6 +370,98 @@ def similarity_score(a: List[str], b: List[str]) -> float:
     return len(inter) / len(union)
 
 
+def _jaccard_parts(entity_type: str, kinds: List[str], query_terms: set, scope=None):
+    """各实体每类标签与 query_terms 的交集大小（hits）和标签总数（sizes）子查询，只包含至少命中一个词的实体"""
+    hit_q = select(EntityTag.entity_id, EntityTag.kind, func.count().label("inter")).where(
+        EntityTag.entity_type == entity_type,
+        EntityTag.kind.in_(kinds),
+        EntityTag.tag_normalized.in_(query_terms),
+    )
+    if scope is not None:
+        hit_q = hit_q.where(EntityTag.entity_id.in_(scope))
+    hits = hit_q.group_by(EntityTag.entity_id, EntityTag.kind).subquery()
+    sizes = (
+        select(EntityTag.entity_id, EntityTag.kind, func.count().label("size"))
+        .where(
+            EntityTag.entity_type == entity_type,
+            EntityTag.kind.in_(kinds),
+            EntityTag.entity_id.in_(select(hits.c.entity_id)),
+        )
+        .group_by(EntityTag.entity_id, EntityTag.kind)
+        .subquery()
+    )
+    return hits, sizes
+
+
+def jaccard_matches(entity_type: str, kinds: List[str], terms: List[str], scope=None) -> Dict[int, float]:
+    """
+    在 entity_tags 倒排索引上计算 terms 与各实体每类标签集合的 Jaccard 相似度，返回 {entity_id: 各类中的最大值}。
+    只访问至少命中一个词的实体，代价与命中的实体数成正比；scope 为可选的 id 子查询，用于限定候选范围。
+    """
+    query_terms = {normalize_tag(t) for t in terms if t is not None} - {""}
+    if not query_terms:
+        return {}
+    hits, sizes = _jaccard_parts(entity_type, kinds, query_terms, scope)
+    rows = db.session.execute(
+        select(hits.c.entity_id, hits.c.inter, sizes.c.size).join(
+            sizes, (sizes.c.entity_id == hits.c.entity_id) & (sizes.c.kind == hits.c.kind)
+        )
+    ).all()
+    n = len(query_terms)
+    scores: Dict[int, float] = {}
+    for entity_id, inter, size in rows:
+        score = inter / (n + size - inter)
+        if score > scores.get(entity_id, 0.0):
+            scores[entity_id] = score
+    return scores
+
+
+def jaccard_scores_subquery(entity_type: str, kinds: List[str], terms: List[str], scope=None):
+    """
+    与 jaccard_matches 相同的相似度，以 (entity_id, score) 子查询返回，供列表查询外连接后在 SQL 中排序分页；
+    没有有效的词时返回 None。
+    """
+    query_terms = {normalize_tag(t) for t in terms if t is not None} - {""}
+    if not query_terms:
+        return None
+    hits, sizes = _jaccard_parts(entity_type, kinds, query_terms, scope)
+    score = cast(hits.c.inter, Float) / (len(query_terms) + sizes.c.size - hits.c.inter)
+    return (
+        select(hits.c.entity_id, func.max(score).label("score"))
+        .join(sizes, (sizes.c.entity_id == hits.c.entity_id) & (sizes.c.kind == hits.c.kind))
+        .group_by(hits.c.entity_id)
+        .subquery()
+    )
+
+
+def post_match_terms(post_ids) -> List[str]:
+    """项目参与匹配的规范化标签（标签与技术栈），post_ids 可以是 id 列表或子查询"""
+    return list(
+        db.session.execute(
+            select(EntityTag.tag_normalized)
+            .where(
+                EntityTag.entity_type == "teacher_post",
+                EntityTag.entity_id.in_(post_ids),
+                EntityTag.kind.in_(MATCH_SIDES["teacher_post"][1]),
+            )
+            .distinct()
+        ).scalars()
+    )
+
+
+def teacher_match_terms(teacher_user_id: int) -> List[str]:
+    """为教师推荐学生时参与匹配的标签：最近 50 个已审核通过的项目的标签与技术栈"""
+    post_ids = [
+        pid
+        for (pid,) in db.session.query(TeacherPost.id)
+        .filter(TeacherPost.teacher_user_id == teacher_user_id, TeacherPost.review_status == ReviewStatus.approved.value)
+        .order_by(TeacherPost.created_at.desc())
+        .limit(50)
+        .all()
+    ]
+    return post_match_terms(post_ids) if post_ids else []
+
+
 def recommend_teacher_posts_for_student(student_user_id: int, limit: int = 10):
     profile = StudentProfile.query.get(student_user_id)
     if not profile:
@@ -40,58 +471,234 @@ def recommend_teacher_posts_for_student(student_user_id: int, limit: int = 10):
     skill_names = [s.get("name") for s in skills if isinstance(s, dict) and s.get("name")]
     base = interests + skill_names
 
-    posts = TeacherPost.query.filter_by(review_status=ReviewStatus.approved.value).order_by(TeacherPost.created_at.desc()).limit(300).all()
-    scored: List[Tuple[float, TeacherPost]] = []
-    for p in posts:
-        tags = json_loads(p.tags_json, [])
-        tech = json_loads(p.tech_stack_json, [])
-        score = max(similarity_score(base, tags), similarity_score(base, tech))
-        if score > 0:
-            scored.append((score, p))
-    scored.sort(key=lambda x: (-x[0], -x[1].id))
-    return [{"id": p.id, "title": p.title, "post_type": p.post_type, "score": round(s, 4)} for s, p in scored[:limit]]
+    approved = select(TeacherPost.id).where(TeacherPost.review_status == ReviewStatus.approved.value)
+    scores = jaccard_matches("teacher_post", ["tag", "tech"], base, scope=approved)
+    top = heapq.nlargest(limit, scores.items(), key=lambda x: (x[1], x[0]))
+    posts = {p.id: p for p in TeacherPost.query.filter(TeacherPost.id.in_([pid for pid, _ in top]))} if top else {}
+    return [
+        {"id": pid, "title": posts[pid].title, "post_type": posts[pid].post_type, "score": round(s, 4)}
+        for pid, s in top
+        if pid in posts
+    ]
 
 
 def recommend_students_for_teacher(teacher_user_id: int, limit: int = 10):
-    posts = TeacherPost.query.filter_by(teacher_user_id=teacher_user_id, review_status=ReviewStatus.approved.value).order_by(TeacherPost.created_at.desc()).limit(50).all()
-    desired: List[str] = []
-    for p in posts:
-        desired.extend(json_loads(p.tags_json, []))
-        desired.extend(json_loads(p.tech_stack_json, []))
-    desired = [x for x in desired if str(x).strip()]
-    profiles = StudentProfile.query.limit(500).all()
-    scored: List[Tuple[float, StudentProfile, User]] = []
-    for sp in profiles:
-        user = User.query.get(sp.user_id)
-        if not user or not user.is_active or user.role != Role.student.value:
-            continue
-        interests = json_loads(sp.interests_json, [])
-        skills = json_loads(sp.skills_json, [])
-        skill_names = [s.get("name") for s in skills if isinstance(s, dict) and s.get("name")]
-        score = max(similarity_score(desired, interests), similarity_score(desired, skill_names))
-        if score > 0:
-            scored.append((score, sp, user))
-    scored.sort(key=lambda x: (-x[0], -x[1].user_id))
-    return [
-        {"user_id": sp.user_id, "display_name": user.display_name, "score": round(s, 4)}
-        for s, sp, user in scored[:limit]
-    ]
+    desired = teacher_match_terms(teacher_user_id)
 
+    # 所有启用的学生一次性参与打分，只有与 desired 有交集的学生会被访问
+    active_students = select(User.id).where(User.is_active == True, User.role == Role.student.value)
+    scores = jaccard_matches("student_profile", ["interest", "skill"], desired, scope=active_students)
+    top = heapq.nlargest(limit, scores.items(), key=lambda x: (x[1], x[0]))
+    names = {}
+    if top:
+        names = dict(db.session.query(User.id, User.display_name).filter(User.id.in_([uid for uid, _ in top])).all())
+    return [{"user_id": uid, "display_name": names.get(uid), "score": round(s, 4)} for uid, s in top]
 
-def push_notification(user_id: int, notif_type: str, title: str, payload: Dict):
-    n = Notification(
-        user_id=user_id,
-        notif_type=notif_type,
-        title=title,
-        payload_json=json_dumps(payload),
-        is_read=False,
-        created_at=now_utc(),
+
+# 推荐缓存保留的条数（/match/top 的 limit 上限）
+RECOMMENDATION_CACHE_SIZE = 50
+
+# entity_type -> (所有者字段, 参与匹配的标签类别)
+MATCH_SIDES = {
+    "teacher_post": ("teacher_user_id", ["tag", "tech"]),
+    "student_profile": ("user_id", ["interest", "skill"]),
+    "teacher_profile": ("user_id", []),
+}
+
+
+def entity_terms(entity_type: str, entity_id: Optional[int]) -> set:
+    """实体当前参与匹配的规范化标签，写入前调用以记录旧值"""
+    _, kinds = MATCH_SIDES[entity_type]
+    if entity_id is None or not kinds:
+        return set()
+    rows = db.session.execute(
+        select(EntityTag.tag_normalized).where(
+            EntityTag.entity_type == entity_type,
+            EntityTag.entity_id == int(entity_id),
+            EntityTag.kind.in_(kinds),
+        )
+    ).scalars()
+    return set(rows)
+
+
+def mark_match_dirty(entity_type: str, obj, old_terms: set):
+    """
+    项目/档案写入后标记受影响用户的推荐缓存待刷新：所有者本人，
+    以及标签与变更前后标签并集有交集的另一方（项目 -> 学生，学生档案 -> 教师）。
+    调用方负责提交。
+    """
+    owner_field, kinds = MATCH_SIDES[entity_type]
+    terms = set(old_terms or ())
+    if kinds:
+        terms |= {r["tag_normalized"] for r in _tag_rows(entity_type, obj) if r["kind"] in kinds}
+    affected = [RecommendationCache.user_id == getattr(obj, owner_field)]
+    if terms and entity_type == "teacher_post":
+        students = select(EntityTag.entity_id).where(
+            EntityTag.entity_type == "student_profile",
+            EntityTag.kind.in_(MATCH_SIDES["student_profile"][1]),
+            EntityTag.tag_normalized.in_(terms),
+        )
+        affected.append(RecommendationCache.user_id.in_(students))
+    if terms and entity_type == "student_profile":
+        teachers = (
+            select(TeacherPost.teacher_user_id)
+            .join(EntityTag, (EntityTag.entity_type == "teacher_post") & (EntityTag.entity_id == TeacherPost.id))
+            .where(EntityTag.kind.in_(MATCH_SIDES["teacher_post"][1]), EntityTag.tag_normalized.in_(terms))
+        )
+        affected.append(RecommendationCache.user_id.in_(teachers))
+    RecommendationCache.query.filter(or_(*affected)).update(
+        {"dirty": RecommendationCache.dirty + 1}, synchronize_session=False
     )
-    db.session.add(n)
+
+
+def _recommendation_ids(items: List[Dict]) -> List[int]:
+    return [int(x.get("id") or x.get("user_id") or 0) for x in items]
+
+
+def refresh_recommendations(user: User) -> RecommendationCache:
+    """重新计算并写入用户的推荐缓存，调用方负责提交"""
+    row = db.session.get(RecommendationCache, user.id)
+    if not row:
+        row = RecommendationCache(user_id=user.id, version=0, notified_version=0, dirty=0)
+        db.session.add(row)
+    seen_dirty = row.dirty or 0
+
+    if user.role == Role.student.value:
+        kind, items = "teacher_posts", recommend_teacher_posts_for_student(user.id, limit=RECOMMENDATION_CACHE_SIZE)
+    elif user.role == Role.teacher.value:
+        kind, items = "students", recommend_students_for_teacher(user.id, limit=RECOMMENDATION_CACHE_SIZE)
+    else:
+        kind, items = "none", []
+
+    if row.kind != kind or _recommendation_ids(json_loads(row.items_json, [])) != _recommendation_ids(items):
+        row.version = (row.version or 0) + 1
+    row.kind = kind
+    row.items_json = json_dumps(items)
+    row.computed_at = now_utc()
+    # 只扣除计算前看到的次数，计算期间新的写入仍保留为待刷新
+    if seen_dirty:
+        row.dirty = RecommendationCache.dirty - seen_dirty
+    return row
+
+
+def get_recommendations(user: User) -> RecommendationCache:
+    """
+    读取用户的推荐缓存。没有缓存时当场计算；缓存过期时，
+    若后台线程在运行则先返回旧结果，否则（测试/脚本环境）也当场刷新。
+    """
+    row = db.session.get(RecommendationCache, user.id)
+    if row is None or (row.dirty and not current_app.config.get("BACKGROUND_WORKERS_RUNNING")):
+        row = refresh_recommendations(user)
+        db.session.commit()
+    return row
+
+
+def refresh_dirty_recommendations(batch_size: int = 100) -> int:
+    """刷新一批待更新的推荐缓存，返回处理的行数（供后台线程循环调用）"""
+    rows = RecommendationCache.query.filter(RecommendationCache.dirty > 0).limit(batch_size).all()
+    if not rows:
+        return 0
+    users = {u.id: u for u in User.query.filter(User.id.in_([r.user_id for r in rows])).all()}
+    for r in rows:
+        user = users.get(r.user_id)
+        if user:
+            refresh_recommendations(user)
+        else:
+            db.session.delete(r)
     db.session.commit()
-    return n
+    return len(rows)
+
+
+# 高频通知的合并键：notif_type -> 组成合并键的 payload 字段
+COALESCE_KEYS = {
+    "message_new": ("conversation_id",),
+    "forum_reply": ("topic_id",),
+    "comment_new": ("target_type", "target_id"),
+    "comment_reply": ("target_type", "target_id"),
+    "match_refresh": ("kind",),
+}
+
+
+def notification_group_key(notif_type: str, payload: Dict) -> Optional[str]:
+    """可合并的通知返回合并键，例如 message_new:12；其他通知返回 None"""
+    fields = COALESCE_KEYS.get(notif_type)
+    if not fields:
+        return None
+    values = [payload.get(f) for f in fields]
+    if any(v is None or v == "" for v in values):
+        return None
+    return ":".join([notif_type, *(str(v) for v in values)])[:128]
+
+
+def push_notification(user_id: int, notif_type: str, title: str, payload: Dict):
+    push_notifications_bulk([(user_id, notif_type, title, payload)])
 
 
+def push_notifications_bulk(entries: List[Tuple[int, str, str, Dict]]) -> int:
+    """
+    批量推送通知：所有接收人的通知用一条 INSERT 写入并只提交一次，
+    同一事务中尚未提交的其他修改也会一并提交。entries 为 (user_id, notif_type, title, payload)
+    可合并的通知（COALESCE_KEYS）先在批内按 (user_id, group_key) 合并；接收人已有同键的未读通知时删除旧行，
+    event_count 累加到新行上，合并后的通知以新 id 出现在列表顶部与 SSE 推送中。返回写入的通知条数
+    """
+    created_at = now_utc()
+    rows: List[Dict] = []
+    grouped: Dict[Tuple[int, str], Dict] = {}
+    for user_id, notif_type, title, payload in entries:
+        row = {
+            "user_id": user_id,
+            "notif_type": notif_type,
+            "title": title,
+            "payload_json": json_dumps(payload),
+            "group_key": notification_group_key(notif_type, payload),
+            "event_count": 1,
+            "is_read": False,
+            "created_at": created_at,
+        }
+        if row["group_key"]:
+            prev = grouped.get((user_id, row["group_key"]))
+            if prev:
+                row["event_count"] += prev["event_count"]
+                prev.update(row)
+                continue
+            grouped[(user_id, row["group_key"])] = row
+        rows.append(row)
+
+    unread_delta = Counter(r["user_id"] for r in rows)
+    if grouped:
+        existing = (
+            db.session.query(Notification.id, Notification.user_id, Notification.group_key, Notification.event_count)
+            .filter(
+                Notification.user_id.in_({u for u, _ in grouped}),
+                Notification.group_key.in_({k for _, k in grouped}),
+                Notification.is_read == False,
+            )
+            .with_for_update()
+            .all()
+        )
+        replaced = []
+        for nid, user_id, group_key, event_count in existing:
+            row = grouped.get((user_id, group_key))
+            if row:
+                row["event_count"] += int(event_count or 1)
+                replaced.append(nid)
+                unread_delta[user_id] -= 1
+        if replaced:
+            Notification.query.filter(Notification.id.in_(replaced)).delete(synchronize_session=False)
+
+    if rows:
+        db.session.execute(insert(Notification), rows)
+        by_delta: Dict[int, List[int]] = {}
+        for user_id, n in unread_delta.items():
+            if n:
+                by_delta.setdefault(n, []).append(user_id)
+        for n, user_ids in by_delta.items():
+            bump_user_counters(user_ids, notifications=n)
+    db.session.commit()
+    for user_id in {r["user_id"] for r in rows}:
+        hub.publish(user_channel(user_id))
+    return len(rows)
+
 
 def check_and_start_project(post_id: int):
     """
@@ -115,11 +722,8 @@ def check_and_start_project(post_id: int):
     if not post.recruit_count or post.recruit_count <= 0:
         return False
     
-    # 统计已确认的学生数量
-    confirmed_count = CooperationRequest.query.filter_by(
-        post_id=post_id,
-        final_status=CooperationStatus.confirmed.value
-    ).count()
+    # 已确认的学生数量
+    confirmed_count = post.confirmed_count or 0
     
     # 如果人数未达到要求，不启动
     if confirmed_count < post.recruit_count:
@@ -134,68 +738,57 @@ def check_and_start_project(post_id: int):
     # 而不是post_id（指向teacher_posts表）
     # 如果需要里程碑功能，需要先创建或找到对应的cooperation_project
     
-    # 发送通知给教师
-    try:
-        teacher = User.query.get(post.teacher_user_id)
-        if teacher:
-            push_notification(
-                user_id=teacher.id,
-                notif_type="project_started",
-                title="项目已自动启动",
-                payload={
-                    "post_id": post_id,
-                    "post_title": post.title,
-                    "summary": f"项目《{post.title}》已达到招募人数（{confirmed_count}/{post.recruit_count}），自动进入进行中状态"
-                }
+    # 通知教师、所有已确认的学生，以及待处理申请的学生（项目已满员），一次写入
+    entries = [
+        (
+            post.teacher_user_id,
+            "project_started",
+            "项目已自动启动",
+            {
+                "post_id": post_id,
+                "post_title": post.title,
+                "summary": f"项目《{post.title}》已达到招募人数（{confirmed_count}/{post.recruit_count}），自动进入进行中状态"
+            },
+        )
+    ]
+    requests = (
+        db.session.query(CooperationRequest.student_user_id, CooperationRequest.final_status)
+        .join(User, User.id == CooperationRequest.student_user_id)
+        .filter(CooperationRequest.post_id == post_id)
+        .filter(
+            CooperationRequest.final_status.in_(
+                [CooperationStatus.confirmed.value, CooperationStatus.pending.value]
             )
-    except Exception as e:
-        print(f"发送教师通知失败: {e}")
-    
-    # 发送通知给所有已确认的学生
-    try:
-        confirmed_requests = CooperationRequest.query.filter_by(
-            post_id=post_id,
-            final_status=CooperationStatus.confirmed.value
-        ).all()
-        
-        for req in confirmed_requests:
-            student = User.query.get(req.student_user_id)
-            if student:
-                push_notification(
-                    user_id=student.id,
-                    notif_type="project_started",
-                    title="项目已正式启动",
-                    payload={
+        )
+        .all()
+    )
+    for student_id, final_status in requests:
+        if final_status == CooperationStatus.confirmed.value:
+            entries.append(
+                (
+                    student_id,
+                    "project_started",
+                    "项目已正式启动",
+                    {
                         "post_id": post_id,
                         "post_title": post.title,
                         "summary": f"您参与的项目《{post.title}》已正式启动，请查看项目详情"
-                    }
+                    },
                 )
-    except Exception as e:
-        print(f"发送学生通知失败: {e}")
-    
-    # 通知待处理申请的学生项目已满员
-    try:
-        pending_requests = CooperationRequest.query.filter_by(
-            post_id=post_id,
-            final_status=CooperationStatus.pending.value
-        ).all()
-        
-        for req in pending_requests:
-            student = User.query.get(req.student_user_id)
-            if student:
-                push_notification(
-                    user_id=student.id,
-                    notif_type="project_full",
-                    title="项目已满员",
-                    payload={
+            )
+        else:
+            entries.append(
+                (
+                    student_id,
+                    "project_full",
+                    "项目已满员",
+                    {
                         "post_id": post_id,
                         "post_title": post.title,
                         "summary": f"您申请的项目《{post.title}》已达到招募人数上限，暂停接受新申请"
-                    }
+                    },
                 )
-    except Exception as e:
-        print(f"发送满员通知失败: {e}")
-    
-    db.session.commit()
+            )
+
+    push_notifications_bulk(entries)
     return True
@@ -5,21 +5,15 @@ from datetime import datetime
 from typing import Any, Iterable, List, Optional
 
 from flask import current_app
-from werkzeug.security import check_password_hash, generate_password_hash
+
+# 密码哈希实现见 passwords.py，这里保留原有的导入路径
+from .passwords import hash_password, verify_password  # noqa: F401
 
 
 def now_utc() -> datetime:
     return datetime.utcnow()
 
 
-def hash_password(password: str) -> str:
-    return generate_password_hash(password, method="pbkdf2:sha256")
-
-
-def verify_password(password: str, password_hash: str) -> bool:
-    return check_password_hash(password_hash, password)
-
-
 def json_dumps(value: Any) -> str:
     return json.dumps(value, ensure_ascii=False)
 
@@ -0,0 +1,61 @@
+"""
+后台线程
+
+wsgi.py / run_dev.py 在进程启动时调用 start_background_workers(app)。
+测试和 scripts 中不会启动后台线程，此时依赖它的功能（如推荐缓存刷新）在请求内同步完成。
+"""
+import threading
+import time
+
+from .outbox import drain_outbox
+from .retention import archive_notifications
+from .services import refresh_dirty_recommendations
+
+_started = False
+_lock = threading.Lock()
+
+
+def _recommendation_loop(app):
+    interval = app.config["RECOMMENDATION_REFRESH_INTERVAL"]
+    while True:
+        try:
+            with app.app_context():
+                while refresh_dirty_recommendations():
+                    pass
+        except Exception:
+            app.logger.exception("刷新推荐缓存失败")
+        time.sleep(interval)
+
+
+def _outbox_loop(app):
+    interval = app.config["OUTBOX_POLL_INTERVAL"]
+    while True:
+        try:
+            with app.app_context():
+                drain_outbox()
+        except Exception:
+            app.logger.exception("处理通知发件箱失败")
+        time.sleep(interval)
+
+
+def _retention_loop(app):
+    interval = app.config["NOTIFICATION_ARCHIVE_INTERVAL"]
+    while True:
+        try:
+            with app.app_context():
+                archive_notifications()
+        except Exception:
+            app.logger.exception("归档通知失败")
+        time.sleep(interval)
+
+
+def start_background_workers(app):
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    app.config["BACKGROUND_WORKERS_RUNNING"] = True
+    threading.Thread(target=_recommendation_loop, args=(app,), name="recommendation-refresh", daemon=True).start()
+    threading.Thread(target=_outbox_loop, args=(app,), name="notification-outbox", daemon=True).start()
+    threading.Thread(target=_retention_loop, args=(app,), name="notification-retention", daemon=True).start()
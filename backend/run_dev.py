@@ -1,8 +1,14 @@
+import os
+
 from app import create_app
+from app.workers import start_background_workers
 
 
 app = create_app()
 
 
 if __name__ == "__main__":
+    # debug 模式下 reloader 的父进程只负责监视文件，后台线程只在实际服务的子进程中启动
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_workers(app)
     app.run(host="0.0.0.0", port=5000, debug=True)
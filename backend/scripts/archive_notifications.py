@@ -0,0 +1,31 @@
+"""
+归档通知：把超过保留期的已读通知从 notifications 分批搬到 notifications_archive
+适用于不在 Web 进程中启动后台线程的部署（如定时任务）
+运行方式: python -m scripts.archive_notifications [--days 90] [--batch-size 1000]
+"""
+import argparse
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.retention import archive_notifications
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=None, help="已读通知保留天数，默认取 NOTIFICATION_RETENTION_DAYS")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批归档条数，默认取 NOTIFICATION_ARCHIVE_BATCH_SIZE")
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        total = archive_notifications(retention_days=args.days, batch_size=args.batch_size)
+        print(f"已归档 {total} 条通知")
+
+
+if __name__ == "__main__":
+    run()
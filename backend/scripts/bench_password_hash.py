@@ -0,0 +1,60 @@
+"""
+密码哈希基准：单核每秒可完成的登录校验次数，以及批量创建用户时并行哈希的吞吐
+用于在调整 PASSWORD_HASH_METHOD 之前评估登录与导入的 CPU 开销。
+运行方式: python -m scripts.bench_password_hash [--method scrypt:32768:8:1 ...] [--seconds 3] [--batch 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.passwords import hash_password, hash_passwords, verify_password
+
+
+def bench_verify(method: str, seconds: float) -> float:
+    """单线程循环校验同一个哈希，返回每秒校验次数（即单核登录上限）"""
+    password_hash = hash_password("benchmark-password", method=method)
+    count = 0
+    started = time.perf_counter()
+    while True:
+        verify_password("benchmark-password", password_hash)
+        count += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def bench_batch(method: str, batch: int) -> float:
+    """并行哈希一批密码，返回每秒哈希个数"""
+    started = time.perf_counter()
+    hash_passwords([f"password-{i}" for i in range(batch)], method=method)
+    return batch / (time.perf_counter() - started)
+
+
+def run():
+    parser = argparse.ArgumentParser(description="密码哈希基准")
+    parser.add_argument("--method", action="append", help="要测试的 werkzeug method，可重复；默认为当前配置")
+    parser.add_argument("--seconds", type=float, default=3.0, help="每种算法的单核校验测试时长")
+    parser.add_argument("--batch", type=int, default=200, help="并行哈希测试的密码个数，0 表示跳过")
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        methods = args.method or [app.config["PASSWORD_HASH_METHOD"]]
+        workers = app.config["PASSWORD_HASH_WORKERS"] or os.cpu_count() or 1
+        print(f"CPU 核数: {os.cpu_count()}，并行哈希进程数: {workers}")
+        for method in methods:
+            per_core = bench_verify(method, args.seconds)
+            line = f"{method:<28} 单核登录 {per_core:8.1f} 次/秒  单次 {1000 / per_core:7.1f} ms"
+            if args.batch > 0:
+                line += f"  并行哈希 {bench_batch(method, args.batch):8.1f} 个/秒"
+            print(line)
+
+
+if __name__ == "__main__":
+    run()
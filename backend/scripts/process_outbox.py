@@ -0,0 +1,37 @@
+"""
+处理通知发件箱：把待处理的通知事件展开为 notifications
+适用于不在 Web 进程中启动后台线程的部署（如单独的 worker 进程或定时任务）
+运行方式: python -m scripts.process_outbox [--loop] [--interval 1]
+"""
+import argparse
+import os
+import sys
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.outbox import drain_outbox
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loop", action="store_true", help="持续轮询，而不是处理完当前积压后退出")
+    parser.add_argument("--interval", type=float, default=1.0, help="轮询间隔（秒）")
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        while True:
+            total = drain_outbox()
+            if total or not args.loop:
+                print(f"已处理 {total} 条通知事件")
+            if not args.loop:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,24 @@
+"""
+按 cooperation_requests 重新计算 teacher_posts.confirmed_count（修复冗余计数漂移）
+运行方式: python -m scripts.rebuild_confirmed_counts
+"""
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services import rebuild_confirmed_counts
+
+
+def run():
+    app = create_app()
+
+    with app.app_context():
+        fixed = rebuild_confirmed_counts()
+        print(f"已修正 {fixed} 个项目的已确认人数")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,24 @@
+"""
+按 messages 重新计算会话摘要（最后一条消息、双方未读数）
+运行方式: python -m scripts.rebuild_conversation_summaries
+"""
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services import rebuild_conversation_summaries
+
+
+def run():
+    app = create_app()
+
+    with app.app_context():
+        total = rebuild_conversation_summaries()
+        print(f"已重新计算 {total} 个会话的摘要")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,24 @@
+"""
+按各内容表的 JSON 标签字段重建 entity_tags 标签索引
+运行方式: python -m scripts.rebuild_entity_tags
+"""
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services import rebuild_entity_tags
+
+
+def run():
+    app = create_app()
+
+    with app.app_context():
+        total = rebuild_entity_tags()
+        print(f"已写入 {total} 条标签索引")
+
+
+if __name__ == "__main__":
+    run()
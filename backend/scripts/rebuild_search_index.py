@@ -0,0 +1,30 @@
+"""
+重建全文检索文档及全文索引（SQLite FTS5 / MySQL FULLTEXT）
+运行方式: python -m scripts.rebuild_search_index
+"""
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.extensions import db
+from app.search import create_fulltext_index, rebuild_fulltext_index, rebuild_search_documents
+
+
+def run():
+    app = create_app()
+
+    with app.app_context():
+        total = rebuild_search_documents()
+        with db.engine.begin() as conn:
+            if create_fulltext_index(conn):
+                rebuild_fulltext_index(conn)
+                print(f"已写入 {total} 条检索文档，全文索引已重建")
+            else:
+                print(f"已写入 {total} 条检索文档，当前数据库不支持全文索引，关键词搜索将使用 LIKE")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,24 @@
+"""
+按学生画像（技能、经历、每周投入时间、项目链接）重新计算 student_profiles.skill_score / skill_score_level
+运行方式: python -m scripts.rebuild_skill_scores
+"""
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services import rebuild_skill_scores
+
+
+def run():
+    app = create_app()
+
+    with app.app_context():
+        changed = rebuild_skill_scores()
+        print(f"已更新 {changed} 个学生的能力评分")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,25 @@
+"""
+校正用户未读计数（user_counters）：先按 messages 重算会话摘要，再按通知表与会话摘要重算每个用户的未读总数
+运行方式: python -m scripts.rebuild_user_counters
+"""
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services import rebuild_conversation_summaries, rebuild_user_counters
+
+
+def run():
+    app = create_app()
+
+    with app.app_context():
+        rebuild_conversation_summaries()
+        drifted = rebuild_user_counters()
+        print(f"已校正 {drifted} 个用户的未读计数")
+
+
+if __name__ == "__main__":
+    run()
@@ -30,6 +30,14 @@ from app.models import (
     User,
     Visibility,
 )
+from app.search import rebuild_search_documents
+from app.services import (
+    rebuild_confirmed_counts,
+    rebuild_conversation_summaries,
+    rebuild_entity_tags,
+    rebuild_skill_scores,
+    rebuild_user_counters,
+)
 from app.utils import hash_password, json_dumps, json_loads, now_utc, new_storage_name, storage_path
 
 
@@ -449,6 +457,13 @@ def run():
       db.session.add(n)
     db.session.commit()
 
+    rebuild_confirmed_counts()
+    rebuild_conversation_summaries()
+    rebuild_user_counters()
+    rebuild_skill_scores()
+    rebuild_entity_tags()
+    rebuild_search_documents()
+
 
 if __name__ == "__main__":
   run()
@@ -0,0 +1,58 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.extensions import db
+from app.models import User
+from app.utils import hash_password, now_utc
+
+
+@pytest.fixture
+def app():
+    """空数据库上的测试应用；密码哈希用低成本参数，避免建用户拖慢用例"""
+    app = create_app()
+    app.config["TESTING"] = True
+    app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:1000"
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """在调用方的应用上下文中创建并提交一个启用的用户，密码为 123456"""
+
+    def _make_user(username: str, role: str, **fields) -> User:
+        fields.setdefault("display_name", username)
+        u = User(
+            username=username,
+            password_hash=hash_password("123456"),
+            role=role,
+            is_active=True,
+            created_at=now_utc(),
+            **fields,
+        )
+        db.session.add(u)
+        db.session.commit()
+        return u
+
+    return _make_user
+
+
+@pytest.fixture
+def auth_headers(app):
+    """为用户（User 或 id）签发访问令牌，返回请求头"""
+
+    def _auth_headers(user) -> dict:
+        user_id = user if isinstance(user, int) else user.id
+        with app.app_context():
+            token = create_access_token(identity=str(user_id))
+        return {"Authorization": f"Bearer {token}"}
+
+    return _auth_headers
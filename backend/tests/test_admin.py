@@ -0,0 +1,218 @@
+from io import BytesIO
+
+import pytest
+
+from app.extensions import db
+from app.models import Role, SearchDocument, User
+from app.utils import now_utc
+
+
+@pytest.fixture
+def admin_headers(app, make_user, auth_headers):
+    with app.app_context():
+        return auth_headers(make_user("admin", Role.admin.value, display_name="管理员"))
+
+
+def test_import_users_streams_in_chunks_and_reports_row_errors(monkeypatch, app, client, admin_headers):
+    from openpyxl import Workbook
+
+    from app.routes import admin as admin_routes
+
+    monkeypatch.setattr(admin_routes, "IMPORT_CHUNK_SIZE", 3)
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["角色", "学号/工号", "姓名", "密码"])
+    ws.append(["学生", "2023001", "张三", "abc123"])
+    ws.append(["学生", "admin", "重名", None])
+    ws.append(["", "2023002", "缺角色", None])
+    ws.append(["校长", "2023003", "无效角色", None])
+    ws.append([None, None, None, None])
+    ws.append(["教师", "T001", "李老师", None])
+    ws.append(["学生", "2023001", "文件内重复", None])
+    for i in range(4, 11):
+        ws.append(["学生", f"2023{i:03d}", f"学生{i}", None])
+    buf = BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+
+    resp = client.post(
+        "/api/admin/import/users",
+        data={"file": (buf, "users.xlsx")},
+        headers=admin_headers,
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["total"] == 14
+    assert data["success"] == 9
+    assert data["failed"] == 4
+    assert {e["row"]: e["message"] for e in data["errors"]} == {
+        3: "用户名已存在: admin",
+        4: "角色不能为空",
+        5: "无效的角色: 校长",
+        8: "用户名已存在: 2023001",
+    }
+
+    with app.app_context():
+        u = User.query.filter_by(username="2023001").first()
+        assert u.display_name == "张三"
+        assert u.must_change_password is False
+        assert User.query.filter_by(username="T001").first().must_change_password is True
+        assert SearchDocument.query.filter_by(entity_type="student").count() == 8
+    resp = client.post("/api/auth/login", json={"username": "2023001", "password": "abc123"})
+    assert resp.status_code == 200
+    assert client.get("/api/search", query_string={"q": "张三"}).get_json()["total"] == 1
+
+
+def test_import_users_isolates_rows_that_fail_in_the_database(monkeypatch, app, client, admin_headers):
+    from openpyxl import Workbook
+    from sqlalchemy import text
+
+    from app.routes import admin as admin_routes
+
+    monkeypatch.setattr(admin_routes, "IMPORT_CHUNK_SIZE", 3)
+    with app.app_context():
+        # 模拟通过了预检查、却在插入时被数据库拒绝的行
+        db.session.execute(
+            text(
+                "CREATE TRIGGER reject_bad_user BEFORE INSERT ON users WHEN NEW.username = 'bad' "
+                "BEGIN SELECT RAISE(ABORT, 'rejected'); END"
+            )
+        )
+        db.session.commit()
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["角色", "学号/工号", "姓名", "密码"])
+    ws.append(["学生", "2023001", "张三", None])
+    ws.append(["学生", "bad", "坏行", None])
+    ws.append(["学生", "2023002", "李四", None])
+    ws.append(["学生", "x" * 65, "过长", None])
+    ws.append(["教师", "T001", "王" * 65, None])
+    buf = BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+
+    data = client.post(
+        "/api/admin/import/users",
+        data={"file": (buf, "users.xlsx")},
+        headers=admin_headers,
+        content_type="multipart/form-data",
+    ).get_json()
+    assert data["success"] == 2
+    errors = {e["row"]: e["message"] for e in data["errors"]}
+    assert set(errors) == {3, 5, 6}
+    assert "rejected" in errors[3]
+    assert errors[5] == "学号/工号过长（最多64个字符）"
+    assert errors[6] == "姓名过长（最多64个字符）"
+    with app.app_context():
+        assert {u.username for u in User.query.filter(User.role == Role.student.value)} == {"2023001", "2023002"}
+        assert SearchDocument.query.filter_by(entity_type="student").count() == 2
+
+
+def test_exports_stream_csv_and_write_only_xlsx(app, client, make_user, admin_headers):
+    from openpyxl import load_workbook
+
+    from app.models import TeacherPost
+
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value, display_name="李老师")
+        for i in range(3):
+            db.session.add(
+                TeacherPost(
+                    teacher_user_id=teacher.id,
+                    post_type="competition",
+                    title=f"竞赛{i}",
+                    content="内容",
+                    confirmed_count=i,
+                    created_at=now_utc(),
+                    updated_at=now_utc(),
+                )
+            )
+        db.session.commit()
+
+    resp = client.get("/api/admin/export/projects", query_string={"format": "csv"}, headers=admin_headers)
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/csv"
+    lines = resp.get_data(as_text=True).lstrip("\ufeff").splitlines()
+    assert lines[0] == "项目名称,类型,教师,招募人数,已确认人数,状态,创建时间"
+    assert len(lines) == 4
+    assert lines[1].startswith("竞赛2,学科竞赛,李老师,,2,招募中,")
+
+    resp = client.get("/api/admin/export/users", query_string={"role": "teacher"}, headers=admin_headers)
+    assert resp.status_code == 200
+    ws = load_workbook(BytesIO(resp.get_data())).active
+    rows = list(ws.iter_rows(values_only=True))
+    assert rows[0][:3] == ("角色", "学号/工号", "姓名")
+    assert rows[1][:3] == ("教师", "t1", "李老师")
+    assert len(rows) == 2
+
+
+def test_analytics_aggregates_in_sql(app, client, make_user, admin_headers):
+    from datetime import timedelta
+
+    from app.models import Conversation, CooperationRequest, Message, TeacherPost
+    from app.services import sync_entity_tags
+    from app.utils import json_dumps
+
+    now = now_utc()
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        posts = []
+        for i, (post_type, tags, created) in enumerate(
+            [
+                ("competition", ["AI", "网络"], now),
+                ("project", ["ai"], now - timedelta(days=1)),
+                ("competition", ["网络"], now - timedelta(days=400)),
+            ]
+        ):
+            p = TeacherPost(
+                teacher_user_id=teacher.id,
+                post_type=post_type,
+                title=f"p{i}",
+                content="",
+                tags_json=json_dumps(tags),
+                tech_stack_json=json_dumps(["Python"]),
+                created_at=created,
+                updated_at=created,
+            )
+            db.session.add(p)
+            db.session.flush()
+            sync_entity_tags("teacher_post", p)
+            posts.append(p)
+        c = Conversation(teacher_user_id=teacher.id, student_user_id=student.id, created_at=now)
+        db.session.add(c)
+        db.session.flush()
+        for days in (0, 0, 3):
+            db.session.add(
+                Message(conversation_id=c.id, sender_user_id=student.id, content="hi", created_at=now - timedelta(days=days))
+            )
+        for post, status in ((posts[0], "confirmed"), (posts[1], "confirmed"), (posts[0], "pending")):
+            db.session.add(
+                CooperationRequest(
+                    teacher_user_id=teacher.id,
+                    student_user_id=student.id,
+                    post_id=post.id,
+                    initiated_by="student",
+                    final_status=status,
+                    created_at=now,
+                    updated_at=now,
+                )
+            )
+        db.session.commit()
+
+    data = client.get("/api/admin/analytics", headers=admin_headers).get_json()
+    today = now.date().isoformat()
+    this_month = now.strftime("%Y-%m")
+    assert len(data["posts_daily"]) == 14 and data["posts_daily"][-1] == {"date": today, "count": 1}
+    assert sum(d["count"] for d in data["posts_daily"]) == 2
+    assert data["messages_daily"][-1]["count"] == 2
+    assert sum(d["count"] for d in data["messages_daily"]) == 3
+    assert [m["month"] for m in data["posts_monthly"]][-1] == this_month
+    assert len(data["messages_monthly"]) == 6
+    assert sum(m["count"] for m in data["posts_monthly"]) == 2
+    assert data["hot_topics"][0] == {"name": "Python", "count": 3}
+    assert {t["name"].lower(): t["count"] for t in data["hot_topics"][1:]} == {"ai": 2, "网络": 2}
+    assert data["competition_trend"][-1] == {"month": this_month, "count": 1}
@@ -46,3 +46,234 @@ def test_login_seed_accounts():
         assert data["user"]["role"] == Role.admin.value
         assert data["access_token"]
 
+
+
+def test_identity_is_cached_and_invalidated_on_user_change():
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import event
+
+    from app.extensions import db
+    from app.models import Role, User
+    from app.rbac import invalidate_identity
+    from app.utils import now_utc
+
+    app = create_app()
+    app.config["TESTING"] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = User(
+            username="admin",
+            password_hash="x",
+            role=Role.admin.value,
+            display_name="管理员",
+            is_active=True,
+            created_at=now_utc(),
+        )
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+        token = create_access_token(identity=str(admin.id))
+        engine = db.engine
+    invalidate_identity()
+
+    user_queries = []
+
+    def count_user_queries(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement and "WHERE users.id =" in statement:
+            user_queries.append(statement)
+
+    headers = {"Authorization": f"Bearer {token}"}
+    client = app.test_client()
+    event.listen(engine, "before_cursor_execute", count_user_queries)
+    try:
+        assert client.get("/api/admin/stats", headers=headers).status_code == 200
+        assert len(user_queries) == 1
+        assert client.get("/api/admin/stats", headers=headers).status_code == 200
+        assert len(user_queries) == 1
+        assert client.get("/api/notifications/unread-count", headers=headers).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", count_user_queries)
+
+    with app.app_context():
+        db.session.get(User, admin_id).is_active = False
+        db.session.commit()
+    assert client.get("/api/admin/stats", headers=headers).status_code == 403
+    assert client.get("/api/notifications/unread-count", headers=headers).status_code == 401
+
+
+def test_current_user_is_not_reused_across_requests_in_shared_context(app, client, make_user, auth_headers):
+    from app.models import Role
+
+    # 测试中常见的写法：外层应用上下文一直处于激活状态，各请求共用同一个 g
+    with app.app_context():
+        alice = make_user("alice", Role.student.value)
+        bob = make_user("bob", Role.teacher.value)
+        for user in (alice, bob, alice):
+            resp = client.get("/api/auth/me", headers=auth_headers(user))
+            assert resp.get_json()["username"] == user.username
+
+
+def test_login_tokens_carry_claims_and_are_revoked():
+    from sqlalchemy import event
+
+    from app.extensions import db
+    from app.models import Role, User
+    from app.utils import hash_password, now_utc
+
+    app = create_app()
+    app.config["TESTING"] = True
+    password_hash = hash_password("123456")
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for username, role in [("admin", Role.admin.value), ("s1", Role.student.value), ("s2", Role.student.value)]:
+            db.session.add(
+                User(
+                    username=username,
+                    password_hash=password_hash,
+                    role=role,
+                    display_name=username,
+                    is_active=True,
+                    created_at=now_utc(),
+                )
+            )
+        db.session.commit()
+        s2_id = User.query.filter_by(username="s2").first().id
+        engine = db.engine
+
+    client = app.test_client()
+
+    def login(username, password="123456"):
+        resp = client.post("/api/auth/login", json={"username": username, "password": password})
+        return {"Authorization": f"Bearer {resp.get_json()['access_token']}"}
+
+    admin = login("admin")
+    s1 = login("s1")
+    s2 = login("s2")
+
+    user_queries = []
+
+    def count_user_queries(conn, cursor, statement, parameters, context, executemany):
+        if "WHERE users.id =" in statement or "users.token_revoked_at" in statement:
+            user_queries.append(statement)
+
+    assert client.get("/api/admin/stats", headers=admin).status_code == 200
+    event.listen(engine, "before_cursor_execute", count_user_queries)
+    try:
+        assert client.get("/api/admin/stats", headers=s1).status_code == 403
+        assert client.get("/api/search", query_string={"q": "x"}, headers=s1).status_code == 200
+        assert user_queries == []
+    finally:
+        event.remove(engine, "before_cursor_execute", count_user_queries)
+
+    resp = client.post("/api/admin/users/%d/set-password" % s2_id, json={"password": "654321"}, headers=admin)
+    assert resp.status_code == 200
+    resp = client.get("/api/notifications/unread-count", headers=s2)
+    assert resp.status_code == 401
+    assert resp.get_json()["message"] == "登录已失效，请重新登录"
+    s2 = login("s2", "654321")
+    assert client.get("/api/notifications/unread-count", headers=s2).status_code == 200
+
+    resp = client.post(
+        "/api/auth/change-password", json={"old_password": "123456", "new_password": "abcdef"}, headers=s1
+    )
+    new_s1 = {"Authorization": f"Bearer {resp.get_json()['access_token']}"}
+    assert client.get("/api/notifications/unread-count", headers=s1).status_code == 401
+    assert client.get("/api/notifications/unread-count", headers=new_s1).status_code == 200
+
+    with app.app_context():
+        db.session.get(User, s2_id).is_active = False
+        db.session.commit()
+    assert client.get("/api/notifications/unread-count", headers=s2).status_code == 401
+
+
+def test_login_rehashes_when_hash_method_changes_and_bulk_hashing_is_parallel():
+    from app.extensions import db
+    from app.models import Role, User
+    from app.passwords import hash_password, hash_passwords, needs_rehash, verify_password
+    from app.utils import now_utc
+
+    app = create_app()
+    app.config["TESTING"] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(
+            User(
+                username="s1",
+                password_hash=hash_password("123456", method="pbkdf2:sha256:1000"),
+                role=Role.student.value,
+                display_name="s1",
+                is_active=True,
+                created_at=now_utc(),
+            )
+        )
+        db.session.commit()
+
+    app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:2000"
+    client = app.test_client()
+    assert client.post("/api/auth/login", json={"username": "s1", "password": "123456"}).status_code == 200
+    with app.app_context():
+        stored = User.query.filter_by(username="s1").first().password_hash
+        assert stored.startswith("pbkdf2:sha256:2000$")
+        assert not needs_rehash(stored)
+    assert client.post("/api/auth/login", json={"username": "s1", "password": "123456"}).status_code == 200
+
+    app.config["PASSWORD_HASH_WORKERS"] = 2
+    app.config["PASSWORD_HASH_PARALLEL_MIN"] = 2
+    with app.app_context():
+        passwords = [f"pw{i}" for i in range(6)] + ["123456", "123456"]
+        hashes = hash_passwords(passwords)
+        assert all(h.startswith("pbkdf2:sha256:2000$") for h in hashes)
+        assert all(verify_password(p, h) for p, h in zip(passwords, hashes))
+        assert hashes[-1] != hashes[-2]
+
+        # 进程池在多次调用间复用，子进程以 spawn 方式启动
+        from app import passwords as passwords_module
+
+        pool = passwords_module._pool
+        assert pool is not None and pool._mp_context.get_start_method() == "spawn"
+        hash_passwords(passwords[:4])
+        assert passwords_module._pool is pool
+        passwords_module.shutdown_pool()
+        assert passwords_module._pool is None
+
+
+def test_revocations_from_other_processes_are_bounded_and_immediate_for_admin(app, client, make_user):
+    import time
+
+    from sqlalchemy import update
+
+    from app.extensions import db
+    from app.models import Role, User
+    from app.utils import now_utc
+
+    app.config["REVOCATION_REFRESH_INTERVAL"] = 0.5
+    with app.app_context():
+        admin_id = make_user("admin", Role.admin.value).id
+        student_id = make_user("s1", Role.student.value).id
+
+    def login(username):
+        resp = client.post("/api/auth/login", json={"username": username, "password": "123456"})
+        return {"Authorization": f"Bearer {resp.get_json()['access_token']}"}
+
+    admin, student = login("admin"), login("s1")
+    assert client.get("/api/admin/stats", headers=admin).status_code == 200
+    assert client.get("/api/notifications/unread-count", headers=student).status_code == 200
+
+    # 模拟其他进程作废令牌：绕过 ORM 事件，本进程只能通过同步作废记录得知
+    with app.app_context():
+        db.session.execute(
+            update(User)
+            .where(User.id.in_([admin_id, student_id]))
+            .values(is_active=False, token_version=User.token_version + 1, token_revoked_at=now_utc())
+        )
+        db.session.commit()
+
+    resp = client.get("/api/admin/stats", headers=admin)
+    assert resp.status_code == 401
+    assert resp.get_json()["message"] == "登录已失效，请重新登录"
+    # 普通接口在同步间隔内仍可能放行，但不会超过 REVOCATION_REFRESH_INTERVAL
+    time.sleep(0.6)
+    assert client.get("/api/notifications/unread-count", headers=student).status_code == 401
@@ -0,0 +1,149 @@
+from datetime import timedelta
+
+from app.extensions import db
+from app.models import ReviewStatus, Role, StudentProfile, TeacherPost, User
+from app.services import rebuild_entity_tags, similarity_score
+from app.utils import hash_password, json_dumps, now_utc
+
+
+def add_post(teacher_id: int, title: str, tags, tech, created_at, review_status=ReviewStatus.approved.value):
+    db.session.add(
+        TeacherPost(
+            teacher_user_id=teacher_id,
+            post_type="project",
+            title=title,
+            content="内容",
+            tags_json=json_dumps(tags),
+            tech_stack_json=json_dumps(tech),
+            review_status=review_status,
+            created_at=created_at,
+            updated_at=created_at,
+        )
+    )
+
+
+def test_post_recommendations_consider_every_approved_post(app, client, make_user, auth_headers):
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        db.session.add(
+            StudentProfile(
+                user_id=student.id,
+                interests_json=json_dumps(["网络安全", "AI"]),
+                skills_json=json_dumps([{"name": "Python", "level": "熟练"}]),
+                updated_at=now_utc(),
+            )
+        )
+        base = now_utc() - timedelta(days=30)
+        add_post(teacher.id, "很早的匹配项目", ["网络安全", "ai"], ["Go"], base)
+        add_post(teacher.id, "部分匹配", ["网络安全", "嵌入式", "物联网"], ["python", "C"], base)
+        add_post(teacher.id, "未审核", ["网络安全", "AI"], [], base, ReviewStatus.pending.value)
+        for i in range(300):
+            add_post(teacher.id, f"无关项目{i}", ["前端"], ["Vue"], base + timedelta(minutes=i + 1))
+        db.session.commit()
+        rebuild_entity_tags()
+        headers = auth_headers(student)
+
+    items = client.get("/api/match/top", headers=headers).get_json()["items"]
+    assert [i["title"] for i in items] == ["很早的匹配项目", "部分匹配"]
+    base_terms = ["网络安全", "AI", "Python"]
+    assert items[0]["score"] == round(similarity_score(base_terms, ["网络安全", "ai"]), 4)
+    assert items[1]["score"] == round(
+        max(similarity_score(base_terms, ["网络安全", "嵌入式", "物联网"]), similarity_score(base_terms, ["python", "C"])), 4
+    )
+
+
+def test_student_recommendations_rank_all_active_students(app, client, make_user, auth_headers):
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        add_post(teacher.id, "安全项目", ["网络安全", "CTF"], ["Python"], now_utc())
+        password_hash = hash_password("123456")
+        students = [
+            User(
+                username=f"s{i}",
+                password_hash=password_hash,
+                role=Role.student.value,
+                display_name=f"s{i}",
+                is_active=True,
+                created_at=now_utc(),
+            )
+            for i in range(600)
+        ]
+        db.session.add_all(students)
+        db.session.flush()
+        for i, st in enumerate(students):
+            interests = ["前端"]
+            if i == 599:
+                interests = ["网络安全", "ctf"]
+            elif i == 598:
+                interests = ["网络安全", "CTF", "Python"]
+            elif i == 597:
+                interests = ["网络安全"]
+                st.is_active = False
+            db.session.add(
+                StudentProfile(
+                    user_id=st.id,
+                    interests_json=json_dumps(interests),
+                    skills_json=json_dumps([{"name": "Python", "level": "熟练"}] if i == 599 else []),
+                    updated_at=now_utc(),
+                )
+            )
+        db.session.commit()
+        rebuild_entity_tags()
+        expected = [students[598].id, students[599].id]
+        headers = auth_headers(teacher)
+
+    items = client.get("/api/match/top", headers=headers).get_json()["items"]
+    assert [i["user_id"] for i in items] == expected
+    assert items[0]["score"] == 1.0
+    assert items[1]["score"] == round(similarity_score(["网络安全", "CTF", "Python"], ["网络安全", "ctf"]), 4)
+    assert items[0]["display_name"] == "s598"
+
+
+def test_recommendations_are_cached_and_invalidated_by_writes(app, client, make_user, auth_headers):
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        teacher_headers = auth_headers(teacher)
+        student_headers = auth_headers(student)
+        student_id = student.id
+
+    client.put("/api/student-profile", json={"interests": ["网络安全"]}, headers=student_headers)
+    assert client.get("/api/match/top", headers=teacher_headers).get_json()["items"] == []
+    assert client.get("/api/match/top", headers=student_headers).get_json()["items"] == []
+
+    resp = client.post(
+        "/api/teacher-posts",
+        json={"title": "安全项目", "content": "内容", "tags": ["网络安全"]},
+        headers=teacher_headers,
+    )
+    post_id = resp.get_json()["id"]
+    with app.app_context():
+        from app.models import RecommendationCache
+
+        assert RecommendationCache.query.get(student_id).dirty == 1
+
+    items = client.get("/api/match/top", headers=student_headers).get_json()["items"]
+    assert [i["id"] for i in items] == [post_id]
+    items = client.get("/api/match/top", headers=teacher_headers).get_json()["items"]
+    assert [i["user_id"] for i in items] == [student_id]
+
+    client.post("/api/match/check", headers=student_headers)
+    client.post("/api/match/check", headers=student_headers)
+    with app.app_context():
+        from app.models import Notification
+
+        assert Notification.query.filter_by(user_id=student_id, notif_type="match_refresh").count() == 1
+
+    # 后台线程运行时，读取不再同步计算，由 refresh_dirty_recommendations 刷新
+    app.config["BACKGROUND_WORKERS_RUNNING"] = True
+    client.put("/api/student-profile", json={"interests": ["嵌入式"]}, headers=student_headers)
+    items = client.get("/api/match/top", headers=student_headers).get_json()["items"]
+    assert [i["id"] for i in items] == [post_id]
+    with app.app_context():
+        from app.services import refresh_dirty_recommendations
+
+        assert refresh_dirty_recommendations() == 2
+        assert refresh_dirty_recommendations() == 0
+    assert client.get("/api/match/top", headers=student_headers).get_json()["items"] == []
+    assert client.get("/api/match/top", headers=teacher_headers).get_json()["items"] == []
@@ -0,0 +1,237 @@
+from app.extensions import db
+from app.models import Message, Role
+from app.utils import now_utc
+
+
+def test_long_poll_returns_only_new_messages_and_wakes_on_send(app, client, make_user, auth_headers):
+    import threading
+    import time
+
+    app.config["REALTIME_POLL_INTERVAL"] = 10
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        outsider = make_user("s2", Role.student.value)
+        teacher_id, student_id = teacher.id, student.id
+        teacher_headers = auth_headers(teacher)
+        student_headers = auth_headers(student)
+        outsider_headers = auth_headers(outsider)
+
+    pair = {"teacher_user_id": teacher_id, "student_user_id": student_id}
+    first_id = client.post(
+        "/api/messages/send", json={**pair, "content": "第一条"}, headers=student_headers
+    ).get_json()["id"]
+    conv_id = client.get("/api/conversations", headers=teacher_headers).get_json()["items"][0]["id"]
+
+    data = client.get(
+        f"/api/conversations/{conv_id}/messages/poll",
+        query_string={"after_id": 0, "timeout": 0},
+        headers=teacher_headers,
+    ).get_json()
+    assert [m["content"] for m in data["items"]] == ["第一条"]
+    assert data["items"][0]["is_read"] is True
+    assert data["last_id"] == first_id
+
+    def send_later():
+        time.sleep(0.5)
+        client.post("/api/messages/send", json={**pair, "content": "第二条"}, headers=student_headers)
+
+    threading.Thread(target=send_later).start()
+    started = time.monotonic()
+    data = client.get(
+        f"/api/conversations/{conv_id}/messages/poll",
+        query_string={"after_id": first_id, "timeout": 5},
+        headers=teacher_headers,
+    ).get_json()
+    assert time.monotonic() - started < 4
+    assert [m["content"] for m in data["items"]] == ["第二条"]
+
+    data = client.get(
+        f"/api/conversations/{conv_id}/messages/poll",
+        query_string={"after_id": data["last_id"], "timeout": 0},
+        headers=teacher_headers,
+    ).get_json()
+    assert data["items"] == []
+    with app.app_context():
+        assert Message.query.filter_by(conversation_id=conv_id, is_read=False).count() == 0
+
+    resp = client.get(f"/api/conversations/{conv_id}/messages/poll", headers=outsider_headers)
+    assert resp.status_code == 403
+
+
+def test_inbox_uses_conversation_summary_and_keyset_pages(app, client, make_user, auth_headers):
+    from app.models import Conversation
+    from app.services import rebuild_conversation_summaries
+
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        students = [make_user(f"s{i}", Role.student.value) for i in range(3)]
+        teacher_id = teacher.id
+        teacher_headers = auth_headers(teacher)
+        student_headers = [auth_headers(s) for s in students]
+        student_ids = [s.id for s in students]
+
+    for i, (sid, headers) in enumerate(zip(student_ids, student_headers)):
+        for k in range(i + 1):
+            client.post(
+                "/api/messages/send",
+                json={"teacher_user_id": teacher_id, "student_user_id": sid, "content": f"s{i} 第{k + 1}条"},
+                headers=headers,
+            )
+    client.post(
+        "/api/messages/send",
+        json={"teacher_user_id": teacher_id, "student_user_id": student_ids[0], "content": "老师回复"},
+        headers=teacher_headers,
+    )
+
+    items = client.get("/api/conversations", headers=teacher_headers).get_json()["items"]
+    assert [i["other"]["id"] for i in items] == [student_ids[0], student_ids[2], student_ids[1]]
+    assert [i["unread"] for i in items] == [1, 3, 2]
+    assert items[0]["last_message"] == "老师回复"
+    student_items = client.get("/api/conversations", headers=student_headers[0]).get_json()["items"]
+    assert student_items[0]["unread"] == 1
+
+    page = client.get("/api/conversations", query_string={"limit": 2}, headers=teacher_headers).get_json()
+    assert len(page["items"]) == 2
+    rest = client.get(
+        "/api/conversations", query_string={"limit": 2, **page["next_cursor"]}, headers=teacher_headers
+    ).get_json()
+    assert [i["other"]["id"] for i in rest["items"]] == [student_ids[1]]
+    assert rest["next_cursor"] is None
+
+    conv_id = items[1]["id"]
+    client.get(f"/api/conversations/{conv_id}/messages", headers=teacher_headers)
+    items = client.get("/api/conversations", headers=teacher_headers).get_json()["items"]
+    assert [i["unread"] for i in items] == [1, 0, 2]
+
+    with app.app_context():
+        Conversation.query.update({"teacher_unread": 0, "last_message_id": None})
+        db.session.commit()
+        rebuild_conversation_summaries()
+    rebuilt = client.get("/api/conversations", headers=teacher_headers).get_json()["items"]
+    assert rebuilt == items
+
+
+def test_message_history_is_keyset_paged_and_marked_read_in_bulk(app, client, make_user, auth_headers):
+    from app.models import Conversation, File
+
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        c = Conversation(teacher_user_id=teacher.id, student_user_id=student.id, created_at=now_utc())
+        f = File(owner_user_id=student.id, original_name="report.pdf", storage_name="x.pdf", size_bytes=10, created_at=now_utc())
+        db.session.add_all([c, f])
+        db.session.flush()
+        for i in range(120):
+            db.session.add(
+                Message(
+                    conversation_id=c.id,
+                    sender_user_id=student.id if i % 3 else teacher.id,
+                    content=f"m{i}",
+                    file_id=f.id if i == 119 else None,
+                    is_read=False,
+                    created_at=now_utc(),
+                )
+            )
+        db.session.commit()
+        conv_id = c.id
+        teacher_headers = auth_headers(teacher)
+
+    url = f"/api/conversations/{conv_id}/messages"
+    data = client.get(url, headers=teacher_headers).get_json()
+    assert [m["content"] for m in data["items"]] == [f"m{i}" for i in range(70, 120)]
+    assert data["has_more"] is True
+    assert data["items"][-1]["file"]["original_name"] == "report.pdf"
+    with app.app_context():
+        unread = Message.query.filter_by(conversation_id=conv_id, is_read=False).all()
+        assert {m.content for m in unread} == {f"m{i}" for i in range(0, 120, 3)}
+        assert Conversation.query.get(conv_id).teacher_unread == 0
+
+    older = client.get(
+        url, query_string={"before_id": data["items"][0]["id"], "limit": 60}, headers=teacher_headers
+    ).get_json()
+    assert [m["content"] for m in older["items"]] == [f"m{i}" for i in range(10, 70)]
+    assert older["has_more"] is True
+
+    newer = client.get(
+        url, query_string={"after_id": older["items"][-1]["id"], "limit": 30}, headers=teacher_headers
+    ).get_json()
+    assert [m["content"] for m in newer["items"]] == [f"m{i}" for i in range(70, 100)]
+    assert newer["has_more"] is True
+    assert client.get(url, query_string={"before_id": "x"}, headers=teacher_headers).status_code == 400
+    resp = client.get(url, query_string={"limit": "abc"}, headers=teacher_headers)
+    assert resp.status_code == 200 and len(resp.get_json()["items"]) == 50
+
+
+def test_unread_counters_follow_notifications_and_messages(app, client, make_user, auth_headers):
+    from app.models import Notification, UserCounter
+    from app.services import push_notification, push_notifications_bulk, rebuild_user_counters
+
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        teacher_id, student_id = teacher.id, student.id
+        teacher_headers = auth_headers(teacher)
+        student_headers = auth_headers(student)
+        push_notification(student_id, "system", "一条", {})
+
+    def counts(headers):
+        return client.get("/api/notifications/unread-count", headers=headers).get_json()
+
+    # 计数行在首次变更时按源表建立
+    assert counts(student_headers) == {"count": 1, "messages": 0}
+    with app.app_context():
+        push_notification(student_id, "system", "两条", {})
+        push_notifications_bulk([(student_id, "system", "三条", {}), (teacher_id, "system", "四条", {})])
+        first_id = Notification.query.filter_by(user_id=student_id).order_by(Notification.id).first().id
+    assert counts(student_headers) == {"count": 3, "messages": 0}
+
+    pair = {"teacher_user_id": teacher_id, "student_user_id": student_id}
+    for text in ("你好", "在吗"):
+        client.post("/api/messages/send", json={**pair, "content": text}, headers=teacher_headers)
+    # 两条私信合并为一条 message_new 通知
+    assert counts(student_headers) == {"count": 4, "messages": 2}
+    assert counts(teacher_headers) == {"count": 1, "messages": 0}
+
+    client.post(f"/api/notifications/{first_id}/read", headers=student_headers)
+    client.post(f"/api/notifications/{first_id}/read", headers=student_headers)
+    assert counts(student_headers)["count"] == 3
+    conv_id = client.get("/api/conversations", headers=student_headers).get_json()["items"][0]["id"]
+    client.get(f"/api/conversations/{conv_id}/messages", headers=student_headers)
+    client.post("/api/notifications/read-all", headers=student_headers)
+    assert counts(student_headers) == {"count": 0, "messages": 0}
+
+    with app.app_context():
+        UserCounter.query.filter_by(user_id=student_id).update({"unread_notifications": 7, "unread_messages": 5})
+        db.session.commit()
+        assert rebuild_user_counters() == 1
+        assert rebuild_user_counters() == 0
+    assert counts(student_headers) == {"count": 0, "messages": 0}
+
+
+def test_counter_rows_are_created_without_committing_the_callers_session(app, make_user):
+    from app.models import Notification, UserCounter
+    from app.services import bump_user_counters, get_user_counters, push_notification
+
+    with app.app_context():
+        student_id = make_user("s1", Role.student.value).id
+        db.session.add(Notification(user_id=student_id, notif_type="system", title="旧", created_at=now_utc()))
+        db.session.commit()
+
+        # 读取时建立计数行，调用方尚未提交的修改不会被一并提交
+        db.session.add(Notification(user_id=student_id, notif_type="system", title="未提交", created_at=now_utc()))
+        assert get_user_counters(student_id).unread_notifications == 1
+        db.session.rollback()
+        assert Notification.query.filter_by(title="未提交").count() == 0
+        assert db.session.get(UserCounter, student_id).unread_notifications == 1
+
+        # 计数行不存在时，变更方在同一事务中按源表建立，已包含本次新增的通知
+        UserCounter.query.delete()
+        db.session.commit()
+        push_notification(student_id, "system", "新", {})
+        assert db.session.get(UserCounter, student_id).unread_notifications == 2
+
+        # 计数行已被其他请求建立时，在该行上叠加增量
+        bump_user_counters([student_id], notifications=3)
+        db.session.commit()
+        assert get_user_counters(student_id).unread_notifications == 5
@@ -0,0 +1,271 @@
+from app.extensions import db
+from app.models import Notification, NotificationOutbox, OutboxStatus, Role
+from app.utils import now_utc
+
+
+def test_outbox_defers_fanout_to_worker_and_is_idempotent(app, client, make_user, auth_headers):
+    from app.outbox import EXPANDERS, enqueue_notification, process_outbox
+
+    app.config["BACKGROUND_WORKERS_RUNNING"] = True
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        teacher_id, student_id = teacher.id, student.id
+        headers = auth_headers(student)
+
+    resp = client.post(
+        "/api/messages/send",
+        json={"teacher_user_id": teacher_id, "student_user_id": student_id, "content": "老师好"},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    with app.app_context():
+        assert Notification.query.filter_by(user_id=teacher_id).count() == 0
+        assert NotificationOutbox.query.filter_by(status=OutboxStatus.pending.value).count() == 1
+
+        enqueue_notification(teacher_id, "system", "重复", {}, idempotency_key="dup")
+        enqueue_notification(teacher_id, "system", "重复", {}, idempotency_key="dup")
+        db.session.commit()
+        assert process_outbox() == 2
+        assert process_outbox() == 0
+        titles = sorted(n.title for n in Notification.query.filter_by(user_id=teacher_id))
+        assert titles == ["收到新的私信", "重复"]
+
+        # 展开失败的事件按退避重试，不影响同批其他事件
+        EXPANDERS["broken"] = lambda data: 1 / 0
+        try:
+            from app.outbox import enqueue
+
+            enqueue("broken", {}, idempotency_key="broken")
+            enqueue_notification(student_id, "system", "正常", {}, idempotency_key="ok")
+            db.session.commit()
+            assert process_outbox() == 2
+        finally:
+            EXPANDERS.pop("broken")
+        broken = NotificationOutbox.query.filter_by(idempotency_key="broken").first()
+        assert broken.status == OutboxStatus.pending.value
+        assert broken.attempts == 1
+        assert broken.next_attempt_at > now_utc()
+        assert "division by zero" in broken.last_error
+        assert Notification.query.filter_by(user_id=student_id, title="正常").count() == 1
+
+
+def test_outbox_is_drained_inline_without_worker(app, client, make_user, auth_headers):
+    with app.app_context():
+        author = make_user("s1", Role.student.value)
+        other = make_user("s2", Role.student.value)
+        author_id = author.id
+        author_headers = auth_headers(author)
+        other_headers = auth_headers(other)
+
+    resp = client.post(
+        "/api/forum/topics",
+        json={"title": "求组队", "content": "找队友"},
+        headers=author_headers,
+    )
+    topic_id = resp.get_json()["id"]
+    client.post(f"/api/forum/topics/{topic_id}/replies", json={"content": "我来"}, headers=other_headers)
+    with app.app_context():
+        assert Notification.query.filter_by(user_id=author_id, notif_type="forum_reply").count() == 1
+        assert NotificationOutbox.query.filter_by(status=OutboxStatus.done.value).count() == 1
+
+
+def test_each_cooperation_transition_is_notified_and_duplicate_keys_keep_the_transaction(
+    app, client, make_user, auth_headers
+):
+    from app.models import CooperationRequest
+    from app.outbox import enqueue_notification
+
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        teacher_id, student_id = teacher.id, student.id
+        teacher_headers = auth_headers(teacher)
+        student_headers = auth_headers(student)
+
+    req_id = client.post(
+        "/api/cooperation/request",
+        json={"teacher_user_id": teacher_id, "student_user_id": student_id},
+        headers=teacher_headers,
+    ).get_json()["id"]
+    # 回到曾经出现过的状态组合也是一次新的变更，每次都要通知
+    for action in ("accept", "reject", "accept", "reject"):
+        resp = client.post(
+            f"/api/cooperation/requests/{req_id}/respond", json={"action": action}, headers=student_headers
+        )
+        assert resp.status_code == 200
+    with app.app_context():
+        def count(notif_type):
+            return Notification.query.filter_by(user_id=teacher_id, notif_type=notif_type).count()
+
+        assert count("cooperation_respond") == 4
+        assert count("cooperation_confirmed") == 2
+
+        # 重复的 idempotency_key 只跳过这条事件，调用方事务中的其他修改照常提交
+        req = db.session.get(CooperationRequest, req_id)
+        req.custom_status = "进行中"
+        assert enqueue_notification(teacher_id, "system", "一次", {}, idempotency_key="dup") is not None
+        assert enqueue_notification(teacher_id, "system", "一次", {}, idempotency_key="dup") is None
+        db.session.commit()
+        assert db.session.get(CooperationRequest, req_id).custom_status == "进行中"
+        assert NotificationOutbox.query.filter_by(idempotency_key="dup").count() == 1
+
+
+def test_notification_stream_pushes_new_notifications(app, client, make_user, auth_headers):
+    import threading
+    import time
+
+    from app.services import push_notification
+
+    app.config["NOTIFICATION_STREAM_MAX_SECONDS"] = 2
+    app.config["REALTIME_POLL_INTERVAL"] = 10
+    with app.app_context():
+        user = make_user("s1", Role.student.value)
+        user_id = user.id
+        push_notification(user_id, "system", "旧通知", {})
+        headers = auth_headers(user)
+
+    def publish_later():
+        time.sleep(0.5)
+        with app.app_context():
+            push_notification(user_id, "system", "新通知", {"summary": "hi"})
+
+    stream_token = client.post("/api/notifications/stream-token", headers=headers).get_json()["token"]
+    threading.Thread(target=publish_later).start()
+    started = time.monotonic()
+    resp = client.get("/api/notifications/stream", query_string={"token": stream_token})
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    body = resp.get_data(as_text=True)
+    assert time.monotonic() - started < 5
+    assert 'event: unread\ndata: {"count": 1}' in body
+    assert "新通知" in body
+    assert "旧通知" not in body
+    assert 'data: {"count": 2}' in body
+
+    # 断线重连时从 Last-Event-ID 之后补发
+    app.config["NOTIFICATION_STREAM_MAX_SECONDS"] = 0
+    body = client.get(
+        "/api/notifications/stream", headers={**headers, "Last-Event-ID": "0"}
+    ).get_data(as_text=True)
+    assert "旧通知" in body and "新通知" in body
+
+    assert client.get("/api/notifications/stream").status_code == 401
+    # 普通访问令牌不能放在 URL 中，专用令牌也不能用于其他接口
+    access_token = headers["Authorization"].split()[1]
+    assert client.get("/api/notifications/stream", query_string={"token": access_token}).status_code == 401
+    stream_headers = {"Authorization": f"Bearer {stream_token}"}
+    assert client.get("/api/notifications/unread-count", headers=stream_headers).status_code == 401
+
+
+def test_notification_feed_is_keyset_paged_and_old_read_rows_are_archived(app, client, make_user, auth_headers):
+    from datetime import timedelta
+
+    from app.models import NotificationArchive
+    from app.retention import archive_notifications
+
+    now = now_utc()
+    with app.app_context():
+        user = make_user("s1", Role.student.value)
+        other = make_user("s2", Role.student.value)
+        user_id, other_id = user.id, other.id
+        headers = auth_headers(user)
+        for i in range(25):
+            db.session.add(
+                Notification(
+                    user_id=user_id if i % 5 else other_id,
+                    notif_type="system",
+                    title=f"n{i}",
+                    payload_json="{}",
+                    is_read=i < 12,
+                    created_at=now - timedelta(days=200 - i),
+                )
+            )
+        db.session.commit()
+
+    def titles(params):
+        data = client.get("/api/notifications", query_string=params, headers=headers).get_json()
+        return [n["title"] for n in data["items"]], data["has_more"], [n["id"] for n in data["items"]]
+
+    mine = [f"n{i}" for i in range(24, -1, -1) if i % 5]
+    page, has_more, ids = titles({"limit": 8})
+    assert page == mine[:8] and has_more is True
+    page, has_more, older_ids = titles({"limit": 8, "before_id": ids[-1]})
+    assert page == mine[8:16] and has_more is True
+    page, has_more, _ = titles({"limit": 8, "before_id": older_ids[-1]})
+    assert page == mine[16:] and has_more is False
+    page, has_more, _ = titles({"limit": 3, "after_id": older_ids[0]})
+    assert page == mine[5:8] and has_more is True
+    resp = client.get("/api/notifications", query_string={"before_id": "x"}, headers=headers)
+    assert resp.status_code == 400
+    assert titles({"limit": "abc"})[0] == mine
+
+    with app.app_context():
+        # 另一个进程已经归档过的行不会造成主键冲突
+        n0 = Notification.query.filter_by(title="n0").one()
+        db.session.add(
+            NotificationArchive(
+                **{c: getattr(n0, c) for c in ("id", "user_id", "notif_type", "title", "payload_json", "is_read")},
+                created_at=n0.created_at,
+                archived_at=now,
+            )
+        )
+        db.session.commit()
+        # 保留 185 天：n0..n14 超期，其中已读的 n0..n11 归档，未读的 n12..n14 保留
+        assert archive_notifications(retention_days=185, batch_size=5) == 12
+        assert archive_notifications(retention_days=185, batch_size=5) == 0
+        assert {a.title for a in NotificationArchive.query.all()} == {f"n{i}" for i in range(12)}
+        assert Notification.query.count() == 13
+        assert Notification.query.filter(Notification.is_read == True).count() == 0
+        assert archive_notifications(retention_days=0) == 0
+    page, _, _ = titles({"limit": 100})
+    assert page == [t for t in mine if int(t[1:]) >= 12]
+
+
+def test_high_frequency_notifications_are_coalesced_while_unread(app, client, make_user, auth_headers):
+    from app.services import push_notification, push_notifications_bulk
+
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        teacher_id, student_id = teacher.id, student.id
+        headers = auth_headers(teacher)
+        student_headers = auth_headers(student)
+
+    pair = {"teacher_user_id": teacher_id, "student_user_id": student_id}
+    for text in ("一", "二", "三"):
+        client.post("/api/messages/send", json={**pair, "content": text}, headers=student_headers)
+
+    items = client.get("/api/notifications", headers=headers).get_json()["items"]
+    assert len(items) == 1
+    assert items[0]["notif_type"] == "message_new"
+    assert items[0]["count"] == 3
+    assert items[0]["payload"]["summary"].endswith("三")
+    assert client.get("/api/notifications/unread-count", headers=headers).get_json()["count"] == 1
+
+    # 已读之后的新事件另起一条
+    client.post(f"/api/notifications/{items[0]['id']}/read", headers=headers)
+    client.post("/api/messages/send", json={**pair, "content": "四"}, headers=student_headers)
+    items = client.get("/api/notifications", headers=headers).get_json()["items"]
+    assert [(n["count"], n["is_read"]) for n in items] == [(1, False), (3, True)]
+
+    with app.app_context():
+        push_notifications_bulk(
+            [
+                (teacher_id, "forum_reply", "话题有新的回复", {"topic_id": 1, "summary": "a"}),
+                (teacher_id, "forum_reply", "话题有新的回复", {"topic_id": 1, "summary": "b"}),
+                (teacher_id, "forum_reply", "话题有新的回复", {"topic_id": 2, "summary": "c"}),
+                (teacher_id, "system", "不合并", {}),
+                (teacher_id, "system", "不合并", {}),
+            ]
+        )
+        push_notification(teacher_id, "forum_reply", "话题有新的回复", {"topic_id": 1, "summary": "d"})
+        rows = Notification.query.filter_by(user_id=teacher_id, is_read=False).order_by(Notification.id).all()
+        assert [(n.notif_type, n.group_key, n.event_count) for n in rows] == [
+            ("message_new", rows[0].group_key, 1),
+            ("forum_reply", "forum_reply:2", 1),
+            ("system", None, 1),
+            ("system", None, 1),
+            ("forum_reply", "forum_reply:1", 3),
+        ]
+    assert client.get("/api/notifications/unread-count", headers=headers).get_json()["count"] == 5
@@ -121,3 +121,121 @@ def test_basic_student_teacher_post_and_apply_flow():
     resp = client.get("/api/cooperation/projects", headers=auth_headers(student_token))
     assert resp.status_code == 200
     assert len(resp.get_json()["items"]) == 1
+
+
+def test_confirmed_count_is_maintained_with_request_status():
+    from app.models import TeacherPost
+    from app.services import rebuild_confirmed_counts
+
+    app = setup_app()
+    client = app.test_client()
+
+    tokens = {}
+    ids = {}
+    for username, role in [("t1", Role.teacher.value), ("s1", Role.student.value), ("s2", Role.student.value)]:
+        resp = client.post(
+            "/api/auth/register",
+            json={"username": username, "password": "123456", "role": role, "display_name": username},
+        )
+        ids[username] = resp.get_json()["id"]
+        resp = client.post("/api/auth/login", json={"username": username, "password": "123456", "role": role})
+        tokens[username] = resp.get_json()["access_token"]
+
+    resp = client.post(
+        "/api/teacher-posts",
+        json={"title": "容量测试", "content": "内容", "recruit_count": 1},
+        headers=auth_headers(tokens["t1"]),
+    )
+    post_id = resp.get_json()["id"]
+
+    def confirmed_count():
+        with app.app_context():
+            return db.session.get(TeacherPost, post_id).confirmed_count
+
+    req_ids = {}
+    for s in ("s1", "s2"):
+        resp = client.post(
+            "/api/cooperation/request",
+            json={"post_id": post_id, "student_user_id": ids[s]},
+            headers=auth_headers(tokens[s]),
+        )
+        req_ids[s] = resp.get_json()["id"]
+
+    resp = client.post(
+        "/api/cooperation/requests/%d/respond" % req_ids["s1"],
+        json={"action": "accept"},
+        headers=auth_headers(tokens["t1"]),
+    )
+    assert resp.get_json()["final_status"] == "confirmed"
+    assert confirmed_count() == 1
+
+    resp = client.post(
+        "/api/cooperation/requests/%d/respond" % req_ids["s2"],
+        json={"action": "accept"},
+        headers=auth_headers(tokens["t1"]),
+    )
+    assert resp.status_code == 400
+
+    resp = client.delete("/api/cooperation/requests/%d" % req_ids["s1"], headers=auth_headers(tokens["s1"]))
+    assert resp.status_code == 200
+    assert confirmed_count() == 0
+
+    with app.app_context():
+        db.session.get(TeacherPost, post_id).confirmed_count = 5
+        db.session.commit()
+        assert rebuild_confirmed_counts() == 1
+    assert confirmed_count() == 0
+
+
+def test_project_start_and_status_notifications_are_batched():
+    from app.models import Notification
+
+    app = setup_app()
+    client = app.test_client()
+
+    tokens = {}
+    ids = {}
+    for username, role in [("t1", Role.teacher.value), ("s1", Role.student.value), ("s2", Role.student.value)]:
+        resp = client.post(
+            "/api/auth/register",
+            json={"username": username, "password": "123456", "role": role, "display_name": username},
+        )
+        ids[username] = resp.get_json()["id"]
+        resp = client.post("/api/auth/login", json={"username": username, "password": "123456", "role": role})
+        tokens[username] = resp.get_json()["access_token"]
+
+    resp = client.post(
+        "/api/teacher-posts",
+        json={"title": "满员测试", "content": "内容", "recruit_count": 1},
+        headers=auth_headers(tokens["t1"]),
+    )
+    post_id = resp.get_json()["id"]
+    req_ids = {}
+    for s in ("s1", "s2"):
+        resp = client.post(
+            "/api/cooperation/request",
+            json={"post_id": post_id, "student_user_id": ids[s]},
+            headers=auth_headers(tokens[s]),
+        )
+        req_ids[s] = resp.get_json()["id"]
+    client.post(
+        "/api/cooperation/requests/%d/respond" % req_ids["s1"],
+        json={"action": "accept"},
+        headers=auth_headers(tokens["t1"]),
+    )
+
+    def notif_types(username):
+        with app.app_context():
+            return {n.notif_type for n in Notification.query.filter_by(user_id=ids[username]).all()}
+
+    assert "project_started" in notif_types("t1")
+    assert "project_started" in notif_types("s1")
+    assert "project_full" in notif_types("s2")
+
+    client.put(
+        "/api/teacher-posts/%d" % post_id,
+        json={"project_status": "completed"},
+        headers=auth_headers(tokens["t1"]),
+    )
+    assert "project_update" in notif_types("s1")
+    assert "project_update" in notif_types("s2")
@@ -0,0 +1,322 @@
+from app.extensions import db
+from app.models import CooperationRequest, CooperationStatus, ReviewStatus, Role, TeacherPost, Visibility
+from app.services import sync_entity_tags
+from app.utils import json_dumps, now_utc
+
+
+def make_post(teacher_id: int, title: str, **kwargs) -> TeacherPost:
+    p = TeacherPost(
+        teacher_user_id=teacher_id,
+        post_type=kwargs.pop("post_type", "project"),
+        title=title,
+        content=kwargs.pop("content", "内容"),
+        tags_json=json_dumps(kwargs.pop("tags", [])),
+        tech_stack_json=json_dumps(kwargs.pop("tech_stack", [])),
+        review_status=kwargs.pop("review_status", ReviewStatus.approved.value),
+        visibility=kwargs.pop("visibility", Visibility.public.value),
+        created_at=now_utc(),
+        updated_at=now_utc(),
+        **kwargs,
+    )
+    db.session.add(p)
+    db.session.flush()
+    sync_entity_tags("teacher_post", p)
+    db.session.commit()
+    return p
+
+
+def test_teacher_posts_filters_and_paginates_in_sql(app, client, make_user, auth_headers):
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        for i in range(5):
+            make_post(teacher.id, f"公开项目{i}", tags=["网络安全"], tech_stack=["Python"])
+        make_post(teacher.id, "待审核", tags=["网络安全"], review_status=ReviewStatus.pending.value)
+        make_post(teacher.id, "仅教师", tags=["网络安全"], visibility=Visibility.teacher_only.value)
+        make_post(teacher.id, "相似标签", tags=["网络安全实验"])
+        student_headers = auth_headers(student)
+        teacher_headers = auth_headers(teacher)
+
+    resp = client.get(
+        "/api/teacher-posts",
+        query_string={"tag": "网络安全", "page": 1, "page_size": 2},
+        headers=student_headers,
+    )
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["total"] == 5
+    assert len(data["items"]) == 2
+
+    resp = client.get(
+        "/api/teacher-posts",
+        query_string={"tag": "网络安全", "page": 3, "page_size": 2},
+        headers=student_headers,
+    )
+    assert [i["title"] for i in resp.get_json()["items"]] == ["公开项目0"]
+
+    resp = client.get("/api/teacher-posts", query_string={"tag": "网络安全"}, headers=teacher_headers)
+    titles = {i["title"] for i in resp.get_json()["items"]}
+    assert "仅教师" in titles
+    assert "待审核" not in titles
+    assert "相似标签" not in titles
+
+    resp = client.get("/api/teacher-posts", query_string={"tech": "Python"})
+    assert resp.get_json()["total"] == 5
+
+
+def test_teacher_cards_are_batched_per_page(app, client, make_user):
+    with app.app_context():
+        t1 = make_user("t1", Role.teacher.value)
+        t2 = make_user("t2", Role.teacher.value)
+        students = [make_user(f"s{i}", Role.student.value) for i in range(5)]
+        posts = [make_post(t1.id, f"项目{i}") for i in range(4)]
+        make_post(t2.id, "另一个项目")
+        for i, st in enumerate(students):
+            db.session.add(
+                CooperationRequest(
+                    teacher_user_id=t1.id,
+                    student_user_id=st.id,
+                    post_id=posts[i % 4].id,
+                    initiated_by=Role.student.value,
+                    final_status=CooperationStatus.rejected.value if i == 4 else CooperationStatus.confirmed.value,
+                    created_at=now_utc(),
+                )
+            )
+        db.session.commit()
+        t1_id, t2_id = t1.id, t2.id
+
+    items = client.get("/api/teacher-posts").get_json()["items"]
+    cards = {i["teacher"]["id"]: i["teacher"] for i in items}
+    card = cards[t1_id]
+    assert card["stats"]["published_posts"] == 4
+    assert card["stats"]["confirmed_projects"] == 4
+    assert card["stats"]["success_rate"] == 0.8
+    assert len(card["recent_achievements"]) == 3
+    assert cards[t2_id]["stats"] == {"published_posts": 1, "confirmed_projects": 0, "success_rate": None}
+    assert cards[t2_id]["recent_achievements"] == []
+
+
+def test_tag_filters_use_entity_tag_index(app, client, make_user, auth_headers):
+    with app.app_context():
+        user = make_user("s1", Role.student.value)
+        headers = auth_headers(user)
+
+    resp = client.post(
+        "/api/forum/topics",
+        json={"title": "组队", "content": "找队友", "tags": ["Vue"]},
+        headers=headers,
+    )
+    topic_id = resp.get_json()["id"]
+    client.post(
+        "/api/forum/topics",
+        json={"title": "前端", "content": "讨论", "tags": ["Vue3"]},
+        headers=headers,
+    )
+
+    items = client.get("/api/forum/topics", query_string={"tag": "vue"}).get_json()["items"]
+    assert [i["id"] for i in items] == [topic_id]
+
+    client.put(f"/api/forum/topics/{topic_id}", json={"tags": ["React"]}, headers=headers)
+    assert client.get("/api/forum/topics", query_string={"tag": "Vue"}).get_json()["total"] == 0
+    assert client.get("/api/forum/topics", query_string={"tag": "React"}).get_json()["total"] == 1
+
+    resp = client.post(
+        "/api/teamup",
+        json={"title": "竞赛组队", "content": "缺后端", "tags": ["ACM"], "needed_roles": ["后端开发"]},
+        headers=headers,
+    )
+    teamup_id = resp.get_json()["id"]
+    assert client.get("/api/teamup", query_string={"tag": "acm"}).get_json()["total"] == 1
+
+    client.delete(f"/api/teamup/{teamup_id}", headers=headers)
+    with app.app_context():
+        from app.models import EntityTag
+
+        assert EntityTag.query.filter_by(entity_type="teamup_post", entity_id=teamup_id).count() == 0
+
+
+def test_keyword_search_uses_fulltext_index(app, client, make_user, auth_headers):
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        student = make_user("s1", Role.student.value)
+        teacher_headers = auth_headers(teacher)
+        student_headers = auth_headers(student)
+
+    resp = client.post(
+        "/api/teacher-posts",
+        json={"post_type": "project", "title": "校园网络流量分析", "content": "基于深度学习的入侵检测", "tags": ["网络安全"]},
+        headers=teacher_headers,
+    )
+    post_id = resp.get_json()["id"]
+    with app.app_context():
+        TeacherPost.query.get(post_id).review_status = ReviewStatus.approved.value
+        db.session.commit()
+    client.post(
+        "/api/forum/topics",
+        json={"title": "入侵检测数据集推荐", "content": "求推荐公开的流量数据集"},
+        headers=student_headers,
+    )
+    client.put(
+        "/api/student-profile",
+        json={"major": "网络工程", "direction": "入侵检测", "skills": [{"name": "Python", "level": "熟练"}]},
+        headers=student_headers,
+    )
+
+    items = client.get("/api/teacher-posts", query_string={"keyword": "入侵检测"}).get_json()["items"]
+    assert [i["id"] for i in items] == [post_id]
+    assert client.get("/api/teacher-posts", query_string={"keyword": "网络"}).get_json()["total"] == 1
+    assert client.get("/api/forum/topics", query_string={"keyword": "数据集"}).get_json()["total"] == 1
+    students = client.get("/api/students", query_string={"keyword": "python"}).get_json()["items"]
+    assert len(students) == 1
+
+    data = client.get("/api/search", query_string={"q": "入侵检测"}).get_json()
+    assert data["total"] == 3
+    assert {i["type"] for i in data["items"]} == {"teacher_post", "forum_topic", "student"}
+    data = client.get("/api/search", query_string={"q": "入侵检测", "page": "x", "page_size": "abc"}).get_json()
+    assert (data["total"], data["page"], data["page_size"], len(data["items"])) == (3, 1, 20, 3)
+    data = client.get("/api/search", query_string={"q": "入侵检测", "types": "forum_topic"}).get_json()
+    assert [i["type"] for i in data["items"]] == ["forum_topic"]
+
+    client.put(f"/api/teacher-posts/{post_id}", json={"title": "无线传感网定位"}, headers=teacher_headers)
+    assert client.get("/api/teacher-posts", query_string={"keyword": "流量分析"}).get_json()["total"] == 0
+    assert client.get("/api/teacher-posts", query_string={"keyword": "传感网"}).get_json()["total"] == 1
+
+
+def test_student_directory_filters_and_paginates_in_sql(app, client, make_user, auth_headers):
+    from app.models import File, StudentProfile
+
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        teacher_headers = auth_headers(teacher)
+        resume = File(
+            owner_user_id=teacher.id, original_name="cv.pdf", storage_name="cv.pdf", size_bytes=3, created_at=now_utc()
+        )
+        db.session.add(resume)
+        db.session.flush()
+        ids = []
+        for i in range(6):
+            s = make_user(f"s{i}", Role.student.value)
+            ids.append(s.id)
+            if i == 5:
+                continue  # 未填写画像
+            p = StudentProfile(
+                user_id=s.id,
+                major="网络工程" if i % 2 == 0 else "软件工程",
+                grade="2022" if i < 3 else "2023",
+                direction="安全" if i < 2 else "AI",
+                skills_json=json_dumps([{"name": "Python" if i < 4 else "Go", "level": "熟练"}]),
+                visibility=Visibility.teacher_only.value if i == 4 else Visibility.public.value,
+                resume_file_id=resume.id if i == 0 else None,
+                updated_at=now_utc(),
+            )
+            db.session.add(p)
+            db.session.flush()
+            sync_entity_tags("student_profile", p)
+        db.session.commit()
+
+    def student_ids(params, headers=None):
+        data = client.get("/api/students", query_string=params, headers=headers or {}).get_json()
+        return [i["user"]["id"] for i in data["items"]], data["total"]
+
+    # 匿名访问看不到 teacher_only 的画像
+    assert student_ids({}) == ([ids[0], ids[1], ids[2], ids[3], ids[5]], 5)
+    assert student_ids({}, teacher_headers) == (ids, 6)
+    assert student_ids({"page_size": 4, "page": 2}, teacher_headers) == (ids[4:], 6)
+    assert student_ids({"page_size": "x", "page": "abc"}, teacher_headers) == (ids, 6)
+    assert student_ids({"major": "网络"}, teacher_headers) == ([ids[0], ids[2], ids[4]], 3)
+    assert student_ids({"grade": "2023"}, teacher_headers) == ([ids[3], ids[4]], 2)
+    assert student_ids({"direction": "安全"}, teacher_headers) == ([ids[0], ids[1], ids[5]], 3)
+    assert student_ids({"skill": "go"}, teacher_headers) == ([ids[4]], 1)
+    first = client.get("/api/students", headers=teacher_headers).get_json()["items"][0]
+    assert first["resume_file"]["original_name"] == "cv.pdf"
+
+
+def test_student_skill_score_is_persisted_and_sortable(app, client, make_user, auth_headers):
+    from app.models import StudentProfile
+    from app.services import rebuild_skill_scores
+
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        students = [make_user(f"s{i}", Role.student.value) for i in range(3)]
+        teacher_headers = auth_headers(teacher)
+        student_headers = [auth_headers(s) for s in students]
+        ids = [s.id for s in students]
+
+    # s0：无画像；s1：两项熟练技能 + 两段经历 + 每周 20 小时 + 一个链接；s2：一项了解
+    client.put(
+        "/api/student-profile",
+        json={
+            "skills": [{"name": "Python", "level": "熟练"}, {"name": "Go", "level": "精通"}],
+            "experiences": [{"title": "a"}, {"title": "b"}],
+            "weekly_hours": 20,
+            "project_links": ["https://example.com"],
+        },
+        headers=student_headers[1],
+    )
+    client.put(
+        "/api/student-profile",
+        json={"skills": [{"name": "C", "level": "了解"}]},
+        headers=student_headers[2],
+    )
+    with app.app_context():
+        p = StudentProfile.query.get(ids[1])
+        assert (p.skill_score, p.skill_score_level) == (56, "C")
+        assert StudentProfile.query.get(ids[2]).skill_score == 22
+
+    headers = teacher_headers
+    data = client.get("/api/students", query_string={"sort": "score"}, headers=headers).get_json()
+    assert [(i["user"]["id"], i["skill_score"]) for i in data["items"]] == [(ids[1], 56), (ids[2], 22), (ids[0], 20)]
+    data = client.get("/api/students", query_string={"min_score": 21}, headers=headers).get_json()
+    assert [i["user"]["id"] for i in data["items"]] == [ids[1], ids[2]]
+    summary = client.get(f"/api/students/{ids[1]}/summary", headers=headers).get_json()
+    assert summary["skill_score"] == 56
+
+    with app.app_context():
+        StudentProfile.query.update({"skill_score": 20, "skill_score_level": "D"})
+        db.session.commit()
+        assert rebuild_skill_scores(batch_size=1) == 2
+        assert rebuild_skill_scores() == 0
+        assert StudentProfile.query.get(ids[1]).skill_score_level == "C"
+
+
+def test_student_directory_orders_by_match_in_sql(app, client, make_user, auth_headers):
+    from app.models import StudentProfile
+
+    with app.app_context():
+        teacher = make_user("t1", Role.teacher.value)
+        teacher_headers = auth_headers(teacher)
+        ai = make_post(teacher.id, "AI", tags=["AI"], tech_stack=["Python"]).id
+        net = make_post(teacher.id, "网络", tags=["网络"], tech_stack=["Go"]).id
+        ids = []
+        for i, skills in enumerate([["C"], ["Go"], ["Python", "AI"], ["Python"], ["网络", "Go"]]):
+            s = make_user(f"s{i}", Role.student.value)
+            ids.append(s.id)
+            p = StudentProfile(
+                user_id=s.id,
+                skills_json=json_dumps([{"name": n, "level": "熟练"} for n in skills]),
+                updated_at=now_utc(),
+            )
+            db.session.add(p)
+            db.session.flush()
+            sync_entity_tags("student_profile", p)
+        db.session.commit()
+
+    def ranked(params):
+        items = []
+        for page in (1, 2, 3):
+            data = client.get(
+                "/api/students", query_string={**params, "page": page, "page_size": 2}, headers=teacher_headers
+            ).get_json()
+            items += [(i["user"]["id"], i["match_score"]) for i in data["items"]]
+        return items
+
+    # 指定项目：按与该项目的匹配度排序，翻页后顺序保持
+    assert ranked({"sort": "match", "match_post_id": ai}) == [
+        (ids[2], 1.0), (ids[3], 0.5), (ids[0], 0.0), (ids[1], 0.0), (ids[4], 0.0)
+    ]
+    assert [i for i, _ in ranked({"sort": "match", "match_post_id": net})][:2] == [ids[4], ids[1]]
+    # 不指定项目：与 /match/top 的通用推荐一致
+    top = client.get("/api/match/top", query_string={"limit": 5}, headers=teacher_headers).get_json()["items"]
+    general = ranked({"sort": "match"})
+    assert {i: s for i, s in general if s > 0} == {r["user_id"]: r["score"] for r in top}
+    assert [s for _, s in general] == sorted((s for _, s in general), reverse=True)
@@ -1,5 +1,6 @@
 from app import create_app
+from app.workers import start_background_workers
 
 
 app = create_app()
-
+start_background_workers(app)
@@ -37,6 +37,11 @@ export const useAuthStore = defineStore("auth", {
       localStorage.setItem("user", JSON.stringify(user));
       return user;
     },
+    setToken(token: string) {
+      this.token = token;
+      axios.defaults.headers.common["Authorization"] = "Bearer " + token;
+      localStorage.setItem("token", token);
+    },
     logout() {
       this.token = null;
       this.user = null;